@@ -24,7 +24,9 @@
       appShell.classList.remove('hidden'); 
       renderAll(); 
       navTo('dashboard'); 
+      connectLiveEvents();
     } else { 
+      disconnectLiveEvents();
       appShell.classList.add('hidden'); 
       loginView.classList.remove('hidden'); 
     }
@@ -88,17 +90,19 @@
   // ---------- Dashboard ----------
   async function drawDashboard(){
   try {
-    // ---------- Top stats ----------
-    const res = await fetch('/api/admin/dashboard');
-    const stats = await res.json();
-    qs('#stat-products').textContent = stats.total_products;
-    qs('#stat-orders').textContent = stats.total_orders;
-    qs('#stat-revenue').textContent = formatINR(stats.total_revenue);
-
-    // ---------- Performance Metrics ----------
-    const resMetrics = await fetch('/api/admin/metrics');
-    const metrics = await resMetrics.json();
-    qs('#stat-conversion').textContent = metrics.conversion_rate + '%';
+    // ---------- Top stats & Performance Metrics (single snapshot) ----------
+    const res = await fetch('/api/admin/dashboard/snapshot');
+    const snapshotData = await res.json();
+    const stats = snapshotData.snapshot || {};
+    liveStats = {
+      products: Number(stats.total_products || 0),
+      orders: Number(stats.total_orders || 0),
+      revenue: Number(stats.total_revenue || 0),
+      orders_today: Number(stats.orders_today || 0),
+      revenue_today: Number(stats.revenue_today || 0)
+    };
+    renderLiveStats();
+    qs('#stat-conversion').textContent = (stats.conversion_rate || 0) + '%';
 
     // ---------- Monthly Sales ----------
     const resSales = await fetch('/api/admin/dashboard/monthly-sales');
@@ -110,18 +114,8 @@
     const bestSellers = await resBest.json();
     renderBestSellers(bestSellers);
 
-    // ---------- Order Statistics ----------
-    const resOrderStats = await fetch('/api/admin/orders/statistics');
-    const orderStats = await resOrderStats.json();
-    if (orderStats.success) {
-      qs('#stat-orders-today').textContent = orderStats.statistics.orders_today || 0;
-      qs('#stat-revenue-today').textContent = formatINR(orderStats.statistics.revenue_today || 0);
-    }
-
     // ---------- Customer & Seller Counts ----------
-    const resCustomers = await fetch('/api/admin/customers');
-    const customers = await resCustomers.json();
-    qs('#stat-total-customers').textContent = customers.length || 0;
+    qs('#stat-total-customers').textContent = stats.total_customers || 0;
 
     const resSellers = await fetch('/api/admin/sellers');
     const sellers = await resSellers.json();
@@ -166,7 +160,8 @@
     const resLowStockAlerts = await fetch('/api/admin/inventory/low-stock?threshold=10');
     const lowStockAlertsData = await resLowStockAlerts.json();
     if (lowStockAlertsData.success && lowStockAlertsData.products) {
-      renderLowStockAlerts(lowStockAlertsData.products);
+      lowStockProducts = lowStockAlertsData.products;
+      renderLowStockAlerts(lowStockProducts);
     }
   } catch(err){
     console.error('Dashboard fetch error', err);
@@ -472,6 +467,80 @@
   }
 
 
+  // ---------- Live Events (SSE) ----------
+  // The server pushes KPI deltas, low-stock alerts and notifications, so open
+  // tabs stay current without re-fetching the dashboard lists.
+  let liveStats = null;
+  let lowStockProducts = [];
+  let liveSource = null;
+  let unreadLive = 0;
+
+  function renderLiveStats(){
+    if (!liveStats) return;
+    qs('#stat-products').textContent = liveStats.products;
+    qs('#stat-orders').textContent = liveStats.orders;
+    qs('#stat-revenue').textContent = formatINR(liveStats.revenue);
+    qs('#stat-orders-today').textContent = liveStats.orders_today;
+    qs('#stat-revenue-today').textContent = formatINR(liveStats.revenue_today);
+  }
+
+  function connectLiveEvents(){
+    if (liveSource || !window.EventSource) return;
+    // EventSource reconnects by itself and resumes with Last-Event-ID
+    liveSource = new EventSource('/api/admin/events');
+
+    liveSource.addEventListener('kpi', (e) => {
+      if (!liveStats) return;
+      const delta = JSON.parse(e.data);
+      Object.keys(delta).forEach(key => {
+        if (key in liveStats) liveStats[key] += Number(delta[key]);
+      });
+      renderLiveStats();
+    });
+
+    liveSource.addEventListener('stock_level', (e) => {
+      const level = JSON.parse(e.data);
+      const existing = lowStockProducts.find(p => p.product_id === level.product_id);
+      if (!level.low_stock) {
+        // Restocked above the threshold or deleted: no longer a low-stock product
+        if (!existing) return;
+        lowStockProducts = lowStockProducts.filter(p => p.product_id !== level.product_id);
+      } else if (existing) {
+        existing.quantityavailable = level.quantityavailable;
+      } else {
+        lowStockProducts.push({ ...level, name: level.name || `Product #${level.product_id}` });
+      }
+      lowStockProducts.sort((a, b) => (a.quantityavailable || 0) - (b.quantityavailable || 0));
+      renderLowStockAlerts(lowStockProducts);
+    });
+
+    liveSource.addEventListener('notification', (e) => {
+      const notification = JSON.parse(e.data);
+      const badge = qs('#live-notifications');
+      if (!badge) return;
+      unreadLive += 1;
+      badge.textContent = `🔔 ${unreadLive}`;
+      badge.title = notification.message || '';
+      badge.classList.remove('hidden');
+    });
+
+    // Sent when this tab fell too far behind to replay what it missed
+    liveSource.addEventListener('resync', () => {
+      if (!qs('#view-dashboard').classList.contains('hidden')) drawDashboard();
+    });
+  }
+
+  function disconnectLiveEvents(){
+    if (liveSource) { liveSource.close(); liveSource = null; }
+    unreadLive = 0;
+    qs('#live-notifications')?.classList.add('hidden');
+  }
+
+  qs('#live-notifications')?.addEventListener('click', () => {
+    unreadLive = 0;
+    qs('#live-notifications').classList.add('hidden');
+  });
+
   // ---------- Inventory Alerts ----------
   async function loadInventoryAlerts(){
     try {
@@ -747,28 +816,58 @@
   const tplOrder = qs('#tpl-order-row');
   const orderFilter = qs('#order-filter-status');
 
+  const ordersLoadMore = qs('#orders-load-more');
+  const ordersPage = { cursor: null, loading: false, generation: 0, controller: null };
+
   orderFilter.addEventListener('change', renderOrders);
+  ordersLoadMore.addEventListener('click', loadMoreOrders);
 
   async function renderOrders(){
+    // A filter change supersedes any page still loading for the old filter
+    ordersPage.generation++;
+    if (ordersPage.controller) ordersPage.controller.abort();
+    ordersPage.loading = false;
+    ordersTbody.innerHTML='';
+    ordersPage.cursor = null;
+    await loadMoreOrders();
+  }
+
+  async function loadMoreOrders(){
+    if (ordersPage.loading) return;
+    const generation = ordersPage.generation;
+    const controller = new AbortController();
+    ordersPage.loading = true;
+    ordersPage.controller = controller;
     try {
-      const res = await fetch('/api/admin/orders');
-      const orders = await res.json();
-      ordersTbody.innerHTML='';
+      const params = new URLSearchParams({limit: 50});
       const status = orderFilter.value;
-      orders.filter(o=>status==='all'||o.status===status)
-        .sort((a,b)=>b.order_id-a.order_id)
-        .forEach(o=>{
-          const tr = tplOrder.content.firstElementChild.cloneNode(true);
-          tr.querySelector('.id').textContent = '#'+o.order_id;
-          tr.querySelector('.date').textContent = o.date;
-          tr.querySelector('.customer').textContent = o.customer_name || '-';
-          tr.querySelector('.amount').textContent = formatINR(o.total_amount);
-          const statusEl = tr.querySelector('.status');
-          statusEl.innerHTML = `<span class="status-${(o.status || '').toLowerCase()}">${o.status || 'N/A'}</span>`;
-          tr.querySelector('[data-action="view"]').addEventListener('click',()=>openOrderModal(o));
-          ordersTbody.appendChild(tr);
-        });
-    } catch(err){ console.error('Orders fetch error', err); }
+      if (status !== 'all') params.set('status', status);
+      if (ordersPage.cursor) params.set('cursor', ordersPage.cursor);
+      const res = await fetch(`/api/admin/orders/feed?${params}`, { signal: controller.signal });
+      const page = await res.json();
+      if (generation !== ordersPage.generation || !page.success) return;
+      page.orders.forEach(o=>{
+        const tr = tplOrder.content.firstElementChild.cloneNode(true);
+        tr.querySelector('.id').textContent = '#'+o.order_id;
+        tr.querySelector('.date').textContent = o.date;
+        tr.querySelector('.customer').textContent = o.customer_name || '-';
+        tr.querySelector('.amount').textContent = formatINR(o.total_amount);
+        const statusEl = tr.querySelector('.status');
+        statusEl.innerHTML = `<span class="status-${(o.status || '').toLowerCase()}">${o.status || 'N/A'}</span>`;
+        tr.querySelector('[data-action="view"]').addEventListener('click',()=>openOrderModal(o));
+        ordersTbody.appendChild(tr);
+      });
+      ordersPage.cursor = page.next_cursor;
+      ordersLoadMore.classList.toggle('hidden', !page.has_more);
+    } catch(err){
+      if (err.name !== 'AbortError') console.error('Orders fetch error', err);
+    }
+    finally {
+      if (generation === ordersPage.generation) {
+        ordersPage.loading = false;
+        ordersPage.controller = null;
+      }
+    }
   }
 
   function openOrderModal(o){
@@ -1329,14 +1428,32 @@
     } catch(err){ console.error('Returns error', err); }
   }
   
+  const billsTbody = qs('#bills-tbody');
+  const billsLoadMore = qs('#bills-load-more');
+  const billsPage = { cursor: null, loading: false, generation: 0 };
+
+  billsLoadMore.addEventListener('click', loadMoreBills);
+
   async function renderBills(){
+    billsPage.generation++;
+    billsPage.loading = false;
+    billsTbody.innerHTML = '';
+    billsPage.cursor = null;
+    await loadMoreBills();
+  }
+
+  async function loadMoreBills(){
+    if (billsPage.loading) return;
+    const generation = billsPage.generation;
+    billsPage.loading = true;
     try {
-      const res = await fetch('/api/admin/orders');
-      const orders = await res.json();
-      const billsTbody = qs('#bills-tbody');
-      billsTbody.innerHTML = '';
+      const params = new URLSearchParams({limit: 50});
+      if (billsPage.cursor) params.set('cursor', billsPage.cursor);
+      const res = await fetch(`/api/admin/orders/feed?${params}`);
+      const page = await res.json();
+      if (generation !== billsPage.generation || !page.success) return;
       
-      orders.forEach(order => {
+      page.orders.forEach(order => {
         const tr = document.createElement('tr');
         tr.innerHTML = `
           <td>#${order.order_id}</td>
@@ -1349,7 +1466,12 @@
         `;
         billsTbody.appendChild(tr);
       });
+      billsPage.cursor = page.next_cursor;
+      billsLoadMore.classList.toggle('hidden', !page.has_more);
     } catch(err){ console.error('Bills error', err); }
+    finally {
+      if (generation === billsPage.generation) billsPage.loading = false;
+    }
   }
   
   async function runReport(){
@@ -1924,21 +2046,30 @@
     if (!status) return;
     
     try {
-      const res = await fetch('/api/admin/orders');
-      const orders = await res.json();
-      const orderIds = orders.map(o => o.order_id);
-      
-      const response = await fetch('/api/admin/bulk/orders/update-status', {
-        method: 'POST',
-        headers: {'Content-Type': 'application/json'},
-        body: JSON.stringify({order_ids: orderIds, status})
-      });
+      // Walk the order ids a page at a time and update each page as one batch
+      let cursor = null;
+      let updated = 0;
+      do {
+        const params = new URLSearchParams();
+        if (cursor) params.set('cursor', cursor);
+        const res = await fetch(`/api/admin/orders/ids?${params}`);
+        const page = await res.json();
+        if (!page.success) throw new Error(page.error);
+        if (!page.order_ids.length) break;
+        
+        const response = await fetch('/api/admin/bulk/orders/update-status', {
+          method: 'POST',
+          headers: {'Content-Type': 'application/json'},
+          body: JSON.stringify({order_ids: page.order_ids, status})
+        });
+        const result = await response.json();
+        if (!result.success) throw new Error(result.error);
+        updated += result.updated_count;
+        cursor = page.next_cursor;
+      } while (cursor);
       
-      const result = await response.json();
-      if (result.success) {
-        alert(`Updated ${result.updated_count} orders to ${status}!`);
-        renderOrders();
-      }
+      alert(`Updated ${updated} orders to ${status}!`);
+      renderOrders();
     } catch(err) { console.error('Bulk update orders error', err); }
   };
 
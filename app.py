@@ -1,9 +1,31 @@
-from flask import Flask, render_template, request, jsonify, send_file
+from flask import Flask, render_template, request, jsonify, send_file, g, has_request_context, Response
 import mysql.connector
 from mysql.connector import Error, pooling
+from mysql.connector.errors import PoolError, InterfaceError, OperationalError
 import time
-from datetime import datetime, timedelta
-from io import BytesIO
+import threading
+import json
+import base64
+import csv
+import codecs
+import uuid
+import zlib
+import functools
+import atexit
+import glob
+from concurrent.futures import ThreadPoolExecutor, wait
+import os
+import random
+import re
+from collections import OrderedDict, defaultdict, deque
+from contextlib import contextmanager
+from datetime import datetime, date, timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory file locks
+    fcntl = None
 
 app = Flask(__name__)
 
@@ -16,8 +38,12 @@ DB_CONFIG = {
     'autocommit': False,  # We'll commit explicitly like the working code
     'connect_timeout': 10,
     'pool_name': 'mypool',
-    'pool_size': 10,
-    'pool_reset_session': True,
+    'pool_size': 20,                # maximum open connections
+    'pool_min_size': 2,             # kept open (and pre-opened) even when idle
+    'pool_checkout_timeout': 5.0,   # seconds a caller may queue for a connection
+    'pool_idle_timeout': 300,       # idle connections above the minimum are closed after this
+    'pool_validate_after': 30,      # ping connections that sat idle longer than this before reuse
+    'pool_reset_session': True,     # COM_RESET_CONNECTION when a connection is returned
     'charset': 'utf8mb4',
     'collation': 'utf8mb4_unicode_ci'
 }
@@ -25,115 +51,2027 @@ DB_CONFIG = {
 # Connection pool
 pool = None
 
+class PoolTimeout(PoolError):
+    """No connection became available before the checkout deadline"""
+
+class PooledConnection:
+    """Connection handed out by ElasticConnectionPool; close() returns it to the pool
+
+    verified is True when checkout itself reached the server (a new
+    connection or a validation ping), False for an idle one reused as-is.
+    """
+
+    def __init__(self, pool, cnx, verified=False):
+        object.__setattr__(self, '_pool', pool)
+        object.__setattr__(self, '_cnx', cnx)
+        object.__setattr__(self, 'verified', verified)
+
+    def _connection(self):
+        cnx = self._cnx
+        if cnx is None:
+            raise PoolError('Connection has already been returned to the pool')
+        return cnx
+
+    def __getattr__(self, name):
+        return getattr(self._connection(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._connection(), name, value)
+
+    def close(self):
+        cnx = self._cnx
+        if cnx is not None:
+            object.__setattr__(self, '_cnx', None)
+            self._pool._release(cnx)
+
+class _PoolWaiter:
+    __slots__ = ('event', 'cnx', 'may_create')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.cnx = None
+        self.may_create = False
+
+class ElasticConnectionPool:
+    """Blocking, elastic MySQL connection pool.
+
+    Callers queue FIFO for up to checkout_timeout seconds when every
+    connection is busy. The pool opens connections on demand up to max_size,
+    closes idle ones above min_size after idle_timeout, pings connections
+    that sat idle longer than validate_after before handing them out, and
+    optionally resets the session when a connection is returned.
+    """
+
+    def __init__(self, config):
+        self.name = config.get('pool_name', 'pool')
+        self.max_size = int(config.get('pool_size', 10))
+        self.min_size = min(int(config.get('pool_min_size', 0)), self.max_size)
+        self.checkout_timeout = float(config.get('pool_checkout_timeout', 5.0))
+        self.idle_timeout = float(config.get('pool_idle_timeout', 300))
+        self.validate_after = float(config.get('pool_validate_after', 30))
+        self.reset_session = bool(config.get('pool_reset_session', True))
+        self.session_variables = dict(config.get('pool_session_variables') or {})
+        self._connect_args = {k: v for k, v in config.items() if not k.startswith('pool_')}
+        
+        self._lock = threading.Lock()
+        self._idle = deque()      # (connection, returned_at); reused LIFO so cold ones age out
+        self._waiters = deque()   # FIFO of _PoolWaiter
+        self._open = 0            # idle + checked out + being opened
+        self._closed = False
+        self._counters = defaultdict(int)
+        
+        for _ in range(self.min_size):
+            cnx = self._connect()
+            with self._lock:
+                self._open += 1
+                self._idle.append((cnx, time.monotonic()))
+        
+        self._reaper = threading.Thread(target=self._reap_loop, name=f'{self.name}-reaper', daemon=True)
+        self._reaper.start()
+
+    @property
+    def pool_size(self):
+        return self.max_size
+
+    def _connect(self):
+        cnx = mysql.connector.connect(**self._connect_args)
+        if self.session_variables:
+            cursor = cnx.cursor()
+            for name, value in self.session_variables.items():
+                cursor.execute(f"SET @{name} = %s", (value,))
+            cursor.close()
+        self._counters['created'] += 1
+        return cnx
+
+    def _free_slot_locked(self):
+        """Give up one open slot; the first waiter (if any) may open a new connection in it"""
+        self._open -= 1
+        if self._waiters and self._open < self.max_size:
+            waiter = self._waiters.popleft()
+            self._open += 1
+            waiter.may_create = True
+            waiter.event.set()
+
+    def _discard(self, cnx):
+        """Close a connection and give its slot to a waiter, if any"""
+        try:
+            cnx.close()
+        except Exception:
+            pass
+        with self._lock:
+            self._counters['closed'] += 1
+            self._free_slot_locked()
+
+    def _validate(self, cnx):
+        """Liveness check for a connection that sat idle longer than validate_after"""
+        self._counters['validations'] += 1
+        try:
+            cnx.ping(reconnect=False)
+            return True
+        except Exception:
+            self._counters['validation_failures'] += 1
+            return False
+
+    def get_connection(self, timeout=None):
+        timeout = self.checkout_timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        queued = False
+        while True:
+            entry = None
+            create = False
+            waiter = None
+            with self._lock:
+                if self._closed:
+                    raise PoolError(f'Pool {self.name} is closed')
+                if self._idle and not self._waiters:
+                    entry = self._idle.pop()
+                elif self._open < self.max_size and not self._waiters:
+                    self._open += 1
+                    create = True
+                else:
+                    waiter = _PoolWaiter()
+                    self._waiters.append(waiter)
+                    if not queued:
+                        queued = True
+                        self._counters['waits'] += 1
+            
+            if waiter is not None:
+                waiter.event.wait(max(deadline - time.monotonic(), 0))
+                with self._lock:
+                    if waiter.cnx is None and not waiter.may_create:
+                        try:
+                            self._waiters.remove(waiter)
+                        except ValueError:
+                            pass
+                        self._counters['timeouts'] += 1
+                        raise PoolTimeout(f'Timed out after {timeout:.1f}s waiting for a connection '
+                                          f'from pool {self.name} ({self._open}/{self.max_size} open)')
+                if waiter.cnx is not None:
+                    entry = waiter.cnx
+                else:
+                    create = True
+            
+            if create:
+                try:
+                    cnx = self._connect()
+                except Exception:
+                    with self._lock:
+                        self._free_slot_locked()
+                    raise
+                self._counters['checkouts'] += 1
+                return PooledConnection(self, cnx, verified=True)
+            
+            cnx, idle_since = entry
+            # Cheap: only ping connections that sat idle for a while
+            pinged = time.monotonic() - idle_since >= self.validate_after
+            if not pinged or self._validate(cnx):
+                self._counters['checkouts'] += 1
+                return PooledConnection(self, cnx, verified=pinged)
+            # Stale: drop it and try again within the same deadline
+            self._discard(cnx)
+            if time.monotonic() >= deadline:
+                self._counters['timeouts'] += 1
+                raise PoolTimeout(f'Timed out replacing a stale connection from pool {self.name}')
+
+    def _release(self, cnx):
+        try:
+            if cnx.in_transaction:
+                cnx.rollback()
+            if self.reset_session:
+                # Clears user variables too, so put the configured ones back
+                cnx.reset_session(user_variables=self.session_variables or None)
+        except Exception:
+            self._counters['reset_failures'] += 1
+            self._discard(cnx)
+            return
+        with self._lock:
+            self._counters['returns'] += 1
+            if self._waiters:
+                # Hand over directly so queued callers are served in arrival order
+                waiter = self._waiters.popleft()
+                waiter.cnx = (cnx, time.monotonic())
+                waiter.event.set()
+            else:
+                self._idle.append((cnx, time.monotonic()))
+
+    def _reap_loop(self):
+        while not self._closed:
+            time.sleep(min(max(self.idle_timeout / 4, 1), 30))
+            self.reap_idle()
+
+    def reap_idle(self):
+        """Close connections idle longer than idle_timeout, keeping min_size open"""
+        expired = []
+        now = time.monotonic()
+        with self._lock:
+            keep = deque()
+            # Oldest returns sit at the left end of the idle deque
+            while self._idle:
+                cnx, idle_since = self._idle.popleft()
+                if now - idle_since > self.idle_timeout and self._open - len(expired) > self.min_size:
+                    expired.append(cnx)
+                else:
+                    keep.append((cnx, idle_since))
+            self._idle = keep
+        for cnx in expired:
+            self._counters['reaped'] += 1
+            self._discard(cnx)
+        return len(expired)
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            idle = [cnx for cnx, _ in self._idle]
+            self._idle.clear()
+        for cnx in idle:
+            self._discard(cnx)
+
+    def stats(self):
+        with self._lock:
+            idle = len(self._idle)
+            open_count = self._open
+            waiting = len(self._waiters)
+        data = {
+            'name': self.name,
+            'min_size': self.min_size,
+            'max_size': self.max_size,
+            'open': open_count,
+            'idle': idle,
+            'in_use': open_count - idle,
+            'waiting': waiting,
+            'checkout_timeout': self.checkout_timeout,
+            'idle_timeout': self.idle_timeout,
+            'reset_session': self.reset_session,
+        }
+        for key in ('created', 'closed', 'checkouts', 'returns', 'waits', 'timeouts', 'validations',
+                    'validation_failures', 'reaped', 'reset_failures'):
+            data[key] = self._counters[key]
+        return data
+
 def init_pool():
     """Initialize connection pool"""
     global pool
     try:
-        pool = mysql.connector.pooling.MySQLConnectionPool(**DB_CONFIG)
+        pool = ElasticConnectionPool(DB_CONFIG)
         print("✅ Connection pool initialized")
     except Error as e:
         print(f"❌ Failed to initialize connection pool: {e}")
         raise
 
+# ---------- Retry Policy & Circuit Breaker ----------
+CONNECTION_LOST_ERRNOS = {2002, 2003, 2006, 2013, 2055}  # can't connect / server gone away / lost connection
+TRANSIENT_TX_ERRNOS = {1205, 1213}                       # lock wait timeout / deadlock
+RETRY_ATTEMPTS = 3
+RETRY_BASE_DELAY = 0.05   # seconds; doubles per attempt
+RETRY_MAX_DELAY = 1.0
+BREAKER_FAILURE_THRESHOLD = 5   # consecutive connection failures before failing fast
+BREAKER_RESET_TIMEOUT = 10.0    # seconds before a single probe is let through
+
+class DatabaseUnavailable(Error):
+    """Raised without contacting MySQL while the circuit breaker is open"""
+
+class CommitOutcomeUnknown(Error):
+    """The connection was lost after COMMIT was sent, so the transaction may
+    have committed. Never retried: re-running it could apply it twice."""
+
+def is_connection_error(e):
+    if isinstance(e, (PoolTimeout, DatabaseUnavailable, CommitOutcomeUnknown)) or not isinstance(e, Error):
+        return False
+    if e.errno in CONNECTION_LOST_ERRNOS:
+        return True
+    # e.g. "MySQL Connection not available." carries no server errno
+    return isinstance(e, (InterfaceError, OperationalError)) and e.errno in (None, -1)
+
+def is_transient_error(e):
+    """Errors worth retrying: lost connections, deadlocks and lock wait timeouts"""
+    return is_connection_error(e) or (isinstance(e, Error) and e.errno in TRANSIENT_TX_ERRNOS)
+
+def commit_outcome_unknown(e):
+    """Wrap a connection error raised once COMMIT was sent"""
+    return CommitOutcomeUnknown(msg=f'Connection lost while committing; the transaction may have been applied: {e}')
+
+def commit_transaction(conn):
+    """COMMIT, turning a lost connection into CommitOutcomeUnknown.
+
+    A lost connection before COMMIT means the server rolled back, so the
+    caller can re-run the whole transaction; during COMMIT it cannot tell.
+    """
+    try:
+        conn.commit()
+    except Error as e:
+        if is_connection_error(e):
+            raise commit_outcome_unknown(e) from e
+        raise
+
+def backoff_delay(attempt):
+    """Exponential backoff with jitter (half to full of the capped delay)"""
+    delay = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * (2 ** attempt))
+    return random.uniform(delay / 2, delay)
+
+class CircuitBreaker:
+    """Fail fast while MySQL is unreachable.
+
+    Opens after failure_threshold consecutive connection failures; after
+    reset_timeout one probe call is allowed through (half-open) and its
+    outcome closes or re-opens the circuit.
+    """
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = None
+        self.trips = 0
+        self.rejected = 0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        with self._lock:
+            if self.state == 'open' and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = 'half_open'
+            if self.state == 'half_open' and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return
+            if self.state != 'closed':
+                self.rejected += 1
+                raise DatabaseUnavailable(msg='Database unavailable (circuit breaker open)')
+
+    def record_success(self):
+        if self.state == 'closed' and not self.failures:
+            return  # nothing to reset; skip the lock on the hot path
+        with self._lock:
+            self.failures = 0
+            self.state = 'closed'
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probe_in_flight = False
+            if self.state == 'half_open' or (self.state == 'closed' and self.failures >= self.failure_threshold):
+                self.state = 'open'
+                self.opened_at = time.monotonic()
+                self.trips += 1
+
+    def release_probe(self):
+        """The probe ended without telling us whether MySQL is reachable"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    @property
+    def is_open(self):
+        return self.state == 'open'
+
+    def stats(self):
+        with self._lock:
+            return {'state': self.state, 'consecutive_failures': self.failures,
+                    'trips': self.trips, 'rejected': self.rejected}
+
+db_breaker = CircuitBreaker(BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_TIMEOUT)
+
 def get_db_connection():
-    """Get database connection from pool with retry logic"""
-    max_retries = 3
-    retry_delay = 1
-    
-    for attempt in range(max_retries):
+    """Get database connection from pool with retry logic
+
+    A busy pool queues the caller up to its checkout timeout; only failures
+    to reach the server are retried (with backoff), and while the circuit
+    breaker is open callers fail immediately. Only a checkout that actually
+    reached the server counts as a breaker success; an idle connection
+    reused without a ping proves nothing (queries record their own outcome).
+    """
+    for attempt in range(RETRY_ATTEMPTS):
+        db_breaker.before_call()
+        settled = False
         try:
             if pool is None:
                 init_pool()
-            conn = pool.get_connection()
+            started = time.perf_counter()
+            try:
+                conn = pool.get_connection()
+            finally:
+                POOL_WAIT_SECONDS.observe(time.perf_counter() - started)
+            if not conn.verified and db_breaker.state != 'closed':
+                # The half-open probe needs a real round trip to decide the circuit
+                try:
+                    conn.ping(reconnect=False)
+                except Error:
+                    conn.close()
+                    raise
+                object.__setattr__(conn, 'verified', True)
+            if conn.verified:
+                db_breaker.record_success()
+            settled = True
             return conn
         except Error as e:
+            if not is_connection_error(e):
+                raise
+            db_breaker.record_failure()
+            settled = True
             print(f"❌ Database connection failed (attempt {attempt + 1}): {e}")
-            if attempt < max_retries - 1:
-                time.sleep(retry_delay)
-                retry_delay *= 2
+            if attempt < RETRY_ATTEMPTS - 1 and not db_breaker.is_open:
+                DB_RETRIES.inc(('connect',))
+                time.sleep(backoff_delay(attempt))
             else:
                 raise e
+        finally:
+            if not settled:
+                # Any other outcome (non-connection error, non-Error exception) frees the probe slot
+                db_breaker.release_probe()
+
+def run_with_retry(fn, *args, **kwargs):
+    """Call fn, re-running it on transient errors; fn must own its whole transaction
+    and COMMIT through commit_transaction(), so a connection lost during COMMIT
+    surfaces as CommitOutcomeUnknown instead of being re-run"""
+    for attempt in range(RETRY_ATTEMPTS):
+        try:
+            return fn(*args, **kwargs)
+        except Error as e:
+            if not is_transient_error(e) or attempt == RETRY_ATTEMPTS - 1:
+                raise
+            DB_RETRIES.inc(('transaction',))
+            print(f"🔁 Retrying {getattr(fn, '__name__', 'transaction')} after transient error: {e}")
+            time.sleep(backoff_delay(attempt))
+
+# ---------- Read Replicas ----------
+# CARTIQUE_REPLICAS="host[:port],host[:port]" adds read replicas that share
+# DB_CONFIG's credentials and database. GET requests send plain SELECTs to a
+# replica whose lag is within REPLICA_MAX_LAG_SECONDS; writes, transactions,
+# locking reads and sessions that wrote recently stay on the primary.
+REPLICA_MAX_LAG_SECONDS = float(os.environ.get('CARTIQUE_REPLICA_MAX_LAG', 5))
+REPLICA_LAG_CHECK_INTERVAL = 2.0
+REPLICA_POOL_SIZE = 10
+READ_YOUR_WRITES_SECONDS = 10      # how long a session stays pinned to the primary after writing
+PRIMARY_PIN_COOKIE = 'cartique_primary_until'
+READ_ONLY_STATEMENTS = ('SELECT', 'WITH')
+LOCKING_READ_MARKERS = ('FOR UPDATE', 'FOR SHARE', 'LOCK IN SHARE MODE')
+
+def parse_replica_configs(spec):
+    """Build one connection config per replica from 'host[:port],...'"""
+    configs = []
+    for index, entry in enumerate(part.strip() for part in (spec or '').split(',')):
+        if not entry:
+            continue
+        host, _, port = entry.partition(':')
+        config = dict(DB_CONFIG, host=host, pool_name=f'replica{index + 1}',
+                      pool_size=REPLICA_POOL_SIZE, pool_min_size=0)
+        if port:
+            config['port'] = int(port)
+        configs.append(config)
+    return configs
+
+class ReplicaSet:
+    """Read replicas with a background replication-lag monitor"""
+
+    def __init__(self, configs):
+        self.replicas = []
+        for config in configs:
+            self.replicas.append({
+                'name': f"{config['host']}:{config.get('port', 3306)}",
+                'config': config,
+                'pool': None,
+                'lag': None,
+                'healthy': False,
+                'reason': 'not checked yet',
+                'checked_at': None,
+            })
+        self._next = 0
+        self._lock = threading.Lock()
+        self._monitor = None
+
+    def __bool__(self):
+        return bool(self.replicas)
+
+    def start(self):
+        if self.replicas and self._monitor is None:
+            self._monitor = threading.Thread(target=self._monitor_loop, name='replica-lag-monitor', daemon=True)
+            self._monitor.start()
+
+    def _pool(self, replica):
+        pool = replica['pool']
+        if pool is None:
+            # Under the lock so concurrent first uses don't each build a pool (and a reaper thread)
+            with self._lock:
+                if replica['pool'] is None:
+                    replica['pool'] = ElasticConnectionPool(replica['config'])
+                pool = replica['pool']
+        return pool
+
+    def check_lag(self, replica):
+        """Read Seconds_Behind_Source; a stopped or unconfigured replica is unhealthy"""
+        conn = None
+        try:
+            conn = self._pool(replica).get_connection(timeout=1.0)
+            cursor = conn.cursor(dictionary=True, buffered=True)
+            try:
+                cursor.execute("SHOW REPLICA STATUS")
+            except Error:
+                cursor.execute("SHOW SLAVE STATUS")  # MySQL < 8.0.22
+            status = cursor.fetchone()
+            cursor.close()
+            if not status:
+                healthy, lag, reason = False, None, 'replication not configured'
+            else:
+                lag = status.get('Seconds_Behind_Source', status.get('Seconds_Behind_Master'))
+                io_running = status.get('Replica_IO_Running', status.get('Slave_IO_Running'))
+                sql_running = status.get('Replica_SQL_Running', status.get('Slave_SQL_Running'))
+                if io_running != 'Yes' or sql_running != 'Yes' or lag is None:
+                    healthy, reason = False, 'replication stopped'
+                elif lag > REPLICA_MAX_LAG_SECONDS:
+                    healthy, reason = False, f'lagging {lag}s'
+                else:
+                    healthy, reason = True, None
+        except Exception as e:
+            healthy, lag, reason = False, None, f'unreachable: {e}'
+        finally:
+            if conn is not None:
+                conn.close()
+        replica.update(healthy=healthy, lag=lag, reason=reason, checked_at=datetime.now())
+        return healthy
+
+    def _monitor_loop(self):
+        while True:
+            for replica in self.replicas:
+                self.check_lag(replica)
+            time.sleep(REPLICA_LAG_CHECK_INTERVAL)
+
+    def pick(self):
+        """Round-robin over healthy replicas, or None to use the primary"""
+        with self._lock:
+            for _ in range(len(self.replicas)):
+                replica = self.replicas[self._next % len(self.replicas)]
+                self._next += 1
+                if replica['healthy']:
+                    return replica
+        return None
+
+    def get_connection(self, replica):
+        return self._pool(replica).get_connection(timeout=1.0)
+
+    def mark_unhealthy(self, replica, reason):
+        replica.update(healthy=False, reason=reason)
+
+    def stats(self):
+        return [{
+            'name': replica['name'],
+            'healthy': replica['healthy'],
+            'lag_seconds': replica['lag'],
+            'reason': replica['reason'],
+            'checked_at': replica['checked_at'].isoformat(timespec='seconds') if replica['checked_at'] else None,
+            'pool': replica['pool'].stats() if replica['pool'] is not None else None,
+        } for replica in self.replicas]
+
+replicas = ReplicaSet(parse_replica_configs(os.environ.get('CARTIQUE_REPLICAS')))
+
+def is_replica_safe_read(query):
+    statement = query.lstrip().split(None, 1)[0].upper() if query.strip() else ''
+    if statement not in READ_ONLY_STATEMENTS:
+        return False
+    upper = query.upper()
+    return not any(marker in upper for marker in LOCKING_READ_MARKERS)
+
+def choose_read_replica(query):
+    """Replica for this read, or None when it must (or should) hit the primary"""
+    if not replicas or not has_request_context():
+        return None
+    if g.get('db_tx') is not None or g.get('db_wrote') or g.get('pin_primary') or g.get('cache_fill'):
+        return None
+    if request.method not in ('GET', 'HEAD') or not is_replica_safe_read(query):
+        return None
+    if g.get('db_replica_conn') is not None:
+        return g.db_replica
+    return replicas.pick()
+
+def get_replica_request_connection(replica):
+    """The request's replica connection (one replica per request, for a consistent view)"""
+    conn = g.get('db_replica_conn')
+    if conn is None:
+        conn = replicas.get_connection(replica)
+        g.db_replica_conn = conn
+        g.db_replica = replica
+    return conn
+
+def discard_replica_connection():
+    conn = g.pop('db_replica_conn', None)
+    g.pop('db_replica', None)
+    if conn is not None:
+        try:
+            conn.close()
+        except:
+            pass
+
+@app.before_request
+def load_primary_pin():
+    """Sessions that wrote recently read from the primary (read-your-writes)"""
+    try:
+        g.pin_primary = float(request.cookies.get(PRIMARY_PIN_COOKIE, 0)) > time.time()
+    except ValueError:
+        g.pin_primary = False
+
+@app.after_request
+def set_primary_pin(response):
+    if replicas and (request.method not in ('GET', 'HEAD', 'OPTIONS') or g.get('db_wrote')):
+        response.set_cookie(PRIMARY_PIN_COOKIE, str(time.time() + READ_YOUR_WRITES_SECONDS),
+                            max_age=READ_YOUR_WRITES_SECONDS, httponly=True, samesite='Lax')
+    return response
+
+# ---------- Request-Scoped Connection ----------
+def get_request_connection():
+    """Get the connection bound to the current request, checking one out of the pool on first use"""
+    conn = g.get('db_conn')
+    if conn is None:
+        conn = get_db_connection()
+        g.db_conn = conn
+        g.db_tx = None
+    return conn
+
+def discard_request_connection():
+    """Return the request connection to the pool without committing anything"""
+    conn = g.pop('db_conn', None)
+    g.db_tx = None
+    if conn is None:
+        return
+    try:
+        if conn.in_transaction:
+            conn.rollback()
+    except:
+        pass
+    if g.pop('audit_outbox', False):
+        # Never hand a session that suppresses trigger audit rows to the next borrower
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SET @audit_outbox = NULL")
+            cursor.close()
+        except:
+            pass
+    try:
+        conn.close()
+    except:
+        pass
+
+@app.teardown_appcontext
+def release_request_connection(exc):
+    """Release the request connection once the handler has finished"""
+    discard_request_connection()
+    discard_replica_connection()
+
+@contextmanager
+def transaction(readonly=False):
+    """Run every query in the block as one transaction on the request connection.
+
+    Read-write blocks commit once when the block exits and roll back if it
+    raises. Nested blocks join the outermost transaction.
+    """
+    current = g.get('db_tx')
+    if current is not None:
+        if current == 'ro' and not readonly:
+            raise RuntimeError('Cannot start a read-write block inside a read-only transaction')
+        yield get_request_connection()
+        return
+
+    conn = get_request_connection()
+    if conn.in_transaction:
+        # Close the implicit snapshot left by earlier reads in this request
+        conn.commit()
+    conn.start_transaction(readonly=readonly)
+    g.db_tx = 'ro' if readonly else 'rw'
+    try:
+        yield conn
+        commit_transaction(conn)
+    except Exception:
+        try:
+            conn.rollback()
+        except:
+            pass
+        raise
+    finally:
+        g.db_tx = None
+
+def retry_transaction(fn, *args, readonly=False, **kwargs):
+    """Run fn inside transaction() and re-run the whole transaction on
+    deadlock, lock wait timeout or a connection lost before COMMIT was sent,
+    so everything fn wrote was rolled back before the retry. A connection
+    lost during COMMIT raises CommitOutcomeUnknown and is not retried."""
+    if g.get('db_tx') is not None:
+        raise RuntimeError('retry_transaction cannot be nested inside another transaction')
+
+    def attempt():
+        try:
+            with transaction(readonly=readonly):
+                return fn(*args, **kwargs)
+        except Error as e:
+            if is_connection_error(e) or isinstance(e, CommitOutcomeUnknown):
+                discard_request_connection()
+            raise
+    attempt.__name__ = getattr(fn, '__name__', 'transaction')
+    return run_with_retry(attempt)
+
+def _close_cursor_quietly(cursor, query, fetch):
+    """Drain and close a cursor after a failed query"""
+    if not cursor:
+        return
+    try:
+        # Only try to fetch if it's a SELECT query and we haven't fetched yet
+        if fetch and query.strip().upper().startswith('SELECT'):
+            try:
+                cursor.fetchall()
+            except:
+                pass
+        cursor.close()
+    except:
+        pass
 
 def execute_query(query, params=None, fetch=False):
-    """Execute database query with automatic reconnection - using explicit commits like working code"""
-    conn = None
-    cursor = None
-    
-    for attempt in range(3):
+    """Execute database query with automatic reconnection - using explicit commits like working code
+
+    Inside a request every call reuses the request connection; inside a
+    transaction() block writes are committed when the block exits.
+    """
+    in_request = has_request_context()
+
+    replica = choose_read_replica(query) if fetch else None
+    for attempt in range(RETRY_ATTEMPTS):
+        conn = None
+        cursor = None
+        in_tx = in_request and g.get('db_tx') is not None
         try:
-            conn = get_db_connection()
+            if replica is not None:
+                conn = get_replica_request_connection(replica)
+            else:
+                conn = get_request_connection() if in_request else get_db_connection()
             cursor = conn.cursor(dictionary=True, buffered=True)
             
+            if explain_capture['enabled']:
+                capture_explain(conn, query, params)
+            
+            started = time.perf_counter()
             if params:
                 cursor.execute(query, params)
             else:
                 cursor.execute(query)
+            if replica is None:
+                db_breaker.record_success()
             
             if fetch:
                 result = cursor.fetchall()
-                cursor.close()
-                conn.close()
-                return result
+                record_query_timing(query, time.perf_counter() - started, len(result))
+                DB_READS.inc((replica['name'] if replica is not None else 'primary',))
             else:
-                # For INSERT/UPDATE/DELETE - EXPLICIT COMMIT like working code
-                conn.commit()  # This is critical - explicit commit like db.py
-                cursor.close()
+                record_query_timing(query, time.perf_counter() - started)
+                if in_request:
+                    g.db_wrote = True
+                # For INSERT/UPDATE/DELETE - EXPLICIT COMMIT like working code,
+                # unless an enclosing transaction() block owns the commit
+                if not in_tx:
+                    commit_transaction(conn)
+                result = True
+            cursor.close()
+            if not in_request:
                 conn.close()
-                return True
+            return result
                 
-        except Error as e:
-            print(f"❌ Query failed (attempt {attempt + 1}): {e}")
+        except Exception as e:
+            is_db_error = isinstance(e, Error)
+            label = "Query failed" if is_db_error else "Unexpected error"
+            print(f"❌ {label} (attempt {attempt + 1}): {e}")
             print(f"   Query: {query[:100]}...")  # Print first 100 chars of query for debugging
-            if conn:
+            DB_QUERY_ERRORS.inc((query_series(query),))
+            _close_cursor_quietly(cursor, query, fetch)
+            if replica is not None:
+                # Fall back to the primary for the retry (and the rest of the request)
+                if is_connection_error(e) or isinstance(e, PoolTimeout):
+                    replicas.mark_unhealthy(replica, f'query failed: {e}')
+                discard_replica_connection()
+                g.pin_primary = True
+                replica = None
+                if attempt < RETRY_ATTEMPTS - 1 and (is_transient_error(e) or isinstance(e, PoolTimeout)):
+                    DB_RETRIES.inc(('replica',))
+                    continue
+                raise e
+            if is_connection_error(e) or isinstance(e, CommitOutcomeUnknown):
+                db_breaker.record_failure()
+            if in_tx:
+                # Retrying a single statement would split the transaction;
+                # the enclosing block rolls back (see retry_transaction)
+                raise e
+            if in_request:
+                discard_request_connection()
+            elif conn:
                 try:
                     conn.rollback()  # Rollback on error
                 except:
                     pass
-            if cursor:
-                try:
-                    # Only try to fetch if it's a SELECT query and we haven't fetched yet
-                    if fetch and query.strip().upper().startswith('SELECT'):
-                        try:
-                            cursor.fetchall()
-                        except:
-                            pass
-                    cursor.close()
-                except:
-                    pass
-            if conn:
                 try:
                     conn.close()
                 except:
                     pass
-            if attempt < 2:
-                time.sleep(1)
+            # Syntax errors, constraint violations etc. fail immediately
+            if is_transient_error(e) and attempt < RETRY_ATTEMPTS - 1 and not db_breaker.is_open:
+                DB_RETRIES.inc(('query',))
+                time.sleep(backoff_delay(attempt))
             else:
                 raise e
-        except Exception as e:
-            print(f"❌ Unexpected error (attempt {attempt + 1}): {e}")
-            print(f"   Query: {query[:100]}...")  # Print first 100 chars of query for debugging
-            if conn:
-                try:
-                    conn.rollback()  # Rollback on error
-                except:
-                    pass
-            if cursor:
+
+def call_procedure(name, args=(), self_committing=False):
+    """Call a stored procedure and return its first result set as dicts
+
+    Uses callproc so every result set and the trailing status packet are
+    consumed, leaving the (request) connection clean for the next query.
+    Writes are committed unless an enclosing transaction() owns the commit.
+    Pass self_committing=True for procedures that COMMIT themselves: a
+    connection lost once the CALL is sent then raises CommitOutcomeUnknown.
+    """
+    in_request = has_request_context()
+    in_tx = in_request and g.get('db_tx') is not None
+    conn = get_request_connection() if in_request else get_db_connection()
+    cursor = None
+    try:
+        cursor = conn.cursor(buffered=True)
+        started = time.perf_counter()
+        try:
+            cursor.callproc(name, tuple(args))
+        except Error as e:
+            if self_committing and is_connection_error(e):
+                raise commit_outcome_unknown(e) from e
+            raise
+        record_query_timing(f'CALL {name}', time.perf_counter() - started)
+        rows = []
+        for result in cursor.stored_results():
+            columns = result.column_names
+            fetched = result.fetchall()
+            if not rows and columns:
+                rows = [dict(zip(columns, row)) for row in fetched]
+        if not in_tx:
+            commit_transaction(conn)
+        cursor.close()
+        if not in_request:
+            conn.close()
+        return rows
+    except Exception as e:
+        print(f"❌ Procedure {name} failed: {e}")
+        _close_cursor_quietly(cursor, '', False)
+        if in_tx:
+            raise
+        if in_request:
+            discard_request_connection()
+        else:
+            try:
+                conn.rollback()
+                conn.close()
+            except:
+                pass
+        raise
+
+# ---------- Concurrent Query Fan-out ----------
+FANOUT_WORKERS = 8            # shared across requests; keeps fan-out well inside the pool
+FANOUT_DEADLINE_MS = 5000     # default shared deadline for one fetch_parallel call
+
+fanout_executor = ThreadPoolExecutor(max_workers=FANOUT_WORKERS, thread_name_prefix='query-fanout')
+
+class QueryDeadlineExceeded(TimeoutError):
+    """fetch_parallel's shared deadline passed before every query finished"""
+
+def with_execution_limit(query, budget_ms):
+    """Add a MAX_EXECUTION_TIME hint to a SELECT so the server stops it too"""
+    stripped = query.lstrip()
+    if not stripped[:6].upper() == 'SELECT' or 'MAX_EXECUTION_TIME' in stripped.upper():
+        return query
+    return f"SELECT /*+ MAX_EXECUTION_TIME({int(budget_ms)}) */{stripped[6:]}"
+
+def fetch_on_own_connection(query, params=None, replica=None):
+    """Run one read on a connection of its own (primary pool or the given replica)"""
+    conn = replicas.get_connection(replica) if replica is not None else get_db_connection()
+    cursor = None
+    try:
+        cursor = conn.cursor(dictionary=True, buffered=True)
+        started = time.perf_counter()
+        if params:
+            cursor.execute(query, params)
+        else:
+            cursor.execute(query)
+        rows = cursor.fetchall()
+        record_query_timing(query, time.perf_counter() - started, len(rows))
+        DB_READS.inc((replica['name'] if replica is not None else 'primary',))
+        conn.commit()  # end the read snapshot before the connection goes back to the pool
+        return rows
+    finally:
+        _close_cursor_quietly(cursor, query, False)
+        try:
+            conn.close()
+        except:
+            pass
+
+def _fetch_fanout_query(query, params, replica):
+    """One fan-out worker: replica read with fallback to the primary, transient errors retried"""
+    if replica is not None:
+        try:
+            return fetch_on_own_connection(query, params, replica)
+        except Error as e:
+            if is_connection_error(e) or isinstance(e, PoolTimeout):
+                replicas.mark_unhealthy(replica, f'query failed: {e}')
+            DB_RETRIES.inc(('replica',))
+    return run_with_retry(fetch_on_own_connection, query, params)
+
+def fetch_parallel(queries, deadline_ms=FANOUT_DEADLINE_MS):
+    """Run independent reads concurrently and gather them under one deadline.
+
+    queries maps a name to either (sql, params) or a zero-argument callable
+    (e.g. a cached loader). Each runs on its own pooled connection, so the
+    caller waits for the slowest query instead of the sum. Returns
+    {name: result}; the first failure is re-raised, and QueryDeadlineExceeded
+    is raised if anything is still running at the deadline. Inside a
+    transaction() block the queries run serially on the request connection
+    to keep its snapshot.
+    """
+    if has_request_context() and g.get('db_tx') is not None:
+        return {name: (item() if callable(item) else execute_query(item[0], item[1], fetch=True))
+                for name, item in queries.items()}
+    
+    futures = {}
+    for name, item in queries.items():
+        if callable(item):
+            futures[fanout_executor.submit(item)] = name
+        else:
+            sql, params = item
+            # Routing needs the request context, so decide it here rather than in the worker
+            replica = choose_read_replica(sql)
+            sql = with_execution_limit(sql, deadline_ms)
+            futures[fanout_executor.submit(_fetch_fanout_query, sql, params, replica)] = name
+    
+    done, pending = wait(futures, timeout=deadline_ms / 1000.0)
+    for future in pending:
+        future.cancel()
+    if pending:
+        names = sorted(futures[future] for future in pending)
+        raise QueryDeadlineExceeded(f"Queries still running after {deadline_ms} ms: {', '.join(names)}")
+    return {name: future.result() for future, name in futures.items()}
+
+# ---------- Live Events Hub (Server-Sent Events) ----------
+# Write paths publish notifications, low-stock alerts and KPI deltas here after
+# they commit; /api/admin/events streams them to every open admin tab instead
+# of each tab re-running the list and dashboard queries.
+SSE_MAX_CLIENTS = int(os.environ.get('CARTIQUE_SSE_MAX_CLIENTS', 50))
+SSE_HEARTBEAT_SECONDS = 15      # comment frame that keeps proxies from closing idle streams
+SSE_CLIENT_QUEUE_SIZE = 256     # per-client backlog before the client is told to resync
+SSE_REPLAY_SIZE = 500           # recent events kept for Last-Event-ID resumes
+SSE_RETRY_MS = 5000
+LOW_STOCK_THRESHOLD = 10        # same threshold the inventory_alerts triggers use
+
+class _EventSubscriber:
+    __slots__ = ('queue', 'wakeup', 'resync')
+
+    def __init__(self):
+        self.queue = deque()
+        self.wakeup = threading.Event()
+        self.resync = False
+
+class EventHub:
+    """In-process pub/sub with a connection cap and per-subscriber backpressure.
+
+    A subscriber whose backlog reaches max_queue is not buffered further: its
+    queue is dropped and it receives a single 'resync' event, telling the
+    client to re-fetch once instead of replaying everything it missed.
+    """
+
+    def __init__(self, max_clients, max_queue, replay_size):
+        self.max_clients = max_clients
+        self.max_queue = max_queue
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._recent = deque(maxlen=replay_size)
+        self._next_id = 1
+        self._counters = defaultdict(int)
+
+    def subscribe(self, last_event_id=None):
+        """Register a subscriber (None when at capacity), pre-loaded with missed events"""
+        subscriber = _EventSubscriber()
+        with self._lock:
+            if len(self._subscribers) >= self.max_clients:
+                self._counters['rejected'] += 1
+                return None
+            if last_event_id is not None:
+                missed = [event for event in self._recent if event[0] > last_event_id]
+                if last_event_id >= self._next_id:
+                    subscriber.resync = True   # id from before a restart
+                elif self._recent and self._recent[0][0] > last_event_id + 1:
+                    subscriber.resync = True   # older than the replay buffer
+                elif len(missed) > self.max_queue:
+                    subscriber.resync = True
+                else:
+                    subscriber.queue.extend(missed)
+            self._subscribers.add(subscriber)
+            self._counters['connections'] += 1
+        if subscriber.resync or subscriber.queue:
+            subscriber.wakeup.set()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def publish(self, event_type, data):
+        with self._lock:
+            event = (self._next_id, event_type, data)
+            self._next_id += 1
+            self._recent.append(event)
+            self._counters['published'] += 1
+            subscribers = list(self._subscribers)
+            for subscriber in subscribers:
+                if subscriber.resync:
+                    continue
+                if len(subscriber.queue) >= self.max_queue:
+                    subscriber.queue.clear()
+                    subscriber.resync = True
+                    self._counters['resyncs'] += 1
+                else:
+                    subscriber.queue.append(event)
+        for subscriber in subscribers:
+            subscriber.wakeup.set()
+
+    def next_events(self, subscriber, timeout):
+        """Block up to timeout; returns (events, resync)"""
+        subscriber.wakeup.wait(timeout)
+        with self._lock:
+            subscriber.wakeup.clear()
+            events = list(subscriber.queue)
+            subscriber.queue.clear()
+            resync = subscriber.resync
+            subscriber.resync = False
+            last_id = self._next_id - 1
+        return events, resync, last_id
+
+    def stats(self):
+        with self._lock:
+            data = {
+                'clients': len(self._subscribers),
+                'max_clients': self.max_clients,
+                'client_queue_size': self.max_queue,
+                'last_event_id': self._next_id - 1,
+            }
+            for key in ('connections', 'rejected', 'published', 'resyncs'):
+                data[key] = self._counters[key]
+        return data
+
+event_hub = EventHub(SSE_MAX_CLIENTS, SSE_CLIENT_QUEUE_SIZE, SSE_REPLAY_SIZE)
+
+def publish_kpi_delta(**deltas):
+    """Push incremental dashboard changes, e.g. orders=+1, revenue=+999"""
+    deltas = {key: float(value) for key, value in deltas.items() if value}
+    if deltas:
+        event_hub.publish('kpi', deltas)
+
+def publish_stock_levels(products, deleted=False):
+    """Push every stock change; low_stock tells clients whether the product belongs
+    on the Low Stock card, so restocked and deleted products drop off it"""
+    for product in products:
+        stock = product.get('quantityavailable')
+        if stock is None and not deleted:
+            continue
+        event_hub.publish('stock_level', {
+            'product_id': product['product_id'],
+            'name': product.get('name'),
+            'category': product.get('category'),
+            'price': float(product['price']) if product.get('price') is not None else None,
+            'quantityavailable': int(stock) if stock is not None else None,
+            'low_stock': not deleted and int(stock) <= LOW_STOCK_THRESHOLD,
+            'deleted': deleted,
+        })
+
+def format_sse(event_id, event_type, data):
+    return f"id: {event_id}\nevent: {event_type}\ndata: {json.dumps(data, default=str)}\n\n"
+
+# ---------- Audit & Notification Outbox ----------
+# activity_log / notifications rows for order and return changes are queued
+# here after the business transaction commits and written by a background
+# thread in multi-row INSERTs, instead of inside the triggers (which skip them
+# while @audit_outbox is set; only the transactions that queue replacement rows
+# set it, see mark_outbox_session).
+#   memory  - queue only; rows still queued are lost if the process dies
+#   journal - each row is also appended to a journal file of this process
+#             (<CARTIQUE_OUTBOX_JOURNAL>.<pid>, held under an exclusive lock);
+#             a starting process replays the journals of processes that are gone
+#             (at-least-once: a crash right after a flush may repeat rows)
+#   sync    - rows are written by the caller straight away (no queue)
+OUTBOX_DURABILITY = os.environ.get('CARTIQUE_OUTBOX_DURABILITY', 'journal')
+OUTBOX_FLUSH_INTERVAL = float(os.environ.get('CARTIQUE_OUTBOX_FLUSH_INTERVAL', 1.0))
+OUTBOX_MAX_QUEUE = int(os.environ.get('CARTIQUE_OUTBOX_MAX_QUEUE', 10000))
+OUTBOX_BATCH_SIZE = 500
+OUTBOX_JOURNAL_PATH = os.environ.get(
+    'CARTIQUE_OUTBOX_JOURNAL', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'audit_outbox.journal'))
+OUTBOX_TABLES = {
+    'activity_log': ('user_type', 'user_id', 'action', 'details', 'created_at'),
+    'notifications': ('user_type', 'user_id', 'notification_type', 'message', 'created_at'),
+}
+
+class AuditOutbox:
+    """Bounded, append-only queue of audit/notification rows with a batch writer.
+
+    add() never blocks on the database: when the queue is full the caller
+    writes its own rows directly (backpressure instead of data loss).
+    """
+
+    def __init__(self, durability, flush_interval, max_queue, batch_size, journal_path):
+        if durability not in ('memory', 'journal', 'sync'):
+            raise ValueError(f'Unknown outbox durability mode: {durability}')
+        self.durability = durability
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.journal_base = journal_path
+        self.journal_path = None     # this process's journal, set by start()
+        self._queue = deque()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()   # one writer at a time keeps rows in order
+        self._wakeup = threading.Event()
+        self._journal = None
+        self._thread = None
+        self._counters = defaultdict(int)
+        self.last_error = None
+        self.last_flush_at = None
+
+    def start(self):
+        if self._thread is not None or self.durability == 'sync':
+            return
+        if self.durability == 'journal':
+            self.journal_path = f'{self.journal_base}.{os.getpid()}'
+            claimed = self._claim_journals()
+            # Our own journal now holds the replayed rows (and no torn line), so the claimed files can go
+            self._compact_journal()
+            for path, journal in claimed:
+                if path != self.journal_path:
+                    os.unlink(path)
+                journal.close()
+        self._thread = threading.Thread(target=self._run, name='audit-outbox', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def _claim_journals(self):
+        """Queue rows journaled by processes that are gone.
+
+        A live process holds an exclusive lock on its journal, so any journal
+        we can lock is orphaned. Returns the claimed files, still open and
+        locked, for the caller to remove once the rows are in our journal.
+        """
+        if fcntl is None:
+            # Without file locks another process's journal cannot be told from a live one
+            candidates = [self.journal_path]
+        else:
+            candidates = [self.journal_base] + glob.glob(glob.escape(self.journal_base) + '.*')
+        claimed = []
+        for path in sorted(set(candidates)):
+            if path.endswith('.tmp'):
+                continue
+            try:
+                journal = open(path, encoding='utf-8')
+            except (FileNotFoundError, IsADirectoryError):
+                continue
+            if not _try_lock_file(journal) or os.fstat(journal.fileno()).st_nlink == 0:
+                # Owned by a live process, or claimed and removed by another one meanwhile
+                journal.close()
+                continue
+            for line in journal:
                 try:
-                    # Only try to fetch if it's a SELECT query and we haven't fetched yet
-                    if fetch and query.strip().upper().startswith('SELECT'):
-                        try:
-                            cursor.fetchall()
-                        except:
-                            pass
-                    cursor.close()
-                except:
-                    pass
-            if conn:
+                    table, row = json.loads(line)
+                except ValueError:
+                    continue  # torn last line from a crash mid-write
+                if table in OUTBOX_TABLES:
+                    self._queue.append((table, tuple(row)))
+                    self._counters['replayed'] += 1
+            claimed.append((path, journal))
+        if self._queue:
+            print(f"📬 Replayed {len(self._queue)} outbox row(s) from {len(claimed)} journal(s)")
+        return claimed
+
+    def add(self, table, **values):
+        self.add_many([(table, values)])
+
+    def add_many(self, events):
+        """Queue (table, {column: value}) rows; created_at defaults to now"""
+        now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        rows = []
+        for table, values in events:
+            values.setdefault('created_at', now)
+            rows.append((table, tuple(values.get(column) for column in OUTBOX_TABLES[table])))
+            if table == 'notifications':
+                event_hub.publish('notification', values)
+        if not rows:
+            return
+        
+        if self.durability == 'sync' or self._thread is None:
+            self._write_direct(rows)
+            return
+        with self._lock:
+            if len(self._queue) + len(rows) > self.max_queue:
+                overflow = True
+            else:
+                overflow = False
+                if self._journal is not None:
+                    self._journal.write(''.join(json.dumps(row) + '\n' for row in rows))
+                    self._journal.flush()
+                self._queue.extend(rows)
+                self._counters['enqueued'] += len(rows)
+                backlog = len(self._queue)
+        if overflow:
+            self._counters['overflow_writes'] += len(rows)
+            self._write_direct(rows)
+        elif backlog >= self.batch_size:
+            self._wakeup.set()
+
+    def _write_direct(self, rows):
+        try:
+            self._write(rows)
+        except Exception as e:
+            # An audit row must never fail the request that produced it
+            self._counters['dropped'] += len(rows)
+            self.last_error = str(e)
+            print(f"❌ Outbox direct write failed, {len(rows)} row(s) dropped: {e}")
+
+    def _write(self, rows):
+        """One multi-row INSERT per table, in a single transaction"""
+        by_table = defaultdict(list)
+        for table, row in rows:
+            by_table[table].append(row)
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        try:
+            for table, table_rows in by_table.items():
+                columns = OUTBOX_TABLES[table]
+                cursor.executemany(
+                    f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))})",
+                    table_rows
+                )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+            conn.close()
+        self._counters['written'] += len(rows)
+
+    def flush(self):
+        """Write everything queued so far; rows stay queued if the write fails"""
+        with self._flush_lock:
+            written = 0
+            while True:
+                with self._lock:
+                    batch = [self._queue[i] for i in range(min(self.batch_size, len(self._queue)))]
+                if not batch:
+                    break
                 try:
-                    conn.close()
-                except:
-                    pass
-            raise e
+                    self._write(batch)
+                except Exception as e:
+                    self._counters['failures'] += 1
+                    self.last_error = str(e)
+                    print(f"❌ Outbox flush failed ({len(batch)} row(s) kept): {e}")
+                    break
+                with self._lock:
+                    for _ in batch:
+                        self._queue.popleft()
+                written += len(batch)
+            if written:
+                self._counters['flushes'] += 1
+                self.last_flush_at = datetime.now()
+                self._compact_journal()
+            return written
+
+    def _compact_journal(self):
+        """Rewrite this process's journal with only the rows still queued"""
+        if self.journal_path is None:
+            return
+        with self._lock:
+            pending = list(self._queue)
+            temp_path = self.journal_path + '.tmp'
+            journal = open(temp_path, 'w', encoding='utf-8')
+            # Lock before the rename so the journal is never visible unlocked
+            _try_lock_file(journal)
+            journal.write(''.join(json.dumps(row) + '\n' for row in pending))
+            journal.flush()
+            os.replace(temp_path, self.journal_path)
+            if self._journal is not None:
+                self._journal.close()
+            self._journal = journal
+
+    def close(self):
+        """Flush at exit and remove the journal if nothing is left in it"""
+        self.flush()
+        with self._lock:
+            if self._journal is not None and not self._queue:
+                os.unlink(self.journal_path)
+                self._journal.close()
+                self._journal = None
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"❌ Outbox writer error: {e}")
+
+    def stats(self):
+        with self._lock:
+            queued = len(self._queue)
+        data = {
+            'durability': self.durability,
+            'running': self._thread is not None,
+            'queued': queued,
+            'max_queue': self.max_queue,
+            'flush_interval': self.flush_interval,
+            'batch_size': self.batch_size,
+            'journal': (self.journal_path or self.journal_base) if self.durability == 'journal' else None,
+            'last_flush_at': self.last_flush_at.isoformat() if self.last_flush_at else None,
+            'last_error': self.last_error,
+        }
+        for key in ('enqueued', 'written', 'flushes', 'failures', 'overflow_writes', 'dropped', 'replayed'):
+            data[key] = self._counters[key]
+        return data
+
+def _try_lock_file(f):
+    """Non-blocking exclusive lock on an open file; True if we hold it (always, without fcntl)"""
+    if fcntl is None:
+        return True
+    try:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except OSError:
+        return False
+
+outbox = AuditOutbox(OUTBOX_DURABILITY, OUTBOX_FLUSH_INTERVAL, OUTBOX_MAX_QUEUE,
+                     OUTBOX_BATCH_SIZE, OUTBOX_JOURNAL_PATH)
+
+def mark_outbox_session():
+    """Make the order/return triggers on the request connection leave their
+    activity_log/notifications rows to the outbox.
+
+    Call it first thing inside the transaction function, so a retry on a fresh
+    connection sets it again, and pair it with clear_outbox_session().
+    """
+    execute_query("SET @audit_outbox = 1")
+    g.audit_outbox = True
+
+def clear_outbox_session():
+    """Unset @audit_outbox so later writes on this connection get trigger audit rows again"""
+    if g.get('audit_outbox') and g.get('db_conn') is not None:
+        try:
+            execute_query("SET @audit_outbox = NULL")
+            g.audit_outbox = False
+        except Exception:
+            discard_request_connection()
+    g.pop('audit_outbox', None)
+
+def order_placed_events(order_id, customer_id):
+    """Rows trg_after_order_insert used to write"""
+    return [('activity_log', {'user_type': 'system', 'user_id': customer_id, 'action': 'order_placed',
+                              'details': f'Order #{order_id} placed'})]
+
+def order_change_events(before_rows, status=None, shipping_status=None):
+    """Rows trg_after_order_update used to write, from each order's pre-update values"""
+    events = []
+    for o in before_rows:
+        new_status = status if status is not None else o['status']
+        new_shipping = shipping_status if shipping_status is not None else o['shipping_status']
+        if ((o['status'] != 'Cancelled' and new_status == 'Cancelled') or
+                (o['shipping_status'] != 'Returned' and new_shipping == 'Returned')):
+            events.append(('activity_log', {'user_type': 'system', 'user_id': o['customer_id'],
+                                            'action': 'order_cancelled',
+                                            'details': f"Order #{o['order_id']} cancelled/returned"}))
+        if o['shipping_status'] != new_shipping:
+            events.append(('notifications', {'user_type': 'customer', 'user_id': o['customer_id'],
+                                             'notification_type': 'shipping_update',
+                                             'message': f"Your order #{o['order_id']} status: {new_shipping}"}))
+    return events
+
+def return_created_events(return_id, order_id, customer_id):
+    """Rows trg_after_return_insert used to write"""
+    return [
+        ('notifications', {'user_type': 'admin', 'user_id': None, 'notification_type': 'return_request',
+                           'message': f'New return request #{return_id} for order #{order_id}'}),
+        ('activity_log', {'user_type': 'customer', 'user_id': customer_id, 'action': 'return_requested',
+                          'details': f'Return request #{return_id} created'}),
+    ]
+
+def return_status_events(before, new_status):
+    """Rows trg_after_return_update (and the order update it cascades to) used to write"""
+    events = []
+    if before['status'] == 'Requested' and new_status == 'Approved':
+        events.extend(order_change_events([{
+            'order_id': before['order_id'], 'customer_id': before['order_customer_id'],
+            'status': before['order_status'], 'shipping_status': before['order_shipping_status'],
+        }], shipping_status='Returned'))
+        events.append(('notifications', {'user_type': 'customer', 'user_id': before['customer_id'],
+                                         'notification_type': 'return_approved',
+                                         'message': f"Your return #{before['id']} has been approved. "
+                                                    f"Refund: ₹{before['refund_amount']}"}))
+    if before['status'] == 'Requested' and new_status == 'Rejected':
+        events.append(('notifications', {'user_type': 'customer', 'user_id': before['customer_id'],
+                                         'notification_type': 'return_rejected',
+                                         'message': f"Your return request #{before['id']} has been rejected"}))
+    return events
+
+def update_orders_audited(order_ids, set_clause, params, status=None, shipping_status=None):
+    """UPDATE orders and queue the activity/notification rows the change implies.
+
+    The pre-update status/shipping_status is read (and locked) in the same
+    transaction, only when the update can produce an audit row.
+    """
+    placeholders = ','.join(['%s'] * len(order_ids))
+    
+    def lock_and_update():
+        mark_outbox_session()
+        before = []
+        if status == 'Cancelled' or shipping_status is not None:
+            before = execute_query(f"""
+                SELECT order_id, customer_id, status, shipping_status
+                FROM orders
+                WHERE order_id IN ({placeholders})
+                FOR UPDATE
+            """, tuple(order_ids), fetch=True)
+        execute_query(f"UPDATE orders SET {set_clause} WHERE order_id IN ({placeholders})",
+                      tuple(params) + tuple(order_ids))
+        return before
+    
+    try:
+        before = retry_transaction(lock_and_update)
+    finally:
+        clear_outbox_session()
+    outbox.add_many(order_change_events(before, status, shipping_status))
+
+# ---------- Query Plan Capture (development mode) ----------
+# Set CARTIQUE_EXPLAIN=1 (or POST /api/admin/db/explain-report/config) to run
+# EXPLAIN FORMAT=JSON once per distinct query fingerprint issued through
+# execute_query and flag full scans, filesorts and temporary tables.
+EXPLAIN_MAX_FINGERPRINTS = 2000
+EXPLAINABLE_STATEMENTS = ('SELECT', 'UPDATE', 'DELETE', 'INSERT', 'REPLACE', 'WITH')
+
+explain_capture = {'enabled': os.environ.get('CARTIQUE_EXPLAIN', '') == '1'}
+explain_report = OrderedDict()
+explain_lock = threading.Lock()
+
+_FINGERPRINT_RULES = [
+    (re.compile(r"'(?:[^'\\]|\\.|'')*'"), '?'),       # string literals
+    (re.compile(r'\b\d+(?:\.\d+)?\b'), '?'),             # numeric literals
+    (re.compile(r'%s'), '?'),                            # driver placeholders
+    (re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)'), '(?+)'),  # IN lists of any length
+    (re.compile(r'\s+'), ' '),
+]
+
+@functools.lru_cache(maxsize=4096)
+def query_fingerprint(query):
+    """Normalise a query so calls differing only in literals share one entry"""
+    fingerprint = query.strip().rstrip(';')
+    for pattern, replacement in _FINGERPRINT_RULES:
+        fingerprint = pattern.sub(replacement, fingerprint)
+    return fingerprint
+
+def _plan_findings(node, findings):
+    """Walk an EXPLAIN FORMAT=JSON plan collecting scan/sort/temp flags"""
+    if isinstance(node, dict):
+        table = node.get('table_name')
+        access_type = node.get('access_type')
+        if table and access_type == 'ALL':
+            findings['full_scan'].append({'table': table, 'rows': node.get('rows_examined_per_scan')})
+        elif table and access_type == 'index':
+            findings['full_index_scan'].append({'table': table, 'rows': node.get('rows_examined_per_scan')})
+        if node.get('using_filesort'):
+            findings['filesort'] = True
+        if node.get('using_temporary_table'):
+            findings['temporary_table'] = True
+        for value in node.values():
+            _plan_findings(value, findings)
+    elif isinstance(node, list):
+        for value in node:
+            _plan_findings(value, findings)
+    return findings
+
+def capture_explain(conn, query, params=None):
+    """Record the plan for a query's fingerprint the first time it is seen"""
+    statement = query.lstrip().split(None, 1)[0].upper() if query.strip() else ''
+    if statement not in EXPLAINABLE_STATEMENTS:
+        return
+    fingerprint = query_fingerprint(query)
+    handler = request.endpoint if has_request_context() else threading.current_thread().name
+    
+    with explain_lock:
+        entry = explain_report.get(fingerprint)
+        if entry is not None:
+            entry['calls'] += 1
+            entry['handlers'].add(handler or 'unknown')
+            return
+        if len(explain_report) >= EXPLAIN_MAX_FINGERPRINTS:
+            return
+        entry = {
+            'fingerprint': fingerprint,
+            'sample': query.strip()[:500],
+            'handlers': {handler or 'unknown'},
+            'calls': 1,
+            'first_seen': datetime.now().isoformat(timespec='seconds'),
+            'query_cost': None,
+            'full_scan': [],
+            'full_index_scan': [],
+            'filesort': False,
+            'temporary_table': False,
+            'error': None,
+        }
+        explain_report[fingerprint] = entry
+    
+    cursor = None
+    try:
+        cursor = conn.cursor(buffered=True)
+        # Mirror execute_query: only interpolate when the caller passed params
+        if params:
+            cursor.execute('EXPLAIN FORMAT=JSON ' + query, params)
+        else:
+            cursor.execute('EXPLAIN FORMAT=JSON ' + query)
+        row = cursor.fetchone()
+        plan = json.loads(row[0]) if row else {}
+        findings = _plan_findings(plan, {'full_scan': [], 'full_index_scan': [],
+                                         'filesort': False, 'temporary_table': False})
+        cost = (plan.get('query_block') or {}).get('cost_info', {}).get('query_cost')
+        with explain_lock:
+            entry.update(findings)
+            entry['query_cost'] = float(cost) if cost is not None else None
+    except Exception as e:
+        # Plans are diagnostics only; never fail the real query because of them
+        with explain_lock:
+            entry['error'] = str(e)
+    finally:
+        if cursor:
+            try:
+                cursor.close()
+            except:
+                pass
+
+def _explain_entry_json(entry):
+    data = dict(entry)
+    data['handlers'] = sorted(entry['handlers'])
+    data['flags'] = [flag for flag, hit in (
+        ('full_scan', entry['full_scan']),
+        ('full_index_scan', entry['full_index_scan']),
+        ('filesort', entry['filesort']),
+        ('temporary_table', entry['temporary_table']),
+    ) if hit]
+    return data
+
+# ---------- Runtime Metrics ----------
+# Exported in Prometheus text format on /metrics. Latencies are in seconds.
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+METRICS_MAX_QUERY_SERIES = 500  # distinct fingerprints tracked before folding into "other"
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape_label(value)}"' for name, value in pairs) + '}'
+
+class Counter:
+    """Monotonic counter keyed by a tuple of label values"""
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self._values = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def inc(self, label_values=(), amount=1):
+        with self._lock:
+            self._values[tuple(label_values)] += amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        with self._lock:
+            items = list(self._values.items())
+        for label_values, value in items:
+            lines.append(f'{self.name}{_format_labels(self.labels, label_values)} {value}')
+        return lines
+
+class Histogram:
+    """Cumulative-bucket latency histogram keyed by a tuple of label values"""
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, label_values=()):
+        key = tuple(label_values)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series['counts'][index] += 1
+                    break
+            series['sum'] += value
+            series['count'] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            items = [(key, list(series['counts']), series['sum'], series['count'])
+                     for key, series in self._series.items()]
+        for label_values, counts, total, count in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labels, label_values, [('le', bound)])
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _format_labels(self.labels, label_values, [('le', '+Inf')])
+            lines.append(f'{self.name}_bucket{labels} {count}')
+            labels = _format_labels(self.labels, label_values)
+            lines.append(f'{self.name}_sum{labels} {total}')
+            lines.append(f'{self.name}_count{labels} {count}')
+        return lines
+
+HTTP_REQUEST_SECONDS = Histogram('cartique_http_request_duration_seconds',
+                                 'Time from request start to response, per route', ('endpoint', 'method'))
+HTTP_REQUESTS = Counter('cartique_http_requests_total', 'Responses per route and status', ('endpoint', 'method', 'status'))
+DB_QUERY_SECONDS = Histogram('cartique_db_query_duration_seconds',
+                             'Time spent in MySQL per query fingerprint (execute + fetch)', ('query_id',))
+DB_QUERY_ROWS = Counter('cartique_db_query_rows_total', 'Rows returned per query fingerprint', ('query_id',))
+DB_QUERY_ERRORS = Counter('cartique_db_query_errors_total', 'Failed executions per query fingerprint', ('query_id',))
+DB_RETRIES = Counter('cartique_db_retries_total', 'Retries by the data access layer', ('kind',))
+DB_READS = Counter('cartique_db_reads_total', 'Reads served per target (primary or replica)', ('target',))
+POOL_WAIT_SECONDS = Histogram('cartique_db_pool_wait_seconds', 'Time waiting for a pooled connection')
+RETENTION_ROWS_DELETED = Counter('cartique_retention_rows_deleted_total', 'Rows deleted by the retention purge', ('table',))
+
+query_series_ids = {}
+query_series_lock = threading.Lock()
+
+def query_series(query):
+    """Short, stable metric label for a query's fingerprint"""
+    fingerprint = query_fingerprint(query)
+    series_id = query_series_ids.get(fingerprint)
+    if series_id is not None:
+        return series_id
+    with query_series_lock:
+        if fingerprint not in query_series_ids:
+            if len(query_series_ids) >= METRICS_MAX_QUERY_SERIES:
+                return 'other'
+            query_series_ids[fingerprint] = uuid.uuid5(uuid.NAMESPACE_OID, fingerprint).hex[:12]
+        return query_series_ids[fingerprint]
+
+def record_query_timing(query, seconds, rows=None):
+    series_id = query_series(query)
+    DB_QUERY_SECONDS.observe(seconds, (series_id,))
+    if rows is not None:
+        DB_QUERY_ROWS.inc((series_id,), rows)
+
+def _pool_gauge_lines():
+    """Pool gauges and counters, read from the pool at scrape time"""
+    lines = ['# HELP cartique_db_pool_connections Pooled connections by state',
+             '# TYPE cartique_db_pool_connections gauge']
+    if pool is None:
+        return lines
+    stats = pool.stats()
+    for state in ('max_size', 'min_size', 'open', 'idle', 'in_use', 'waiting'):
+        lines.append(f'cartique_db_pool_connections{{state="{state}"}} {stats[state]}')
+    lines.append('# HELP cartique_db_pool_utilisation Fraction of the maximum pool size checked out')
+    lines.append('# TYPE cartique_db_pool_utilisation gauge')
+    max_size = stats['max_size']
+    lines.append(f'cartique_db_pool_utilisation {round(stats["in_use"] / max_size, 4) if max_size else 0}')
+    lines.append('# HELP cartique_db_pool_events_total Pool lifecycle events')
+    lines.append('# TYPE cartique_db_pool_events_total counter')
+    for event in ('created', 'closed', 'checkouts', 'returns', 'waits', 'timeouts', 'validations',
+                  'validation_failures', 'reaped', 'reset_failures'):
+        lines.append(f'cartique_db_pool_events_total{{event="{event}"}} {stats[event]}')
+    return lines
+
+def render_metrics():
+    lines = []
+    for metric in (HTTP_REQUEST_SECONDS, HTTP_REQUESTS, DB_QUERY_SECONDS, DB_QUERY_ROWS,
+                   DB_QUERY_ERRORS, DB_RETRIES, POOL_WAIT_SECONDS, RETENTION_ROWS_DELETED):
+        lines.extend(metric.render())
+    lines.extend(_pool_gauge_lines())
+    if replicas:
+        lines.append('# HELP cartique_db_replica_lag_seconds Replication lag per replica (-1 when unknown)')
+        lines.append('# TYPE cartique_db_replica_lag_seconds gauge')
+        lines.append('# HELP cartique_db_replica_healthy 1 when the replica is eligible for reads')
+        lines.append('# TYPE cartique_db_replica_healthy gauge')
+        for replica in replicas.stats():
+            labels = _format_labels(('replica',), (replica['name'],))
+            lag = replica['lag_seconds'] if replica['lag_seconds'] is not None else -1
+            lines.append(f'cartique_db_replica_lag_seconds{labels} {lag}')
+            lines.append(f'cartique_db_replica_healthy{labels} {1 if replica["healthy"] else 0}')
+    hub_stats = event_hub.stats()
+    lines.append('# HELP cartique_sse_clients Connected live-event (SSE) clients')
+    lines.append('# TYPE cartique_sse_clients gauge')
+    lines.append(f'cartique_sse_clients {hub_stats["clients"]}')
+    lines.append('# HELP cartique_sse_events_total Live events published')
+    lines.append('# TYPE cartique_sse_events_total counter')
+    lines.append(f'cartique_sse_events_total {hub_stats["published"]}')
+    outbox_stats = outbox.stats()
+    lines.append('# HELP cartique_outbox_queued Audit/notification rows waiting for the outbox writer')
+    lines.append('# TYPE cartique_outbox_queued gauge')
+    lines.append(f'cartique_outbox_queued {outbox_stats["queued"]}')
+    lines.append('# HELP cartique_outbox_rows_total Outbox rows by outcome')
+    lines.append('# TYPE cartique_outbox_rows_total counter')
+    for outcome in ('enqueued', 'written', 'overflow_writes', 'dropped'):
+        lines.append(f'cartique_outbox_rows_total{_format_labels(("outcome",), (outcome,))} {outbox_stats[outcome]}')
+    breaker = db_breaker.stats()
+    lines.append('# HELP cartique_db_circuit_open 1 while the database circuit breaker is open or half-open')
+    lines.append('# TYPE cartique_db_circuit_open gauge')
+    lines.append(f'cartique_db_circuit_open {0 if breaker["state"] == "closed" else 1}')
+    lines.append('# HELP cartique_db_circuit_trips_total Times the circuit breaker opened')
+    lines.append('# TYPE cartique_db_circuit_trips_total counter')
+    lines.append(f'cartique_db_circuit_trips_total {breaker["trips"]}')
+    lines.append('# HELP cartique_db_query_info Fingerprint behind each query_id label')
+    lines.append('# TYPE cartique_db_query_info gauge')
+    with query_series_lock:
+        series = list(query_series_ids.items())
+    for fingerprint, series_id in series:
+        labels = _format_labels(('query_id', 'fingerprint'), (series_id, fingerprint[:300]))
+        lines.append(f'cartique_db_query_info{labels} 1')
+    return '\n'.join(lines) + '\n'
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_timing(response):
+    """Per-route latency; streamed responses are timed to the first byte"""
+    started = g.get('request_started')
+    if started is not None:
+        endpoint = request.endpoint or 'unmatched'
+        HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, (endpoint, request.method))
+        HTTP_REQUESTS.inc((endpoint, request.method, response.status_code))
+    return response
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus scrape endpoint"""
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+# ---------- Result Cache ----------
+CACHE_MAX_ENTRIES = 1024
+CACHE_MAX_BYTES = 64 * 1024 * 1024  # approximate, measured as serialized JSON size
+CACHE_KEY_LOCK_STRIPES = 64         # single-flight locks, shared by keys that hash alike
+CACHE_SWEEP_INTERVAL = 30           # seconds between sweeps of expired tag registrations
+
+# Per-endpoint TTLs in seconds
+CACHE_TTLS = {
+    'dashboard_snapshot': 5,
+    'categories': 300,
+    'customer_segments': 30,     # evt_update_customer_segments rewrites segments without invalidating
+    'category_performance': 120,
+    'best_sellers': 60,
+    'monthly_sales': 300,
+    'customer_stats': 60,
+    'schema_metadata': 600,
+}
+CACHE_DEFAULT_TTL = 60
+
+# Cache tags touched by writes to each table, including what its triggers
+# change (used by CSV import and other generic writers): order inserts take
+# stock and update customer aggregates, returns adjust lifetime value
+TABLE_CACHE_TAGS = {
+    'product': ('product',),
+    'orders': ('orders', 'orders:status', 'product', 'customer'),
+    'customer': ('customer',),
+    'returns_refunds': ('returns', 'customer'),
+}
+
+class LRUCacheBackend:
+    """In-process LRU store bounded by entry count and approximate size.
+
+    Any object with the same get/set/delete/clear/stats methods (for example
+    a Redis-backed store) can be passed to ResultCache instead; pop_dropped
+    is optional.
+    """
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, max_bytes=CACHE_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._data = OrderedDict()  # key -> (expires_at, value, size)
+        self._bytes = 0
+        self._dropped = set()  # keys expired or evicted since the last pop_dropped()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key):
+        """Return (True, value) for a live entry, (False, None) otherwise"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return False, None
+            if entry[0] <= time.time():
+                self._remove(key)
+                self._dropped.add(key)
+                return False, None
+            self._data.move_to_end(key)
+            return True, entry[1]
+
+    def set(self, key, value, ttl):
+        size = len(json.dumps(value, default=str))
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            if size > self.max_bytes:
+                self._dropped.add(key)
+                return
+            self._data[key] = (time.time() + ttl, value, size)
+            self._dropped.discard(key)
+            self._bytes += size
+            while len(self._data) > self.max_entries or self._bytes > self.max_bytes:
+                evicted = next(iter(self._data))
+                self._remove(evicted)
+                self._dropped.add(evicted)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._dropped.clear()
+            self._bytes = 0
+
+    def pop_dropped(self):
+        """Return and forget the keys expired or evicted since the last call"""
+        with self._lock:
+            dropped, self._dropped = self._dropped, set()
+        return dropped
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._data), 'bytes': self._bytes,
+                    'max_entries': self.max_entries, 'max_bytes': self.max_bytes,
+                    'evictions': self.evictions}
+
+    def _remove(self, key):
+        self._bytes -= self._data.pop(key)[2]
+
+class ResultCache:
+    """TTL result cache with tag-based invalidation and hit/miss counters"""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.loaders = {}  # name -> (loader, tags) for warm-up
+        self._tag_keys = defaultdict(set)
+        self._key_tags = {}  # key -> (expires_at, tags), pruned as entries expire or are evicted
+        self._key_locks = [threading.Lock() for _ in range(CACHE_KEY_LOCK_STRIPES)]
+        self._lock = threading.Lock()
+        self._counters = defaultdict(lambda: {'hits': 0, 'misses': 0, 'invalidations': 0})
+        self._generation = 0  # bumped by every invalidation
+        self._next_sweep = 0
+
+    def get_or_load(self, name, key, loader, tags=()):
+        """Return the cached value for key, loading it at most once per TTL"""
+        hit, value = self.backend.get(key)
+        if hit:
+            self._count(name, 'hits')
+            return value
+        with self._key_locks[hash(key) % len(self._key_locks)]:
+            # Another request may have loaded it while we waited for the lock
+            hit, value = self.backend.get(key)
+            if hit:
+                self._count(name, 'hits')
+                return value
+            self._count(name, 'misses')
+            generation = self._generation
+            value = loader()
+            ttl = CACHE_TTLS.get(name, CACHE_DEFAULT_TTL)
+            with self._lock:
+                # A write that landed while we were loading may have made the
+                # value stale already; serve it once but don't keep it
+                if generation != self._generation:
+                    return value
+                self._prune()
+                self._forget(key)
+                # Stored under the lock, so an invalidate() cannot run between
+                # the generation check and the store
+                self.backend.set(key, value, ttl)
+                self._key_tags[key] = (time.time() + ttl, tuple(tags))
+                for tag in tags:
+                    self._tag_keys[tag].add(key)
+            return value
+
+    def invalidate(self, *tags):
+        """Drop every entry registered under any of the given tags"""
+        with self._lock:
+            self._generation += 1
+            keys = set()
+            for tag in tags:
+                keys |= self._tag_keys.pop(tag, set())
+            for key in keys:
+                self._forget(key)
+        for key in keys:
+            self.backend.delete(key)
+            self._count(key.split(':', 1)[0], 'invalidations')
+        return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._tag_keys.clear()
+            self._key_tags.clear()
+        self.backend.clear()
+
+    def stats(self):
+        with self._lock:
+            endpoints = {name: dict(c) for name, c in self._counters.items()}
+            tracked_keys = len(self._key_tags)
+        hits = sum(c['hits'] for c in endpoints.values())
+        misses = sum(c['misses'] for c in endpoints.values())
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': round(hits / (hits + misses), 4) if hits + misses else 0,
+            'endpoints': endpoints,
+            'tracked_keys': tracked_keys,
+            'backend': self.backend.stats()
+        }
+
+    def _count(self, name, field):
+        with self._lock:
+            self._counters[name][field] += 1
+
+    def _forget(self, key):
+        """Unregister key from its tags; the caller holds self._lock"""
+        entry = self._key_tags.pop(key, None)
+        if entry is None:
+            return
+        for tag in entry[1]:
+            keys = self._tag_keys.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tag_keys[tag]
+
+    def _prune(self):
+        """Unregister entries the backend expired or evicted; the caller holds self._lock"""
+        pop_dropped = getattr(self.backend, 'pop_dropped', None)
+        if pop_dropped is not None:
+            for key in pop_dropped():
+                self._forget(key)
+        # Backends without pop_dropped are covered by the TTL alone
+        now = time.time()
+        if now >= self._next_sweep:
+            self._next_sweep = now + CACHE_SWEEP_INTERVAL
+            for key in [k for k, (expires_at, _) in self._key_tags.items() if expires_at <= now]:
+                self._forget(key)
+
+result_cache = ResultCache(LRUCacheBackend())
+
+def load_from_primary(loader, *args):
+    """Run a cache fill against the primary.
+
+    A replica may still be behind the write that just invalidated the entry,
+    and whatever is loaded here is served to every session (pinned ones
+    included) for the whole TTL.
+    """
+    if not has_request_context():
+        return loader(*args)
+    previous = g.get('cache_fill')
+    g.cache_fill = True
+    try:
+        return loader(*args)
+    finally:
+        g.cache_fill = previous
+
+def cached_loader(name, tags=()):
+    """Cache a loader's return value under name (plus its arguments).
+
+    Tags may reference the loader's arguments, e.g. 'customer:{0}'. Loaders
+    without arguments are registered for startup warm-up. Misses are always
+    filled from the primary.
+    """
+    def decorator(loader):
+        @functools.wraps(loader)
+        def wrapper(*args):
+            key = ':'.join([name] + [str(a) for a in args])
+            entry_tags = [t.format(*args) for t in tags]
+            return result_cache.get_or_load(name, key, lambda: load_from_primary(loader, *args), entry_tags)
+        wrapper.uncached = loader
+        if loader.__code__.co_argcount == 0:
+            result_cache.loaders[name] = wrapper
+        return wrapper
+    return decorator
+
+def invalidate_cache(*tags):
+    """Invalidate cached results affected by a write"""
+    result_cache.invalidate(*tags)
+
+def warm_cache():
+    """Pre-load every argument-free cached loader"""
+    for name, loader in result_cache.loaders.items():
+        try:
+            loader()
+            print(f"✅ Cache warmed: {name}")
+        except Exception as e:
+            print(f"⚠️ Cache warm-up failed for {name}: {e}")
 
 # Initialize connection pool
 try:
@@ -191,36 +2129,99 @@ def api_login():
         return jsonify({'success': False, 'error': str(e)})
 
 # ---------- Dashboard Stats ----------
+DASHBOARD_SNAPSHOT_QUERY = """
+    SELECT
+        o.total_orders, o.total_revenue, o.avg_order_value,
+        o.orders_today, o.revenue_today, o.pending_orders, o.recent_orders,
+        p.total_products, p.low_stock_count,
+        {returns_column},
+        c.total_customers, c.avg_lifetime_value
+    FROM (
+        SELECT
+            COUNT(*) as total_orders,
+            COALESCE(SUM(total_amount), 0) as total_revenue,
+            COALESCE(AVG(total_amount), 0) as avg_order_value,
+            COALESCE(SUM(CASE WHEN order_date >= CURDATE() AND order_date < CURDATE() + INTERVAL 1 DAY THEN 1 ELSE 0 END), 0) as orders_today,
+            COALESCE(SUM(CASE WHEN order_date >= CURDATE() AND order_date < CURDATE() + INTERVAL 1 DAY THEN total_amount ELSE 0 END), 0) as revenue_today,
+            COALESCE(SUM(CASE WHEN status = 'Pending' THEN 1 ELSE 0 END), 0) as pending_orders,
+            COALESCE(SUM(CASE WHEN order_date >= NOW() - INTERVAL 24 HOUR THEN 1 ELSE 0 END), 0) as recent_orders
+        FROM orders
+    ) o
+    CROSS JOIN (
+        SELECT
+            COUNT(*) as total_products,
+            COALESCE(SUM(CASE WHEN quantityavailable <= 10 THEN 1 ELSE 0 END), 0) as low_stock_count
+        FROM product
+    ) p
+    {returns_join}
+    CROSS JOIN (
+        SELECT COUNT(*) as total_customers, AVG(lifetime_value) as avg_lifetime_value
+        FROM customer
+    ) c
+"""
+
+@cached_loader('dashboard_snapshot', tags=('product', 'orders', 'orders:status', 'returns', 'customer'))
+def get_dashboard_snapshot():
+    """Compute every dashboard KPI in a single statement (one connection, one pass per table)"""
+    try:
+        row = execute_query(DASHBOARD_SNAPSHOT_QUERY.format(
+            returns_column='r.pending_returns',
+            returns_join="""CROSS JOIN (
+        SELECT COUNT(*) as pending_returns FROM returns_refunds WHERE status = 'Requested'
+    ) r"""
+        ), fetch=True)[0]
+    except Error as e:
+        # returns_refunds is optional in older schemas
+        print(f"⚠️ Dashboard snapshot without returns_refunds: {e}")
+        row = execute_query(DASHBOARD_SNAPSHOT_QUERY.format(
+            returns_column='0 as pending_returns',
+            returns_join=''
+        ), fetch=True)[0]
+
+    total_customers = int(row['total_customers'] or 0)
+    total_orders = int(row['total_orders'] or 0)
+    return {
+        'total_products': int(row['total_products'] or 0),
+        'total_orders': total_orders,
+        'total_revenue': float(row['total_revenue'] or 0),
+        'orders_today': int(row['orders_today'] or 0),
+        'revenue_today': float(row['revenue_today'] or 0),
+        'pending_orders': int(row['pending_orders'] or 0),
+        'low_stock_count': int(row['low_stock_count'] or 0),
+        'pending_returns': int(row['pending_returns'] or 0),
+        'total_customers': total_customers,
+        'avg_order_value': round(float(row['avg_order_value'] or 0), 2),
+        'avg_lifetime_value': round(float(row['avg_lifetime_value'] or 0), 2),
+        'recent_orders': int(row['recent_orders'] or 0),
+        'conversion_rate': round(total_orders / total_customers * 100, 2) if total_customers > 0 else 0,
+        'generated_at': datetime.now().isoformat(timespec='seconds')
+    }
+
+@app.route('/api/admin/dashboard/snapshot')
+def api_dashboard_snapshot():
+    """Get all dashboard KPIs in one response (briefly cached)"""
+    try:
+        return jsonify({'success': True, 'snapshot': get_dashboard_snapshot()})
+    except Exception as e:
+        print(f"Dashboard snapshot error: {e}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({'success': False, 'error': str(e)})
+
 @app.route('/api/admin/dashboard')
 def api_dashboard():
-    """Get dashboard stats - using direct queries for accuracy"""
+    """Get dashboard stats from the shared snapshot"""
     try:
-        # Use direct queries instead of stored procedure for better compatibility
-        total_products = execute_query("SELECT COUNT(*) as total_products FROM product", fetch=True)[0]['total_products']
-        total_orders = execute_query("SELECT COUNT(*) as total_orders FROM orders", fetch=True)[0]['total_orders']
-        total_revenue = execute_query("SELECT COALESCE(SUM(total_amount), 0) as total_revenue FROM orders", fetch=True)[0]['total_revenue'] or 0
-        
-        # Additional stats
-        orders_today = execute_query("SELECT COUNT(*) as orders_today FROM orders WHERE DATE(order_date) = CURDATE()", fetch=True)[0]['orders_today']
-        revenue_today = execute_query("SELECT COALESCE(SUM(total_amount), 0) as revenue_today FROM orders WHERE DATE(order_date) = CURDATE()", fetch=True)[0]['revenue_today'] or 0
-        pending_orders = execute_query("SELECT COUNT(*) as pending_orders FROM orders WHERE status = 'Pending'", fetch=True)[0]['pending_orders']
-        low_stock_count = execute_query("SELECT COUNT(*) as low_stock_count FROM product WHERE quantityavailable <= 10", fetch=True)[0]['low_stock_count']
-        
-        # Check if returns_refunds table exists
-        try:
-            pending_returns = execute_query("SELECT COUNT(*) as pending_returns FROM returns_refunds WHERE status = 'Requested'", fetch=True)[0]['pending_returns']
-        except:
-            pending_returns = 0
-
+        snapshot = get_dashboard_snapshot()
         return jsonify({
-            'total_products': int(total_products),
-            'total_orders': int(total_orders),
-            'total_revenue': float(total_revenue),
-            'orders_today': int(orders_today),
-            'revenue_today': float(revenue_today),
-            'pending_orders': int(pending_orders),
-            'low_stock_count': int(low_stock_count),
-            'pending_returns': int(pending_returns)
+            'total_products': snapshot['total_products'],
+            'total_orders': snapshot['total_orders'],
+            'total_revenue': snapshot['total_revenue'],
+            'orders_today': snapshot['orders_today'],
+            'revenue_today': snapshot['revenue_today'],
+            'pending_orders': snapshot['pending_orders'],
+            'low_stock_count': snapshot['low_stock_count'],
+            'pending_returns': snapshot['pending_returns']
         })
     except Exception as e:
         print(f"Dashboard error: {e}")
@@ -238,15 +2239,19 @@ def api_dashboard():
         })
 
 # Monthly Sales (last 12 months)
+@cached_loader('monthly_sales', tags=('orders',))
+def load_monthly_sales():
+    return execute_query("""
+        SELECT DATE_FORMAT(sale_month, '%Y-%m') as month, gross_revenue as total
+        FROM sales_monthly_rollup
+        WHERE order_count > 0
+        ORDER BY sale_month
+    """, fetch=True)
+
 @app.route('/api/admin/dashboard/monthly-sales')
 def monthly_sales():
     try:
-        result = execute_query("""
-            SELECT DATE_FORMAT(order_date, '%Y-%m') as month, SUM(total_amount) as total
-            FROM orders
-            GROUP BY month
-            ORDER BY month
-        """, fetch=True)
+        result = load_monthly_sales()
         return jsonify(result)
     except Exception as e:
         print(f"Monthly sales error: {e}")
@@ -257,14 +2262,16 @@ def monthly_sales():
 def api_revenue_summary():
     """Get revenue summary for dashboard"""
     try:
-        # Get all revenue data in one query for better performance
+        # Read the day/month rollups (primary-key lookups) instead of scanning orders
         result = execute_query("""
             SELECT 
-                COALESCE(SUM(CASE WHEN DATE(order_date) = CURDATE() THEN total_amount ELSE 0 END), 0) as today,
-                COALESCE(SUM(CASE WHEN order_date >= DATE_SUB(CURDATE(), INTERVAL 7 DAY) THEN total_amount ELSE 0 END), 0) as week,
-                COALESCE(SUM(CASE WHEN MONTH(order_date) = MONTH(CURDATE()) AND YEAR(order_date) = YEAR(CURDATE()) THEN total_amount ELSE 0 END), 0) as month,
-                COALESCE(SUM(total_amount), 0) as total
-            FROM orders
+                (SELECT COALESCE(SUM(gross_revenue), 0) FROM sales_daily_rollup
+                 WHERE sale_date = CURDATE()) as today,
+                (SELECT COALESCE(SUM(gross_revenue), 0) FROM sales_daily_rollup
+                 WHERE sale_date >= DATE_SUB(CURDATE(), INTERVAL 7 DAY)) as week,
+                (SELECT COALESCE(SUM(gross_revenue), 0) FROM sales_monthly_rollup
+                 WHERE sale_month = DATE_FORMAT(CURDATE(), '%Y-%m-01')) as month,
+                (SELECT COALESCE(SUM(gross_revenue), 0) FROM sales_monthly_rollup) as total
         """, fetch=True)
         
         if result and len(result) > 0:
@@ -297,17 +2304,21 @@ def api_revenue_summary():
         })
 
 # Best Sellers
+@cached_loader('best_sellers', tags=('orders', 'product'))
+def load_best_sellers():
+    return execute_query("""
+        SELECT p.name, COUNT(*) as total_qty
+        FROM orders o
+        JOIN product p ON p.product_id = o.product_id
+        GROUP BY p.name, p.product_id
+        ORDER BY total_qty DESC
+        LIMIT 10
+    """, fetch=True)
+
 @app.route('/api/admin/dashboard/best-sellers')
 def best_sellers():
     try:
-        result = execute_query("""
-            SELECT p.name, COUNT(*) as total_qty
-            FROM orders o
-            JOIN product p ON p.product_id = o.product_id
-            GROUP BY p.name, p.product_id
-            ORDER BY total_qty DESC
-            LIMIT 10
-        """, fetch=True)
+        result = load_best_sellers()
         return jsonify(result)
     except Exception as e:
         print(f"Best sellers error: {e}")
@@ -357,6 +2368,7 @@ def api_add_product():
             
             # Commit the transaction
             conn.commit()
+            invalidate_cache('product')
             
             print(f"✅ Product inserted successfully with ID: {product_id}")
             
@@ -367,6 +2379,10 @@ def api_add_product():
             cursor.close()
             conn.close()
             
+            publish_kpi_delta(products=1)
+            if new_product:
+                publish_stock_levels([new_product])
+            
             return jsonify({'success': True, 'product_id': product_id, 'product': new_product})
             
         except Exception as e:
@@ -421,6 +2437,7 @@ def api_update_product(id):
             
             # Commit the transaction
             conn.commit()
+            invalidate_cache('product')
             
             print(f"✅ Product updated successfully")
             
@@ -431,6 +2448,9 @@ def api_update_product(id):
             cursor.close()
             conn.close()
             
+            if updated_product:
+                publish_stock_levels([updated_product])
+            
             return jsonify({'success': True, 'product': updated_product})
             
         except Exception as e:
@@ -447,11 +2467,24 @@ def api_update_product(id):
         traceback.print_exc()
         return jsonify({'success': False, 'error': error_msg})
 
+# Foreign-key violations; the guard triggers on the partitioned orders table raise the same errnos
+ROW_IS_REFERENCED_ERRNO = 1451
+NO_REFERENCED_ROW_ERRNO = 1452
+
 @app.route('/api/admin/products/<int:id>', methods=['DELETE'])
 def api_delete_product(id):
     try:
         execute_query("DELETE FROM product WHERE product_id=%s", (id,))
+        invalidate_cache('product')
+        publish_kpi_delta(products=-1)
+        publish_stock_levels([{'product_id': id}], deleted=True)
         return jsonify({'success': True})
+    except Error as e:
+        if e.errno == ROW_IS_REFERENCED_ERRNO:
+            return jsonify({'success': False, 'error': 'Product is still referenced (e.g. by orders) and cannot be deleted',
+                            'code': 'product_referenced'}), 409
+        print(f"Delete product error: {e}")
+        return jsonify({'success': False, 'error': str(e)})
     except Exception as e:
         print(f"Delete product error: {e}")
         return jsonify({'success': False, 'error': str(e)})
@@ -534,37 +2567,174 @@ def api_delete_seller(id):
         print(f"Delete seller error: {e}")
         return jsonify({'success': False, 'error': str(e)})
 
-# ---------- Orders ----------
-@app.route('/api/admin/orders', methods=['GET'])
-def api_orders():
-    """Get orders using optimized view"""
-    try:
-        # Use the v_order_details view for better performance
-        orders = execute_query("""
-            SELECT *, DATE_FORMAT(order_date, '%Y-%m-%d') as date
-            FROM v_order_details
-            ORDER BY order_date DESC
-        """, fetch=True)
-        
-        result = []
+# ---------- Date Windows (partition pruning) ----------
+def parse_report_date(value, end=False):
+    """Parse 'YYYY-MM-DD' or 'YYYY-MM' into a date; a month end bound means its last day"""
+    if len(value) == 7:
+        first = datetime.strptime(value, '%Y-%m').date()
+        if not end:
+            return first
+        return (first.replace(day=28) + timedelta(days=4)).replace(day=1) - timedelta(days=1)
+    return datetime.strptime(value[:10], '%Y-%m-%d').date()
+
+def date_range_clause(column, start=None, end=None):
+    """Half-open window `column >= start AND column < end + 1 day` over inclusive calendar days.
+    Comparing the bare column keeps index range scans and lets MySQL prune the monthly
+    partitions of orders/activity_log; DATE(column) BETWEEN ... would read every partition.
+    Returns (sql, params); sql is '1=1' when neither bound is given."""
+    clauses, params = [], []
+    if start:
+        clauses.append(f"{column} >= %s")
+        params.append(parse_report_date(start))
+    if end:
+        clauses.append(f"{column} < %s")
+        params.append(parse_report_date(end, end=True) + timedelta(days=1))
+    return ' AND '.join(clauses) or '1=1', params
+
+# ---------- Orders ----------
+ORDERS_PAGE_SIZE = 50
+ORDERS_PAGE_MAX = 200
+ORDER_IDS_PAGE_MAX = 1000
+
+def order_items(order, name_key='name'):
+    """Create items array from order data (one product per order row)"""
+    if order.get('product_id') and order.get('product_name'):
+        return [{
+            name_key: order.get('product_name', 'N/A'),
+            'category': order.get('product_category', 'N/A'),
+            'qty': 1,  # Default quantity since it's not in orders table
+            'price': float(order.get('product_price', order.get('total_amount', 0)))
+        }]
+    return []
+
+def encode_cursor(values):
+    """Encode keyset values as an opaque URL-safe continuation token"""
+    raw = json.dumps([str(v) for v in values]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    """Decode a continuation token produced by encode_cursor"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor')
+    if not isinstance(values, list):
+        raise ValueError('Invalid cursor')
+    return values
+
+@app.route('/api/admin/orders/ids', methods=['GET'])
+def api_order_ids():
+    """Get one page of order ids, newest first, keyset-paginated on order_id (for bulk actions)"""
+    try:
+        limit = min(max(int(request.args.get('limit', ORDER_IDS_PAGE_MAX)), 1), ORDER_IDS_PAGE_MAX)
+        cursor = request.args.get('cursor')
+
+        query = "SELECT order_id FROM orders"
+        params = []
+        if cursor:
+            query += " WHERE order_id < %s"
+            params.append(int(decode_cursor(cursor)[0]))
+        query += " ORDER BY order_id DESC LIMIT %s"
+        params.append(limit + 1)
+
+        rows = execute_query(query, tuple(params), fetch=True)
+        has_more = len(rows) > limit
+        order_ids = [r['order_id'] for r in rows[:limit]]
+
+        return jsonify({
+            'success': True,
+            'order_ids': order_ids,
+            'next_cursor': encode_cursor([order_ids[-1]]) if has_more and order_ids else None,
+            'has_more': has_more
+        })
+    except (ValueError, IndexError):
+        return jsonify({'success': False, 'error': 'Invalid cursor or limit'}), 400
+    except Exception as e:
+        print(f"Order ids error: {e}")
+        return jsonify({'success': False, 'error': str(e)})
+
+def order_update_cache_tags(status=None, shipping_status=None):
+    """Cache tags touched by an order status/shipping update"""
+    tags = ['orders:status']
+    # trg_after_order_update restores stock for cancelled/returned orders
+    if status == 'Cancelled' or shipping_status == 'Returned':
+        tags.append('product')
+    return tags
+
+@app.route('/api/admin/orders/feed', methods=['GET'])
+def api_orders_feed():
+    """Get one page of orders, newest first, keyset-paginated on (order_date, order_id)"""
+    try:
+        limit = min(max(int(request.args.get('limit', ORDERS_PAGE_SIZE)), 1), ORDERS_PAGE_MAX)
+        cursor = request.args.get('cursor')
+        status = request.args.get('status')
+        shipping_status = request.args.get('shipping_status')
+        customer = request.args.get('customer', '').strip()
+        from_date = request.args.get('from')
+        to_date = request.args.get('to')
+
+        query = """
+            SELECT *, DATE_FORMAT(order_date, '%Y-%m-%d') as date
+            FROM v_order_details
+            WHERE 1=1
+        """
+        params = []
+
+        if status and status != 'all':
+            query += " AND status = %s"
+            params.append(status)
+
+        if shipping_status and shipping_status != 'all':
+            query += " AND shipping_status = %s"
+            params.append(shipping_status)
+
+        if customer:
+            if customer.isdigit():
+                query += " AND customer_id = %s"
+                params.append(int(customer))
+            else:
+                query += " AND customer_name LIKE %s"
+                params.append(customer + '%')
+
+        if from_date or to_date:
+            window, window_params = date_range_clause('order_date', from_date, to_date)
+            query += " AND " + window
+            params.extend(window_params)
+
+        if cursor:
+            last_date, last_id = decode_cursor(cursor)
+            query += " AND (order_date < %s OR (order_date = %s AND order_id < %s))"
+            params.extend([last_date, last_date, int(last_id)])
+
+        # Fetch one extra row to know whether another page exists
+        query += " ORDER BY order_date DESC, order_id DESC LIMIT %s"
+        params.append(limit + 1)
+
+        orders = execute_query(query, tuple(params), fetch=True)
+        has_more = len(orders) > limit
+        orders = orders[:limit]
         for o in orders:
-            # Create items array from order data
-            if o.get('product_id') and o.get('product_name'):
-                o['items'] = [{
-                    'name': o.get('product_name', 'N/A'),
-                    'category': o.get('product_category', 'N/A'),
-                    'qty': 1,  # Default quantity since it's not in orders table
-                    'price': float(o.get('product_price', o.get('total_amount', 0)))
-                }]
-            else:
-                o['items'] = []
-            result.append(o)
-        return jsonify(result)
+            o['items'] = order_items(o)
+
+        next_cursor = None
+        if has_more and orders:
+            next_cursor = encode_cursor([orders[-1]['order_date'], orders[-1]['order_id']])
+
+        return jsonify({
+            'success': True,
+            'orders': orders,
+            'next_cursor': next_cursor,
+            'has_more': has_more,
+            'limit': limit
+        })
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
-        print(f"Orders fetch error: {e}")
+        print(f"Orders feed error: {e}")
         import traceback
         traceback.print_exc()
-        return jsonify([])
+        return jsonify({'success': False, 'error': str(e)})
 
 @app.route('/api/admin/orders/<int:id>', methods=['PUT'])
 def api_update_order_status(id):
@@ -589,21 +2759,90 @@ def api_update_order_status(id):
         if not updates:
             return jsonify({'success': False, 'error': 'No fields to update'})
         
-        params.append(id)
-        query = f"UPDATE orders SET {', '.join(updates)}, last_updated = NOW() WHERE order_id = %s"
-        execute_query(query, tuple(params))
+        update_orders_audited([id], f"{', '.join(updates)}, last_updated = NOW()", params,
+                              status=data.get('status'), shipping_status=data.get('shipping_status'))
+        invalidate_cache(*order_update_cache_tags(data.get('status'), data.get('shipping_status')))
         return jsonify({'success': True})
     except Exception as e:
         print(f"Update order status error: {e}")
         return jsonify({'success': False, 'error': str(e)})
 
+# SQLSTATEs signalled by sp_process_order
+OUT_OF_STOCK_SQLSTATE = '45001'
+PRODUCT_NOT_FOUND_SQLSTATE = '45002'
+CUSTOMER_NOT_FOUND_SQLSTATE = '45003'
+
+@app.route('/api/admin/orders', methods=['POST'])
+def api_place_order():
+    """Place an order through sp_process_order (stock, order and payment in one transaction)"""
+    try:
+        data = request.json or {}
+        try:
+            customer_id = int(data['customer_id'])
+            product_id = int(data['product_id'])
+            total_amount = data.get('total_amount')
+            total_amount = Decimal(str(total_amount)) if total_amount not in (None, '') else None
+        except (KeyError, TypeError, ValueError, ArithmeticError):
+            return jsonify({'success': False, 'error': 'customer_id and product_id are required; total_amount must be a number'}), 400
+        
+        def place():
+            mark_outbox_session()
+            return call_procedure('sp_process_order', (customer_id, product_id, total_amount),
+                                  self_committing=True)
+        
+        # The procedure owns its whole transaction, so deadlocks/lock waits can be
+        # re-run safely; a connection lost after the CALL was sent is not retried
+        try:
+            rows = run_with_retry(place)
+        finally:
+            clear_outbox_session()
+        order = rows[0] if rows else {}
+        if order:
+            outbox.add_many(order_placed_events(order['order_id'], customer_id))
+            total = order.get('total_amount') or 0
+            publish_kpi_delta(orders=1, revenue=total, orders_today=1, revenue_today=total)
+            publish_stock_levels([{'product_id': product_id, 'quantityavailable': order.get('remaining_stock')}])
+        invalidate_cache('orders', 'orders:status', 'product', f'customer:{customer_id}')
+        return jsonify({'success': True, 'order': order}), 201
+    except Error as e:
+        if e.sqlstate == OUT_OF_STOCK_SQLSTATE:
+            return jsonify({'success': False, 'error': 'Product out of stock', 'code': 'out_of_stock'}), 409
+        if e.sqlstate == PRODUCT_NOT_FOUND_SQLSTATE:
+            return jsonify({'success': False, 'error': 'Product not found', 'code': 'product_not_found'}), 404
+        if e.sqlstate == CUSTOMER_NOT_FOUND_SQLSTATE:
+            return jsonify({'success': False, 'error': 'Customer not found', 'code': 'customer_not_found'}), 404
+        if isinstance(e, CommitOutcomeUnknown):
+            # The order may exist; check the order list before placing it again
+            invalidate_cache('orders', 'orders:status', 'product', f'customer:{customer_id}')
+            return jsonify({'success': False, 'error': str(e), 'code': 'outcome_unknown'}), 503
+        print(f"Place order error: {e}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({'success': False, 'error': str(e)}), 500
+    except Exception as e:
+        print(f"Place order error: {e}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 # ---------- Customers ----------
+# Stored stats columns on customer (kept by the order/return triggers and
+# sp_update_customer_segments), so listings never aggregate orders
+CUSTOMER_SUMMARY_COLUMNS = """
+    customer_id, name, email, phone, blocked,
+    COALESCE(total_orders, 0) as total_orders,
+    COALESCE(lifetime_value, 0) as lifetime_value,
+    COALESCE(avg_order_value, 0) as avg_order_value,
+    last_order_date,
+    COALESCE(segment, 'New') as segment
+"""
+
 @app.route('/api/admin/customers', methods=['GET'])
 def api_customers():
-    """Get customers using optimized view with pre-calculated stats"""
+    """Get customers with their stored stats and segment"""
     try:
-        # Use v_customer_summary view which includes all calculated fields
-        customers = execute_query("SELECT * FROM v_customer_summary ORDER BY lifetime_value DESC", fetch=True)
+        customers = execute_query(f"SELECT {CUSTOMER_SUMMARY_COLUMNS} FROM customer ORDER BY lifetime_value DESC",
+                                  fetch=True)
         return jsonify(customers)
     except Exception as e:
         print(f"Customers fetch error: {e}")
@@ -614,8 +2853,11 @@ def api_customers():
 @app.route('/api/admin/customers/<int:id>/toggle', methods=['PUT'])
 def api_toggle_customer(id):
     try:
-        blocked = execute_query("SELECT blocked FROM customer WHERE customer_id=%s", (id,), fetch=True)[0]['blocked']
-        execute_query("UPDATE customer SET blocked=%s WHERE customer_id=%s", (0 if blocked else 1, id))
+        def toggle():
+            blocked = execute_query("SELECT blocked FROM customer WHERE customer_id=%s FOR UPDATE", (id,), fetch=True)[0]['blocked']
+            execute_query("UPDATE customer SET blocked=%s WHERE customer_id=%s", (0 if blocked else 1, id))
+        retry_transaction(toggle)
+        invalidate_cache(f'customer:{id}')
         return jsonify({'success': True})
     except Exception as e:
         print(f"Toggle customer error: {e}")
@@ -629,8 +2871,9 @@ def api_sales_by_category_report():
         from_date = request.args.get('from')
         to_date = request.args.get('to')
         
-        # Build query with optional date filter
-        query = """
+        # Optional date filter, pruned to the matching order partitions
+        window, params = date_range_clause('o.order_date', from_date, to_date)
+        query = f"""
             SELECT 
                 p.category,
                 COUNT(DISTINCT o.order_id) as order_count,
@@ -639,28 +2882,9 @@ def api_sales_by_category_report():
                 AVG(o.total_amount) as avg_price
             FROM orders o
             JOIN product p ON p.product_id = o.product_id
-            WHERE 1=1
+            WHERE {window}
+            GROUP BY p.category ORDER BY revenue DESC
         """
-        params = []
-        
-        if from_date:
-            if len(from_date) == 7:
-                from_date = f"{from_date}-01"
-            query += " AND o.order_date >= %s"
-            params.append(from_date)
-        
-        if to_date:
-            if len(to_date) == 7:
-                year, month = map(int, to_date.split('-'))
-                if month == 12:
-                    last_day = datetime(year + 1, 1, 1) - timedelta(days=1)
-                else:
-                    last_day = datetime(year, month + 1, 1) - timedelta(days=1)
-                to_date = last_day.strftime('%Y-%m-%d')
-            query += " AND o.order_date <= %s"
-            params.append(to_date)
-        
-        query += " GROUP BY p.category ORDER BY revenue DESC"
         
         result = execute_query(query, tuple(params) if params else None, fetch=True)
         return jsonify({'success': True, 'data': result})
@@ -677,35 +2901,25 @@ def api_revenue_report():
     to_date = request.args.get('to')
     
     try:
-        # Convert month format (YYYY-MM) to date range
-        if from_date and len(from_date) == 7:  # Format: YYYY-MM
-            from_date = f"{from_date}-01"
-        if to_date and len(to_date) == 7:  # Format: YYYY-MM
-            # Get last day of the month
-            year, month = map(int, to_date.split('-'))
-            if month == 12:
-                last_day = datetime(year + 1, 1, 1) - timedelta(days=1)
-            else:
-                last_day = datetime(year, month + 1, 1) - timedelta(days=1)
-            to_date = last_day.strftime('%Y-%m-%d')
-        
-        # Get total revenue for the period
-        total_revenue = execute_query("""
-            SELECT COALESCE(SUM(total_amount), 0) as total_revenue 
-            FROM orders 
-            WHERE order_date >= %s AND order_date <= %s
-        """, (from_date, to_date), fetch=True)[0]['total_revenue'] or 0
-        
-        # Get monthly breakdown
-        monthly_data = execute_query("""
-            SELECT DATE_FORMAT(order_date, '%Y-%m') as month, 
-                   COALESCE(SUM(total_amount), 0) as total,
-                   COUNT(*) as order_count
-            FROM orders 
-            WHERE order_date >= %s AND order_date <= %s
+        if not (from_date and to_date):
+            raise ValueError('from and to are required')
+        # Month (YYYY-MM) or day bounds, as a half-open range on the rollup key
+        window, params = date_range_clause('sale_date', from_date, to_date)
+        
+        # Get monthly breakdown from the daily rollup (at most ~31 rows per month),
+        # so partial months at either end of the range stay exact
+        monthly_data = execute_query(f"""
+            SELECT DATE_FORMAT(sale_date, '%Y-%m') as month, 
+                   COALESCE(SUM(gross_revenue), 0) as total,
+                   COALESCE(SUM(order_count), 0) as order_count
+            FROM sales_daily_rollup 
+            WHERE {window} AND order_count > 0
             GROUP BY month
             ORDER BY month
-        """, (from_date, to_date), fetch=True)
+        """, tuple(params), fetch=True)
+        
+        # Total revenue for the period
+        total_revenue = sum(row['total'] or 0 for row in monthly_data)
         
         return jsonify({
             'total_revenue': float(total_revenue),
@@ -720,6 +2934,22 @@ def api_revenue_report():
             'monthly_data': []
         })
 
+@app.route('/api/admin/reports/rollups/rebuild', methods=['POST'])
+def api_rebuild_sales_rollups():
+    """Rebuild the day/month sales rollups from orders (whole history or a date range)"""
+    try:
+        data = request.get_json(silent=True) or {}
+        from_date = data.get('from') or None
+        to_date = data.get('to') or None
+        result = retry_transaction(call_procedure, 'sp_rebuild_sales_rollups', (from_date, to_date))
+        invalidate_cache('orders')
+        return jsonify({'success': True, **(result[0] if result else {})})
+    except Exception as e:
+        print(f"Rebuild sales rollups error: {e}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({'success': False, 'error': str(e)})
+
 # ---------- Notifications ----------
 @app.route('/api/admin/notifications')
 def api_notifications():
@@ -762,32 +2992,14 @@ def api_activity_log():
 # ---------- Performance Metrics ----------
 @app.route('/api/admin/metrics')
 def api_performance_metrics():
-    """Get performance metrics using optimized queries with pre-calculated values"""
+    """Get performance metrics from the shared dashboard snapshot"""
     try:
-        # Use customer view which has lifetime_value already calculated by triggers
-        total_visitors = execute_query("SELECT COUNT(*) as total_visitors FROM customer", fetch=True)[0]['total_visitors']
-        total_orders = execute_query("SELECT COUNT(*) as total_orders FROM orders", fetch=True)[0]['total_orders']
-        conversion_rate = (total_orders / total_visitors * 100) if total_visitors > 0 else 0
-        
-        # Average order value
-        avg_order_value = execute_query("SELECT AVG(total_amount) as avg_order_value FROM orders", fetch=True)[0]['avg_order_value'] or 0
-        
-        # Customer lifetime value (now auto-calculated by triggers)
-        avg_lifetime_value = execute_query("SELECT AVG(lifetime_value) as avg_lifetime_value FROM customer WHERE lifetime_value IS NOT NULL", fetch=True)
-        avg_lifetime_value = avg_lifetime_value[0]['avg_lifetime_value'] if avg_lifetime_value and avg_lifetime_value[0].get('avg_lifetime_value') else 0
-        
-        # Recent orders (last 24 hours)
-        recent_orders = execute_query("""
-            SELECT COUNT(*) as recent_orders 
-            FROM orders 
-            WHERE order_date >= DATE_SUB(NOW(), INTERVAL 24 HOUR)
-        """, fetch=True)[0]['recent_orders']
-        
+        snapshot = get_dashboard_snapshot()
         return jsonify({
-            'conversion_rate': round(conversion_rate, 2),
-            'avg_order_value': round(float(avg_order_value), 2),
-            'avg_lifetime_value': round(float(avg_lifetime_value), 2),
-            'recent_orders': recent_orders
+            'conversion_rate': snapshot['conversion_rate'],
+            'avg_order_value': snapshot['avg_order_value'],
+            'avg_lifetime_value': snapshot['avg_lifetime_value'],
+            'recent_orders': snapshot['recent_orders']
         })
     except Exception as e:
         print(f"Performance metrics error: {e}")
@@ -835,22 +3047,26 @@ def api_product_analytics(id):
         return jsonify({})
 
 # ---------- Customer Segmentation ----------
+@cached_loader('customer_segments', tags=('orders', 'customer'))
+def load_customer_segments():
+    # Stored segment column; idx_customer_segment covers the whole aggregate
+    return execute_query("""
+        SELECT 
+            COALESCE(segment, 'New') as segment, 
+            COUNT(*) as count, 
+            COALESCE(AVG(lifetime_value), 0) as avg_value,
+            COALESCE(SUM(lifetime_value), 0) as total_value,
+            COALESCE(AVG(total_orders), 0) as avg_orders
+        FROM customer 
+        GROUP BY COALESCE(segment, 'New')
+        ORDER BY avg_value DESC
+    """, fetch=True)
+
 @app.route('/api/admin/customers/segments')
 def api_customer_segments():
-    """Get customer segments using view with pre-calculated segment field"""
+    """Get customer segments from the stored segment column"""
     try:
-        # Use v_customer_summary view which already has segment calculated
-        segments = execute_query("""
-            SELECT 
-                COALESCE(segment, 'New') as segment, 
-                COUNT(*) as count, 
-                COALESCE(AVG(lifetime_value), 0) as avg_value,
-                COALESCE(SUM(lifetime_value), 0) as total_value,
-                COALESCE(AVG(total_orders), 0) as avg_orders
-            FROM v_customer_summary 
-            GROUP BY segment
-            ORDER BY avg_value DESC
-        """, fetch=True)
+        segments = load_customer_segments()
         return jsonify(segments)
     except Exception as e:
         print(f"Customer segments error: {e}")
@@ -860,24 +3076,45 @@ def api_customer_segments():
 
 @app.route('/api/admin/customers/update-segments', methods=['POST'])
 def api_update_customer_segments():
-    """Manually trigger customer segment update using stored procedure"""
+    """Refresh stored customer segments: customers touched since the last run,
+    or everyone with {"full": true}"""
     try:
-        execute_query("CALL sp_update_customer_segments()", fetch=False)
-        return jsonify({'success': True, 'message': 'Customer segments updated successfully'})
+        data = request.get_json(silent=True) or {}
+        full = bool(data.get('full'))
+        result = run_with_retry(call_procedure, 'sp_update_customer_segments', (full,))
+        invalidate_cache('customer')
+        return jsonify({'success': True, 'message': 'Customer segments updated successfully',
+                        **(result[0] if result else {})})
     except Exception as e:
         print(f"Update customer segments error: {e}")
         return jsonify({'success': False, 'error': str(e)})
 
+@app.route('/api/admin/customers/reconcile-aggregates', methods=['POST'])
+def api_reconcile_customer_aggregates():
+    """Verify (and by default repair) trigger-maintained customer aggregates"""
+    try:
+        data = request.get_json(silent=True) or {}
+        repair = bool(data.get('repair', True))
+        result = call_procedure('sp_reconcile_customer_aggregates', (repair,))
+        drifted = int(result[0]['drifted_customers']) if result else 0
+        if repair and drifted:
+            invalidate_cache('customer')
+        return jsonify({'success': True, 'drifted_customers': drifted, 'repaired': repair and drifted > 0})
+    except Exception as e:
+        print(f"Reconcile customer aggregates error: {e}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({'success': False, 'error': str(e)})
+
 # ---------- Order Tracking ----------
 @app.route('/api/admin/orders/<int:id>/tracking', methods=['PUT'])
 def api_update_order_tracking(id):
     try:
         data = request.json
-        execute_query("""
-            UPDATE orders 
-            SET shipping_status = %s, tracking_number = %s, last_updated = NOW()
-            WHERE order_id = %s
-        """, (data['shipping_status'], data.get('tracking_number'), id))
+        update_orders_audited([id], "shipping_status = %s, tracking_number = %s, last_updated = NOW()",
+                              (data['shipping_status'], data.get('tracking_number')),
+                              shipping_status=data['shipping_status'])
+        invalidate_cache(*order_update_cache_tags(shipping_status=data['shipping_status']))
         return jsonify({'success': True})
     except Exception as e:
         print(f"Update order tracking error: {e}")
@@ -891,12 +3128,8 @@ def api_bulk_update_orders():
         order_ids = data['order_ids']
         status = data['status']
         
-        placeholders = ','.join(['%s'] * len(order_ids))
-        execute_query(f"""
-            UPDATE orders 
-            SET status = %s, last_updated = NOW()
-            WHERE order_id IN ({placeholders})
-        """, [status] + order_ids)
+        update_orders_audited(order_ids, "status = %s, last_updated = NOW()", (status,), status=status)
+        invalidate_cache(*order_update_cache_tags(status))
         return jsonify({'success': True})
     except Exception as e:
         print(f"Bulk update orders error: {e}")
@@ -930,16 +3163,43 @@ def api_returns():
         print(f"Returns error: {e}")
         return jsonify([])
 
+# Return statuses trg_after_return_insert/update count against customer.lifetime_value
+REFUNDED_RETURN_STATUSES = ('Approved', 'Refunded')
+
+def return_cache_tags(customer_id, *statuses):
+    """Cache tags touched by a return created with, or moved between, these statuses"""
+    tags = ['returns']
+    if any(status in REFUNDED_RETURN_STATUSES for status in statuses):
+        tags += ['customer', f'customer:{customer_id}']
+    return tags
+
 @app.route('/api/admin/returns', methods=['POST'])
 def api_create_return():
     try:
         data = request.json
-        execute_query("""
-            INSERT INTO returns_refunds (order_id, product_id, customer_id, reason, status, refund_amount)
-            VALUES (%s, %s, %s, %s, %s, %s)
-        """, (data['order_id'], data['product_id'], data['customer_id'], 
-              data['reason'], data['status'], data['refund_amount']))
+        
+        def insert_return():
+            mark_outbox_session()
+            execute_query("""
+                INSERT INTO returns_refunds (order_id, product_id, customer_id, reason, status, refund_amount)
+                VALUES (%s, %s, %s, %s, %s, %s)
+            """, (data['order_id'], data['product_id'], data['customer_id'], 
+                  data['reason'], data['status'], data['refund_amount']))
+            return execute_query("SELECT LAST_INSERT_ID() AS id", fetch=True)[0]['id']
+        
+        try:
+            return_id = retry_transaction(insert_return)
+        finally:
+            clear_outbox_session()
+        outbox.add_many(return_created_events(return_id, data['order_id'], data['customer_id']))
+        invalidate_cache(*return_cache_tags(data['customer_id'], data['status']))
         return jsonify({'success': True})
+    except Error as e:
+        if e.errno == NO_REFERENCED_ROW_ERRNO:
+            # Unknown order_id (guard trigger) or product/customer (foreign keys)
+            return jsonify({'success': False, 'error': str(e), 'code': 'reference_not_found'}), 400
+        print(f"Create return error: {e}")
+        return jsonify({'success': False})
     except Exception as e:
         print(f"Create return error: {e}")
         return jsonify({'success': False})
@@ -954,10 +3214,36 @@ def api_update_return_status(id):
         if status not in ['Requested', 'Approved', 'Rejected', 'Refunded']:
             return jsonify({'success': False, 'error': 'Invalid status'})
         
-        execute_query(
-            "UPDATE returns_refunds SET status = %s WHERE id = %s",
-            (status, id)
-        )
+        def lock_and_update():
+            mark_outbox_session()
+            before = execute_query("""
+                SELECT rr.id, rr.order_id, rr.customer_id, rr.status, rr.refund_amount,
+                       o.customer_id AS order_customer_id, o.status AS order_status,
+                       o.shipping_status AS order_shipping_status
+                FROM returns_refunds rr
+                JOIN orders o ON o.order_id = rr.order_id
+                WHERE rr.id = %s
+                FOR UPDATE
+            """, (id,), fetch=True)
+            execute_query(
+                "UPDATE returns_refunds SET status = %s WHERE id = %s",
+                (status, id)
+            )
+            return before
+        
+        try:
+            before = retry_transaction(lock_and_update)
+        finally:
+            clear_outbox_session()
+        if not before:
+            invalidate_cache('returns')
+            return jsonify({'success': True})
+        outbox.add_many(return_status_events(before[0], status))
+        tags = return_cache_tags(before[0]['customer_id'], before[0]['status'], status)
+        if status == 'Approved':
+            # trg_after_return_update marks the order returned and restores stock
+            tags += order_update_cache_tags(shipping_status='Returned')
+        invalidate_cache(*tags)
         return jsonify({'success': True})
     except Exception as e:
         print(f"Update return status error: {e}")
@@ -968,13 +3254,13 @@ def api_update_return_status(id):
 def api_sales_forecast():
     try:
         historical_data = execute_query("""
-            SELECT DATE_FORMAT(order_date, '%Y-%m') as month, 
-                   SUM(total_amount) as revenue,
-                   COUNT(*) as orders
-            FROM orders 
-            WHERE order_date >= DATE_SUB(NOW(), INTERVAL 12 MONTH)
-            GROUP BY month
-            ORDER BY month
+            SELECT DATE_FORMAT(sale_month, '%Y-%m') as month, 
+                   gross_revenue as revenue,
+                   order_count as orders
+            FROM sales_monthly_rollup 
+            WHERE sale_month >= DATE_FORMAT(DATE_SUB(CURDATE(), INTERVAL 12 MONTH), '%Y-%m-01')
+              AND order_count > 0
+            ORDER BY sale_month
         """, fetch=True)
         return jsonify(historical_data)
     except Exception as e:
@@ -1010,12 +3296,158 @@ def api_bulk_delete_products():
         
         placeholders = ','.join(['%s'] * len(product_ids))
         execute_query(f"DELETE FROM product WHERE product_id IN ({placeholders})", product_ids)
+        invalidate_cache('product')
         
         return jsonify({'success': True, 'deleted_count': len(product_ids)})
     except Exception as e:
         print(f"Bulk delete products error: {e}")
         return jsonify({'success': False, 'error': str(e)})
 
+PRODUCT_PATCH_FIELDS = {
+    # request field -> (product column, temp column, converter)
+    'stock': ('quantityavailable', 'new_stock', int),
+    'price': ('price', 'new_price', float),
+    'category': ('category', 'new_category', str),
+}
+PRODUCT_PATCH_MAX_ROWS = 50000
+PRODUCT_PATCH_MAX_REPORTED_ERRORS = 100
+
+def _validate_product_patches(updates):
+    """Normalise patch rows; returns (rows keyed by product_id, errors)"""
+    rows = {}
+    errors = []
+    for index, update in enumerate(updates):
+        try:
+            if update.get('product_id') is None:
+                raise ValueError('Missing product_id')
+            product_id = int(update['product_id'])
+            row = {}
+            for field, (_, _, convert) in PRODUCT_PATCH_FIELDS.items():
+                if update.get(field) is not None:
+                    row[field] = convert(update[field])
+            if not row:
+                raise ValueError('No stock, price or category given')
+            if row.get('stock', 0) < 0 or row.get('price', 0) < 0:
+                raise ValueError('Stock and price must not be negative')
+            if 'category' in row and not row['category'].strip():
+                raise ValueError('Category must not be empty')
+            # Later entries for the same product win
+            rows.setdefault(product_id, {}).update(row)
+        except (AttributeError, TypeError, ValueError) as e:
+            errors.append({'index': index, 'error': str(e)})
+    return rows, errors
+
+def bulk_patch_products(rows):
+    """Apply stock/price/category patches with a constant number of round trips.
+
+    The patches are loaded into a temporary table with one multi-row INSERT,
+    the rows that actually change are read (and locked) with one join, and
+    one UPDATE ... JOIN applies them, all inside a single transaction.
+    trg_after_product_update therefore fires only for rows that change.
+    """
+    changed_condition = ' OR '.join(
+        f"(t.{temp_col} IS NOT NULL AND NOT (t.{temp_col} <=> p.{col}))"
+        for col, temp_col, _ in PRODUCT_PATCH_FIELDS.values()
+    )
+
+    conn = get_db_connection()
+    cursor = conn.cursor(dictionary=True)
+    try:
+        conn.start_transaction()
+        cursor.execute("DROP TEMPORARY TABLE IF EXISTS tmp_product_patch")
+        cursor.execute("""
+            CREATE TEMPORARY TABLE tmp_product_patch (
+                product_id INT PRIMARY KEY,
+                new_stock INT NULL,
+                new_price DECIMAL(10,2) NULL,
+                new_category VARCHAR(255) NULL
+            ) ENGINE=MEMORY
+        """)
+        cursor.executemany(
+            "INSERT INTO tmp_product_patch (product_id, new_stock, new_price, new_category) VALUES (%s, %s, %s, %s)",
+            [(pid, r.get('stock'), r.get('price'), r.get('category')) for pid, r in rows.items()]
+        )
+
+        cursor.execute(f"""
+            SELECT t.product_id, p.product_id AS existing_id,
+                   p.quantityavailable, p.price, p.category,
+                   t.new_stock, t.new_price, t.new_category,
+                   ({changed_condition}) AS is_changed
+            FROM tmp_product_patch t
+            LEFT JOIN product p ON p.product_id = t.product_id
+            FOR UPDATE
+        """)
+        matched = cursor.fetchall()
+
+        cursor.execute(f"""
+            UPDATE product p
+            JOIN tmp_product_patch t ON t.product_id = p.product_id
+            SET p.quantityavailable = COALESCE(t.new_stock, p.quantityavailable),
+                p.price = COALESCE(t.new_price, p.price),
+                p.category = COALESCE(t.new_category, p.category)
+            WHERE {changed_condition}
+        """)
+        updated_rows = cursor.rowcount
+
+        cursor.execute("DROP TEMPORARY TABLE IF EXISTS tmp_product_patch")
+        commit_transaction(conn)
+    except Exception:
+        try:
+            conn.rollback()
+        except:
+            pass
+        raise
+    finally:
+        cursor.close()
+        conn.close()
+
+    changed = []
+    unchanged = []
+    not_found = []
+    for m in matched:
+        if m['existing_id'] is None:
+            not_found.append(m['product_id'])
+        elif not m['is_changed']:
+            unchanged.append(m['product_id'])
+        else:
+            changes = {}
+            for field, (col, temp_col, convert) in PRODUCT_PATCH_FIELDS.items():
+                if m[temp_col] is not None and m[temp_col] != m[col]:
+                    changes[field] = {'old': convert(m[col]) if m[col] is not None else None,
+                                      'new': convert(m[temp_col])}
+            changed.append({'product_id': m['product_id'], 'changes': changes})
+    publish_stock_levels([{'product_id': m['product_id'],
+                           'category': m['new_category'] if m['new_category'] is not None else m['category'],
+                           'price': m['new_price'] if m['new_price'] is not None else m['price'],
+                           'quantityavailable': m['new_stock']}
+                          for m in matched if m['is_changed'] and m['new_stock'] is not None])
+    return {'updated_rows': updated_rows, 'changed': changed, 'unchanged': unchanged, 'not_found': not_found}
+
+@app.route('/api/admin/bulk/products/patch', methods=['POST'])
+def api_bulk_patch_products():
+    """Apply many stock/price/category changes in one set-based transaction"""
+    try:
+        data = request.json
+        updates = data.get('updates', [])
+        
+        if not updates:
+            return jsonify({'success': False, 'error': 'No updates provided'})
+        if len(updates) > PRODUCT_PATCH_MAX_ROWS:
+            return jsonify({'success': False, 'error': f'At most {PRODUCT_PATCH_MAX_ROWS} updates per request'})
+        
+        rows, errors = _validate_product_patches(updates)
+        if errors:
+            return jsonify({'success': False, 'error': 'Invalid updates', 'errors': errors[:PRODUCT_PATCH_MAX_REPORTED_ERRORS]})
+        
+        result = run_with_retry(bulk_patch_products, rows)
+        if result['updated_rows']:
+            invalidate_cache('product')
+        
+        return jsonify({'success': True, **result})
+    except Exception as e:
+        print(f"Bulk patch products error: {e}")
+        return jsonify({'success': False, 'error': str(e)})
+
 @app.route('/api/admin/bulk/products/update-stock', methods=['POST'])
 def api_bulk_update_stock():
     try:
@@ -1025,13 +3457,22 @@ def api_bulk_update_stock():
         if not updates:
             return jsonify({'success': False, 'error': 'No updates provided'})
         
-        for update in updates:
-            execute_query(
-                "UPDATE product SET quantityavailable = %s WHERE product_id = %s",
-                (update['stock'], update['product_id'])
-            )
+        rows, errors = _validate_product_patches(
+            [{'product_id': u.get('product_id'), 'stock': u.get('stock')} for u in updates]
+        )
+        if errors:
+            return jsonify({'success': False, 'error': 'Invalid updates', 'errors': errors[:PRODUCT_PATCH_MAX_REPORTED_ERRORS]})
+        
+        result = run_with_retry(bulk_patch_products, rows)
+        if result['updated_rows']:
+            invalidate_cache('product')
         
-        return jsonify({'success': True, 'updated_count': len(updates)})
+        return jsonify({
+            'success': True,
+            'updated_count': len(result['changed']),
+            'unchanged': result['unchanged'],
+            'not_found': result['not_found']
+        })
     except Exception as e:
         print(f"Bulk update stock error: {e}")
         return jsonify({'success': False, 'error': str(e)})
@@ -1046,18 +3487,242 @@ def api_bulk_update_order_status():
         if not order_ids or not status:
             return jsonify({'success': False, 'error': 'Missing order IDs or status'})
         
-        placeholders = ','.join(['%s'] * len(order_ids))
-        execute_query(f"""
-            UPDATE orders 
-            SET status = %s, last_updated = NOW()
-            WHERE order_id IN ({placeholders})
-        """, [status] + order_ids)
+        update_orders_audited(order_ids, "status = %s, last_updated = NOW()", (status,), status=status)
+        invalidate_cache(*order_update_cache_tags(status))
         
         return jsonify({'success': True, 'updated_count': len(order_ids)})
     except Exception as e:
         print(f"Bulk update order status error: {e}")
         return jsonify({'success': False, 'error': str(e)})
 
+# ---------- Batch Order Ingestion ----------
+# Marketplace channels deliver orders in bursts. Each chunk is one transaction
+# that locks its products once, allocates stock for every order in input order
+# and applies the customer/rollup/alert/activity side effects set-based.
+# trg_after_order_insert skips its per-row work while @batch_ingest is set.
+ORDER_BATCH_MAX_ORDERS = 5000
+ORDER_BATCH_CHUNK_SIZE = 500
+CONSECUTIVE_AUTOINC_LOCK_MODES = (0, 1)   # multi-row INSERTs get consecutive ids
+
+order_ingest_state = {'autoinc_lock_mode': None}
+
+def _validate_batch_orders(orders):
+    """Normalise incoming orders; returns (valid orders, per-order rejections)"""
+    valid = []
+    rejected = []
+    for index, order in enumerate(orders):
+        ref = order.get('ref') if isinstance(order, dict) else None
+        try:
+            total = order.get('total_amount')
+            valid.append({
+                'index': index,
+                'ref': ref,
+                'customer_id': int(order['customer_id']),
+                'product_id': int(order['product_id']),
+                'total_amount': Decimal(str(total)) if total not in (None, '') else None,
+            })
+        except (AttributeError, KeyError, TypeError, ValueError, ArithmeticError):
+            rejected.append({'index': index, 'ref': ref, 'status': 'rejected', 'error': 'invalid'})
+    return valid, rejected
+
+def _insert_orders(cursor, rows):
+    """Insert order rows and return their ids in the same order"""
+    if order_ingest_state['autoinc_lock_mode'] is None:
+        cursor.execute("SELECT @@innodb_autoinc_lock_mode AS mode")
+        order_ingest_state['autoinc_lock_mode'] = int(cursor.fetchone()['mode'])
+    
+    if order_ingest_state['autoinc_lock_mode'] in CONSECUTIVE_AUTOINC_LOCK_MODES:
+        # One multi-row INSERT; its ids are first_id .. first_id + n - 1
+        cursor.execute(
+            "INSERT INTO orders (customer_id, product_id, total_amount, status, shipping_status, order_date) VALUES "
+            + ','.join(["(%s, %s, %s, 'Pending', 'Pending', %s)"] * len(rows)),
+            [value for row in rows for value in row]
+        )
+        first_id = cursor.lastrowid
+        return list(range(first_id, first_id + len(rows)))
+    
+    # Interleaved lock mode gives no such guarantee; still one transaction, no per-row triggers
+    order_ids = []
+    for row in rows:
+        cursor.execute(
+            "INSERT INTO orders (customer_id, product_id, total_amount, status, shipping_status, order_date) "
+            "VALUES (%s, %s, %s, 'Pending', 'Pending', %s)", row
+        )
+        order_ids.append(cursor.lastrowid)
+    return order_ids
+
+def ingest_order_chunk(orders):
+    """Allocate stock for and insert one chunk of orders in a single transaction.
+
+    Products are locked once with SELECT ... FOR UPDATE (in id order, so
+    concurrent chunks cannot deadlock on each other) and stock is handed out
+    in input order, so an order is rejected rather than oversold. Returns one
+    result per input order.
+    """
+    orders_by_index = {o['index']: o for o in orders}
+    product_ids = sorted({o['product_id'] for o in orders})
+    customer_ids = sorted({o['customer_id'] for o in orders})
+    product_marks = ','.join(['%s'] * len(product_ids))
+    customer_marks = ','.join(['%s'] * len(customer_ids))
+    
+    conn = get_db_connection()
+    cursor = conn.cursor(dictionary=True)
+    try:
+        conn.start_transaction()
+        cursor.execute("SET @batch_ingest = 1")
+        
+        cursor.execute(f"""
+            SELECT product_id, name, category, price, quantityavailable
+            FROM product
+            WHERE product_id IN ({product_marks})
+            ORDER BY product_id
+            FOR UPDATE
+        """, product_ids)
+        products = {p['product_id']: p for p in cursor.fetchall()}
+        cursor.execute(f"SELECT customer_id FROM customer WHERE customer_id IN ({customer_marks})", customer_ids)
+        customers = {c['customer_id'] for c in cursor.fetchall()}
+        
+        # Allocate stock in input order
+        stock = {pid: p['quantityavailable'] for pid, p in products.items()}
+        taken = defaultdict(int)
+        accepted = []
+        results = {}
+        for o in orders:
+            error = None
+            if o['customer_id'] not in customers:
+                error = 'customer_not_found'
+            elif o['product_id'] not in products:
+                error = 'product_not_found'
+            elif stock[o['product_id']] < 1:
+                error = 'out_of_stock'
+            if error:
+                results[o['index']] = {'index': o['index'], 'ref': o['ref'], 'status': 'rejected', 'error': error}
+                continue
+            stock[o['product_id']] -= 1
+            taken[o['product_id']] += 1
+            accepted.append(o)
+        
+        if accepted:
+            cursor.execute("SELECT NOW() AS now")
+            now = cursor.fetchone()['now']
+            
+            # One conditional stock UPDATE for the whole chunk
+            cases = ' '.join(['WHEN %s THEN %s'] * len(taken))
+            cursor.execute(f"""
+                UPDATE product
+                SET quantityavailable = quantityavailable - CASE product_id {cases} END
+                WHERE product_id IN ({','.join(['%s'] * len(taken))})
+            """, [v for pid, n in taken.items() for v in (pid, n)] + list(taken))
+            
+            totals = [o['total_amount'] if o['total_amount'] is not None else products[o['product_id']]['price']
+                      for o in accepted]
+            order_ids = _insert_orders(cursor, [
+                (o['customer_id'], o['product_id'], total, now) for o, total in zip(accepted, totals)
+            ])
+            cursor.executemany(
+                "INSERT INTO payments (order_id, customer_id, amount, payment_type, payment_status, payment_date) "
+                "VALUES (%s, %s, %s, 'payment', 'completed', %s)",
+                [(order_id, o['customer_id'], total, now) for order_id, o, total in zip(order_ids, accepted, totals)]
+            )
+            
+            # Side effects trg_after_order_insert would have applied row by row,
+            # folded per customer from the accepted orders. Single-table UPDATEs
+            # assign left to right, so the average reads the old total_orders.
+            deltas = {}
+            for o, total in zip(accepted, totals):
+                n, amount = deltas.get(o['customer_id'], (0, 0))
+                deltas[o['customer_id']] = (n + 1, amount + total)
+            cursor.executemany("""
+                UPDATE customer
+                SET avg_order_value = (COALESCE(avg_order_value, 0) * COALESCE(total_orders, 0) + %s)
+                                      / (COALESCE(total_orders, 0) + %s),
+                    total_orders = COALESCE(total_orders, 0) + %s,
+                    lifetime_value = COALESCE(lifetime_value, 0) + %s,
+                    last_order_date = GREATEST(COALESCE(last_order_date, %s), %s),
+                    stats_stale = TRUE
+                WHERE customer_id = %s
+            """, [(amount, n, n, amount, now, now, customer_id)
+                  for customer_id, (n, amount) in sorted(deltas.items())])
+            cursor.callproc('sp_apply_sales_delta', (now, len(order_ids), sum(totals), 0))
+            for result in cursor.stored_results():
+                result.fetchall()
+            cursor.execute(f"""
+                INSERT INTO inventory_alerts (product_id, alert_type, alert_status, created_at)
+                SELECT product_id, 'low_stock', 'pending', NOW()
+                FROM product
+                WHERE product_id IN ({','.join(['%s'] * len(taken))}) AND quantityavailable <= 10
+                ON DUPLICATE KEY UPDATE alert_status = 'pending', created_at = NOW()
+            """, list(taken))
+            
+            for order_id, o, total in zip(order_ids, accepted, totals):
+                results[o['index']] = {'index': o['index'], 'ref': o['ref'], 'status': 'created',
+                                       'order_id': order_id, 'total_amount': float(total)}
+        
+        commit_transaction(conn)
+    except Exception:
+        try:
+            conn.rollback()
+        except:
+            pass
+        raise
+    finally:
+        try:
+            cursor.execute("SET @batch_ingest = NULL")
+        except:
+            pass
+        cursor.close()
+        conn.close()
+    
+    # Committed: queue the per-order activity rows and push the live updates
+    created = [r for r in results.values() if r['status'] == 'created']
+    outbox.add_many([event for r in created
+                     for event in order_placed_events(r['order_id'], orders_by_index[r['index']]['customer_id'])])
+    revenue = sum(r['total_amount'] for r in created)
+    publish_kpi_delta(orders=len(created), revenue=revenue, orders_today=len(created), revenue_today=revenue)
+    publish_stock_levels([dict(products[pid], quantityavailable=stock[pid]) for pid in taken])
+    return [results[o['index']] for o in orders]
+
+@app.route('/api/admin/bulk/orders/ingest', methods=['POST'])
+def api_bulk_ingest_orders():
+    """Ingest a burst of orders in chunked, set-based transactions with per-order results"""
+    try:
+        data = request.json or {}
+        orders = data.get('orders', [])
+        
+        if not orders:
+            return jsonify({'success': False, 'error': 'No orders provided'}), 400
+        if len(orders) > ORDER_BATCH_MAX_ORDERS:
+            return jsonify({'success': False, 'error': f'At most {ORDER_BATCH_MAX_ORDERS} orders per request'}), 400
+        
+        valid, results = _validate_batch_orders(orders)
+        for start in range(0, len(valid), ORDER_BATCH_CHUNK_SIZE):
+            chunk = valid[start:start + ORDER_BATCH_CHUNK_SIZE]
+            try:
+                results.extend(run_with_retry(ingest_order_chunk, chunk))
+            except CommitOutcomeUnknown as e:
+                # The chunk may have committed; not re-run, so it cannot be ingested twice
+                print(f"❌ Order ingest chunk outcome unknown: {e}")
+                results.extend({'index': o['index'], 'ref': o['ref'], 'status': 'unknown', 'error': str(e)}
+                               for o in chunk)
+            except Error as e:
+                # The chunk rolled back as a whole; later chunks still run
+                print(f"❌ Order ingest chunk failed: {e}")
+                results.extend({'index': o['index'], 'ref': o['ref'], 'status': 'failed', 'error': str(e)}
+                               for o in chunk)
+        results.sort(key=lambda r: r['index'])
+        
+        summary = {status: sum(1 for r in results if r['status'] == status)
+                   for status in ('created', 'rejected', 'failed', 'unknown')}
+        if summary['created'] or summary['unknown']:
+            invalidate_cache(*TABLE_CACHE_TAGS['orders'])
+        
+        return jsonify({'success': True, **summary, 'results': results})
+    except Exception as e:
+        print(f"Bulk ingest orders error: {e}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({'success': False, 'error': str(e)})
+
 # ---------- Export Functions ----------
 @app.route('/api/admin/export/orders')
 def api_export_orders():
@@ -1073,6 +3738,30 @@ def api_export_orders():
         print(f"Export orders error: {e}")
         return jsonify([])
 
+# ---------- Result Cache Admin ----------
+@app.route('/api/admin/cache/stats')
+def api_cache_stats():
+    """Get result cache hit/miss counters and memory usage"""
+    try:
+        return jsonify({'success': True, 'cache': result_cache.stats()})
+    except Exception as e:
+        print(f"Cache stats error: {e}")
+        return jsonify({'success': False, 'error': str(e)})
+
+@app.route('/api/admin/cache/clear', methods=['POST'])
+def api_cache_clear():
+    """Drop cached results (all, or only those under the given tags)"""
+    try:
+        tags = (request.get_json(silent=True) or {}).get('tags')
+        if tags:
+            removed = result_cache.invalidate(*tags)
+            return jsonify({'success': True, 'removed': removed})
+        result_cache.clear()
+        return jsonify({'success': True})
+    except Exception as e:
+        print(f"Cache clear error: {e}")
+        return jsonify({'success': False, 'error': str(e)})
+
 # ========== NEW ADMIN FEATURES ==========
 
 # ---------- Database Management: Table Structure Viewer ----------
@@ -1114,85 +3803,677 @@ def api_get_table_data(table_name):
         
         return jsonify({
             'success': True,
-            'data': data,
-            'total': total,
-            'page': page,
-            'limit': limit,
-            'pages': (total + limit - 1) // limit
+            'data': data,
+            'total': total,
+            'page': page,
+            'limit': limit,
+            'pages': (total + limit - 1) // limit
+        })
+    except Exception as e:
+        print(f"Get table data error: {e}")
+        return jsonify({'success': False, 'error': str(e)})
+
+# ---------- Database Management: Query Executor ----------
+@app.route('/api/admin/db/query', methods=['POST'])
+def api_execute_custom_query():
+    """Execute custom SQL query (read-only for safety)"""
+    try:
+        data = request.json
+        query = data.get('query', '').strip()
+        
+        # Security: Only allow SELECT queries
+        if not query.upper().startswith('SELECT'):
+            return jsonify({'success': False, 'error': 'Only SELECT queries are allowed for security'})
+        
+        # Prevent dangerous operations
+        dangerous_keywords = ['DROP', 'DELETE', 'UPDATE', 'INSERT', 'ALTER', 'CREATE', 'TRUNCATE', 'EXEC', 'EXECUTE']
+        query_upper = query.upper()
+        if any(keyword in query_upper for keyword in dangerous_keywords):
+            return jsonify({'success': False, 'error': 'Query contains prohibited operations'})
+        
+        result = execute_query(query, fetch=True)
+        return jsonify({'success': True, 'data': result, 'count': len(result)})
+    except Exception as e:
+        print(f"Query execution error: {e}")
+        return jsonify({'success': False, 'error': str(e)})
+
+# ---------- Database Management: Database Statistics ----------
+STATS_REFRESH_INTERVAL = 900         # seconds between background exact-count passes
+STATS_COUNT_BUDGET_MS = 30000        # MAX_EXECUTION_TIME for each COUNT(*)
+STATS_HISTORY_KEEP_DAYS = 180
+STATS_LOCK_NAME = 'cartique_stats_refresh'  # GET_LOCK name: one counting pass at a time across app processes
+
+exact_table_counts = {}              # table -> {'rows', 'counted_at', 'duration_ms'}
+stats_refresh_state = {'running': False, 'last_started': None, 'last_finished': None, 'last_error': None}
+stats_lock = threading.Lock()
+stats_refresh_wakeup = threading.Event()
+
+def load_table_estimates():
+    """Row/size estimates straight from information_schema (no table scans)"""
+    return execute_query("""
+        SELECT 
+            table_name AS 'table',
+            ROUND(((data_length + index_length) / 1024 / 1024), 2) AS 'size_mb',
+            table_rows AS 'rows',
+            data_length AS 'data_bytes',
+            index_length AS 'index_bytes'
+        FROM information_schema.TABLES 
+        WHERE table_schema = DATABASE() AND table_type = 'BASE TABLE'
+        ORDER BY (data_length + index_length) DESC
+    """, fetch=True)
+
+def _count_table(table_name):
+    """Exact COUNT(*) on a dedicated pooled connection, bounded by MAX_EXECUTION_TIME"""
+    query = f"SELECT /*+ MAX_EXECUTION_TIME({STATS_COUNT_BUDGET_MS}) */ COUNT(*) AS count FROM `{table_name}`"
+    rows = fetch_on_own_connection(query)
+    return int(rows[0]['count']) if rows else 0
+
+def load_recorded_counts():
+    """Adopt the newest exact count per table recorded by whichever process last counted"""
+    rows = execute_query("""
+        SELECT h.table_name, h.row_count, h.captured_at
+        FROM table_growth_history h
+        JOIN (
+            SELECT table_name, MAX(captured_at) as captured_at
+            FROM table_growth_history
+            WHERE exact = TRUE
+            GROUP BY table_name
+        ) latest ON latest.table_name = h.table_name AND latest.captured_at = h.captured_at
+        WHERE h.exact = TRUE
+    """, fetch=True)
+    with stats_lock:
+        for row in rows:
+            counted = exact_table_counts.get(row['table_name'])
+            if counted is None or counted['counted_at'] < row['captured_at']:
+                exact_table_counts[row['table_name']] = {
+                    'rows': int(row['row_count']),
+                    'counted_at': row['captured_at'],
+                    'duration_ms': None
+                }
+
+def refresh_exact_counts():
+    """Count every table once, then append a growth-history sample per table
+
+    Only the process holding STATS_LOCK_NAME counts; the others pick up its
+    results from table_growth_history instead of repeating the scans.
+    """
+    with stats_lock:
+        if stats_refresh_state['running']:
+            return False
+        stats_refresh_state['running'] = True
+        stats_refresh_state['last_started'] = datetime.now()
+    conn = None
+    cursor = None
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor(buffered=True)
+        cursor.execute("SELECT GET_LOCK(%s, 0)", (STATS_LOCK_NAME,))
+        if cursor.fetchone()[0] != 1:
+            load_recorded_counts()
+            stats_refresh_state['last_error'] = None
+            return False
+        estimates = load_table_estimates()
+        history = []
+        for table in estimates:
+            table_name = table['table']
+            started = time.perf_counter()
+            try:
+                rows = _count_table(table_name)
+                exact = True
+            except Exception as e:
+                # Too slow or unreadable: keep the previous exact count, log the estimate
+                print(f"Exact count failed for {table_name}: {e}")
+                rows = int(table['rows'] or 0)
+                exact = False
+            else:
+                with stats_lock:
+                    exact_table_counts[table_name] = {
+                        'rows': rows,
+                        'counted_at': datetime.now(),
+                        'duration_ms': round((time.perf_counter() - started) * 1000, 2)
+                    }
+            history.append((table_name, rows, exact, int(table['data_bytes'] or 0), int(table['index_bytes'] or 0)))
+        
+        if history:
+            placeholders = ','.join(['(%s, NOW(), %s, %s, %s, %s)'] * len(history))
+            execute_query(f"""
+                INSERT INTO table_growth_history (table_name, captured_at, row_count, exact, data_bytes, index_bytes)
+                VALUES {placeholders}
+            """, tuple(value for sample in history for value in sample))
+        stats_refresh_state['last_error'] = None
+        return True
+    except Exception as e:
+        print(f"Statistics refresh error: {e}")
+        stats_refresh_state['last_error'] = str(e)
+        return False
+    finally:
+        if conn is not None:
+            try:
+                # Closing the session would free the lock too; release it explicitly for pooled reuse
+                cursor.execute("SELECT RELEASE_LOCK(%s)", (STATS_LOCK_NAME,))
+                cursor.fetchall()
+                cursor.close()
+                conn.close()
+            except Exception:
+                pass
+        with stats_lock:
+            stats_refresh_state['running'] = False
+            stats_refresh_state['last_finished'] = datetime.now()
+
+def _stats_refresh_loop():
+    # Start from the last recorded counts; the first counting pass waits one interval
+    try:
+        load_recorded_counts()
+    except Exception as e:
+        print(f"Loading recorded table counts failed: {e}")
+    while True:
+        stats_refresh_wakeup.wait(STATS_REFRESH_INTERVAL)
+        stats_refresh_wakeup.clear()
+        refresh_exact_counts()
+
+def start_stats_refresher():
+    thread = threading.Thread(target=_stats_refresh_loop, name='stats-refresher', daemon=True)
+    thread.start()
+    return thread
+
+@app.route('/api/admin/db/statistics')
+def api_database_statistics():
+    """Get comprehensive database statistics
+
+    Sizes and row estimates are read from information_schema on every call;
+    exact counts come from the background refresher, with their age.
+    Pass ?refresh=1 to wake the refresher now.
+    """
+    try:
+        if request.args.get('refresh') == '1':
+            stats_refresh_wakeup.set()
+        
+        stats = {}
+        table_sizes = load_table_estimates()
+        stats['table_sizes'] = [{key: table[key] for key in ('table', 'size_mb', 'rows')} for table in table_sizes]
+        stats['database_size_mb'] = round(sum(float(table['size_mb'] or 0) for table in table_sizes), 2)
+        
+        now = datetime.now()
+        with stats_lock:
+            exact = dict(exact_table_counts)
+            refresh = dict(stats_refresh_state)
+        table_counts = {}
+        count_details = {}
+        for table in table_sizes:
+            table_name = table['table']
+            counted = exact.get(table_name)
+            if counted:
+                table_counts[table_name] = counted['rows']
+                count_details[table_name] = {
+                    'rows': counted['rows'],
+                    'exact': True,
+                    'counted_at': counted['counted_at'].isoformat(timespec='seconds'),
+                    'age_seconds': int((now - counted['counted_at']).total_seconds())
+                }
+            else:
+                table_counts[table_name] = int(table['rows'] or 0)
+                count_details[table_name] = {'rows': table_counts[table_name], 'exact': False}
+        stats['table_counts'] = table_counts
+        stats['count_details'] = count_details
+        stats['refresh'] = {
+            'running': refresh['running'],
+            'interval_seconds': STATS_REFRESH_INTERVAL,
+            'last_started': refresh['last_started'].isoformat(timespec='seconds') if refresh['last_started'] else None,
+            'last_finished': refresh['last_finished'].isoformat(timespec='seconds') if refresh['last_finished'] else None,
+            'last_error': refresh['last_error']
+        }
+        
+        return jsonify({'success': True, 'statistics': stats})
+    except Exception as e:
+        print(f"Database statistics error: {e}")
+        return jsonify({'success': False, 'error': str(e)})
+
+@app.route('/api/admin/db/statistics/history')
+def api_database_statistics_history():
+    """Per-table row/size samples recorded by the background refresher"""
+    try:
+        days = min(max(int(request.args.get('days', 30)), 1), STATS_HISTORY_KEEP_DAYS)
+        table_name = request.args.get('table')
+        
+        query = """
+            SELECT table_name, captured_at, row_count, exact, data_bytes, index_bytes
+            FROM table_growth_history
+            WHERE captured_at >= NOW() - INTERVAL %s DAY
+        """
+        params = [days]
+        if table_name:
+            query += " AND table_name = %s"
+            params.append(table_name)
+        query += " ORDER BY table_name, captured_at"
+        samples = execute_query(query, tuple(params), fetch=True)
+        
+        history = OrderedDict()
+        for sample in samples:
+            history.setdefault(sample['table_name'], []).append({
+                'captured_at': sample['captured_at'].isoformat(timespec='seconds'),
+                'rows': sample['row_count'],
+                'exact': bool(sample['exact']),
+                'data_bytes': sample['data_bytes'],
+                'index_bytes': sample['index_bytes']
+            })
+        growth = {
+            name: {
+                'first_rows': points[0]['rows'],
+                'last_rows': points[-1]['rows'],
+                'row_change': points[-1]['rows'] - points[0]['rows'],
+                'samples': len(points)
+            }
+            for name, points in history.items()
+        }
+        return jsonify({'success': True, 'days': days, 'history': history, 'growth': growth})
+    except Exception as e:
+        print(f"Database statistics history error: {e}")
+        return jsonify({'success': False, 'error': str(e)})
+
+# ---------- Database Management: Query Plan Report ----------
+@app.route('/api/admin/db/explain-report')
+def api_explain_report():
+    """Aggregated EXPLAIN findings per query fingerprint (development mode)"""
+    try:
+        include_clean = request.args.get('all', '0') == '1'
+        with explain_lock:
+            entries = [_explain_entry_json(entry) for entry in explain_report.values()]
+        offending = [entry for entry in entries if entry['flags']]
+        shown = entries if include_clean else offending
+        shown.sort(key=lambda entry: (len(entry['flags']), entry['calls']), reverse=True)
+        return jsonify({
+            'success': True,
+            'enabled': explain_capture['enabled'],
+            'fingerprints': len(entries),
+            'offending_count': len(offending),
+            'queries': shown
         })
     except Exception as e:
-        print(f"Get table data error: {e}")
+        print(f"Explain report error: {e}")
         return jsonify({'success': False, 'error': str(e)})
 
-# ---------- Database Management: Query Executor ----------
-@app.route('/api/admin/db/query', methods=['POST'])
-def api_execute_custom_query():
-    """Execute custom SQL query (read-only for safety)"""
+@app.route('/api/admin/db/explain-report/config', methods=['POST'])
+def api_explain_report_config():
+    """Turn plan capture on/off and optionally reset the collected report"""
     try:
-        data = request.json
-        query = data.get('query', '').strip()
-        
-        # Security: Only allow SELECT queries
-        if not query.upper().startswith('SELECT'):
-            return jsonify({'success': False, 'error': 'Only SELECT queries are allowed for security'})
-        
-        # Prevent dangerous operations
-        dangerous_keywords = ['DROP', 'DELETE', 'UPDATE', 'INSERT', 'ALTER', 'CREATE', 'TRUNCATE', 'EXEC', 'EXECUTE']
-        query_upper = query.upper()
-        if any(keyword in query_upper for keyword in dangerous_keywords):
-            return jsonify({'success': False, 'error': 'Query contains prohibited operations'})
-        
-        result = execute_query(query, fetch=True)
-        return jsonify({'success': True, 'data': result, 'count': len(result)})
+        data = request.get_json(silent=True) or {}
+        if 'enabled' in data:
+            explain_capture['enabled'] = bool(data['enabled'])
+        if data.get('reset'):
+            with explain_lock:
+                explain_report.clear()
+        return jsonify({'success': True, 'enabled': explain_capture['enabled']})
     except Exception as e:
-        print(f"Query execution error: {e}")
+        print(f"Explain config error: {e}")
         return jsonify({'success': False, 'error': str(e)})
 
-# ---------- Database Management: Database Statistics ----------
-@app.route('/api/admin/db/statistics')
-def api_database_statistics():
-    """Get comprehensive database statistics"""
+# ---------- Database Management: Partitions & Archival ----------
+# Monthly RANGE-partitioned tables and their date columns (see sp_partition_table_by_month)
+PARTITIONED_TABLES = {'orders': 'order_date', 'activity_log': 'created_at'}
+PARTITION_MONTHS_AHEAD = 3
+
+@app.route('/api/admin/db/partitions')
+def api_partitions():
+    """Monthly partitions of orders/activity_log and the most recent archival runs"""
     try:
-        stats = {}
-        
-        # Table sizes
-        table_sizes = execute_query("""
-            SELECT 
-                table_name AS 'table',
-                ROUND(((data_length + index_length) / 1024 / 1024), 2) AS 'size_mb',
-                table_rows AS 'rows'
-            FROM information_schema.TABLES 
-            WHERE table_schema = DATABASE()
-            ORDER BY (data_length + index_length) DESC
-        """, fetch=True)
-        stats['table_sizes'] = table_sizes
-        
-        # Total database size
-        db_size = execute_query("""
-            SELECT 
-                ROUND(SUM(data_length + index_length) / 1024 / 1024, 2) AS 'db_size_mb'
-            FROM information_schema.TABLES 
-            WHERE table_schema = DATABASE()
-        """, fetch=True)
-        stats['database_size_mb'] = db_size[0]['db_size_mb'] if db_size else 0
+        table_marks = ', '.join(['%s'] * len(PARTITIONED_TABLES))
+        results = fetch_parallel({
+            'partitions': (f"""
+                SELECT TABLE_NAME as table_name, PARTITION_NAME as partition_name,
+                       fn_partition_range_end(PARTITION_EXPRESSION, PARTITION_DESCRIPTION) as range_end,
+                       TABLE_ROWS as row_estimate,
+                       DATA_LENGTH + INDEX_LENGTH as size_bytes
+                FROM information_schema.PARTITIONS
+                WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME IN ({table_marks})
+                  AND PARTITION_NAME IS NOT NULL
+                ORDER BY TABLE_NAME, PARTITION_ORDINAL_POSITION
+            """, tuple(PARTITIONED_TABLES)),
+            'archives': ("""
+                SELECT table_name, partition_name, archive_table, range_end, row_count, action, archived_at
+                FROM partition_archives
+                ORDER BY archived_at DESC, id DESC
+                LIMIT 100
+            """, None),
+        })
+        tables = {name: {'column': column, 'partitioned': False, 'partitions': []}
+                  for name, column in PARTITIONED_TABLES.items()}
+        for row in results['partitions']:
+            table = tables[row.pop('table_name')]
+            table['partitioned'] = True
+            table['partitions'].append(row)
+        return jsonify({'success': True, 'tables': tables, 'archives': results['archives']})
+    except Exception as e:
+        print(f"Partitions error: {e}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({'success': False, 'error': str(e)})
+
+@app.route('/api/admin/db/partitions/maintain', methods=['POST'])
+def api_maintain_partitions():
+    """Add future monthly partitions and optionally archive (or drop) old ones.
+    Body: {"table": "orders", "months_ahead": 3, "keep_months": 24, "drop": false};
+    without keep_months nothing is archived."""
+    try:
+        data = request.get_json(silent=True) or {}
+        table = data.get('table')
+        if table not in PARTITIONED_TABLES:
+            return jsonify({'success': False, 'error': f"table must be one of: {', '.join(PARTITIONED_TABLES)}"}), 400
+        try:
+            months_ahead = int(data.get('months_ahead', PARTITION_MONTHS_AHEAD))
+            keep_months = data.get('keep_months')
+            keep_months = int(keep_months) if keep_months not in (None, '') else None
+        except (TypeError, ValueError):
+            return jsonify({'success': False, 'error': 'months_ahead and keep_months must be integers'}), 400
+        if months_ahead < 0 or (keep_months is not None and keep_months < 1):
+            return jsonify({'success': False, 'error': 'months_ahead must be >= 0 and keep_months >= 1'}), 400
+        
+        # Partition DDL commits implicitly and is not idempotent, so no retries here
+        result = {'table': table}
+        added = call_procedure('sp_add_future_partitions', (table, months_ahead))
+        result['partitions_added'] = added[0]['partitions_added'] if added else 0
+        if keep_months is not None:
+            moved = call_procedure('sp_archive_partitions', (table, keep_months, bool(data.get('drop'))))
+            result['partitions_moved'] = moved[0]['partitions_moved'] if moved else 0
+            result['cutoff'] = moved[0]['cutoff'] if moved else None
+            if result['partitions_moved']:
+                # Archiving creates <table>_archive_<yyyymm> tables, so the schema cache is stale too
+                invalidate_cache('schema', *TABLE_CACHE_TAGS.get(table, ()))
+                print(f"🗄️ {'Dropped' if data.get('drop') else 'Archived'} {result['partitions_moved']} "
+                      f"{table} partition(s) before {result['cutoff']}")
+        return jsonify({'success': True, **result})
+    except Exception as e:
+        print(f"Partition maintenance error: {e}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({'success': False, 'error': str(e)})
+
+# ---------- Retention Purge ----------
+# Expired rows are deleted in primary-key order, a bounded chunk per short
+# transaction, with a pause between chunks (longer while replicas lag) and a
+# time budget per run. Progress is checkpointed in retention_checkpoints, so a
+# run that hits its budget, fails or is interrupted resumes where it stopped.
+# Whole expired months of partitioned tables are dropped first.
+RETENTION_CHUNK_SIZE = int(os.environ.get('CARTIQUE_RETENTION_CHUNK_SIZE', 1000))
+RETENTION_SLEEP_MS = int(os.environ.get('CARTIQUE_RETENTION_SLEEP_MS', 100))
+RETENTION_TIME_BUDGET_SECONDS = float(os.environ.get('CARTIQUE_RETENTION_BUDGET', 60))
+RETENTION_INTERVAL = 3600          # seconds between background runs
+RETENTION_LAG_PAUSE_SECONDS = 1.0  # extra pause per chunk while a replica lags past REPLICA_MAX_LAG_SECONDS
+RETENTION_LOCK_NAME = 'cartique_retention'  # GET_LOCK name: one purge at a time across app processes
+
+# Per-table policy: date column, rows to keep, optional extra filter.
+# keep_days can be overridden with CARTIQUE_RETENTION_<TABLE>_DAYS.
+RETENTION_POLICIES = {
+    'notifications': {'column': 'created_at', 'keep_days': 30, 'where': 'is_read = TRUE'},
+    'activity_log': {'column': 'created_at', 'keep_days': 90},
+    'table_growth_history': {'column': 'captured_at', 'keep_days': STATS_HISTORY_KEEP_DAYS},
+}
+for _table, _policy in RETENTION_POLICIES.items():
+    _policy['keep_days'] = int(os.environ.get(f'CARTIQUE_RETENTION_{_table.upper()}_DAYS', _policy['keep_days']))
+    _policy.setdefault('where', None)
+    _policy.setdefault('enabled', True)
+    _policy.setdefault('chunk_size', RETENTION_CHUNK_SIZE)
+    _policy.setdefault('sleep_ms', RETENTION_SLEEP_MS)
+
+retention_state = {'running': False, 'table': None, 'last_started': None, 'last_finished': None,
+                   'last_error': None, 'last_run': {}}
+retention_lock = threading.Lock()
+retention_wakeup = threading.Event()
+
+def _retention_pause(policy, deadline):
+    """Sleep between chunks; back off further while any replica is behind"""
+    pause = policy['sleep_ms'] / 1000.0
+    if any((replica['lag_seconds'] or 0) > REPLICA_MAX_LAG_SECONDS for replica in replicas.stats()):
+        pause += RETENTION_LAG_PAUSE_SECONDS
+    time.sleep(max(0.0, min(pause, deadline - time.monotonic())))
+
+def _months_fully_expired(cutoff):
+    """keep_months for sp_archive_partitions so only months wholly before cutoff are dropped"""
+    today = date.today()
+    return (today.year * 12 + today.month) - (cutoff.year * 12 + cutoff.month)
+
+def purge_table(conn, table, policy, deadline):
+    """Purge one table until it is clean or the deadline passes; returns this run's progress"""
+    cursor = conn.cursor(dictionary=True, buffered=True)
+    progress = {'rows_deleted': 0, 'chunks': 0, 'partitions_dropped': 0, 'status': None}
+    try:
+        cursor.execute("""
+            SELECT COLUMN_NAME as column_name FROM information_schema.KEY_COLUMN_USAGE
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
+              AND CONSTRAINT_NAME = 'PRIMARY' AND ORDINAL_POSITION = 1
+        """, (table,))
+        key_row = cursor.fetchone()
+        if not key_row:
+            raise ValueError(f'{table} has no primary key')
+        key, column = key_row['column_name'], policy['column']
+        extra = f" AND ({policy['where']})" if policy['where'] else ''
+        
+        cursor.execute("SELECT * FROM retention_checkpoints WHERE table_name = %s", (table,))
+        checkpoint = cursor.fetchone()
+        if checkpoint and checkpoint['status'] != 'done':
+            # Resume the interrupted pass with its original cutoff and key range
+            cutoff, last_key, end_key = checkpoint['cutoff'], checkpoint['last_key'], checkpoint['end_key']
+        else:
+            cutoff = datetime.now().replace(microsecond=0) - timedelta(days=policy['keep_days'])
+            if table in PARTITIONED_TABLES:
+                # Whole expired months go with a partition drop instead of row deletes
+                proc_cursor = conn.cursor(buffered=True)
+                proc_cursor.callproc('sp_archive_partitions', (table, _months_fully_expired(cutoff), True))
+                for result in proc_cursor.stored_results():
+                    for row in result.fetchall():
+                        progress['partitions_dropped'] = int(dict(zip(result.column_names, row))['partitions_moved'] or 0)
+                proc_cursor.close()
+            # Newest expired row bounds the pass (keys grow with time); later rows wait for the next pass
+            cursor.execute(f"""
+                SELECT `{key}` as k FROM `{table}`
+                WHERE `{column}` < %s
+                ORDER BY `{column}` DESC, `{key}` DESC LIMIT 1
+            """, (cutoff,))
+            row = cursor.fetchone()
+            last_key, end_key = None, row['k'] if row else None
+            cursor.execute("""
+                INSERT INTO retention_checkpoints
+                    (table_name, cutoff, last_key, end_key, rows_deleted, status, last_error, started_at, updated_at, finished_at)
+                VALUES (%s, %s, NULL, %s, 0, 'running', NULL, NOW(), NOW(), NULL)
+                ON DUPLICATE KEY UPDATE cutoff = VALUES(cutoff), last_key = NULL, end_key = VALUES(end_key),
+                    rows_deleted = 0, status = 'running', last_error = NULL,
+                    started_at = NOW(), updated_at = NOW(), finished_at = NULL
+            """, (table, cutoff, end_key))
+            conn.commit()
         
-        # Row counts per table
-        tables = execute_query("SHOW TABLES", fetch=True)
-        table_counts = {}
-        for table in tables:
-            table_name = list(table.values())[0]
+        def delete_chunk(low, high):
+            """Delete one key range and advance the checkpoint in the same short transaction"""
+            lower = f"`{key}` > %s AND " if low is not None else ''
+            bounds = (low,) if low is not None else ()
             try:
-                count = execute_query(f"SELECT COUNT(*) as count FROM `{table_name}`", fetch=True)
-                table_counts[table_name] = count[0]['count'] if count else 0
-            except:
-                table_counts[table_name] = 0
-        stats['table_counts'] = table_counts
-        
-        return jsonify({'success': True, 'statistics': stats})
+                cursor.execute(f"DELETE FROM `{table}` WHERE {lower}`{key}` <= %s AND `{column}` < %s{extra}",
+                               bounds + (high, cutoff))
+                deleted = cursor.rowcount
+                cursor.execute("""
+                    UPDATE retention_checkpoints
+                    SET last_key = %s, rows_deleted = rows_deleted + %s, status = 'running', updated_at = NOW()
+                    WHERE table_name = %s
+                """, (high, deleted, table))
+                commit_transaction(conn)
+            except Error:
+                try:
+                    conn.rollback()
+                except:
+                    pass
+                raise
+            return deleted
+        
+        status = 'done'
+        while end_key is not None:
+            if time.monotonic() >= deadline:
+                status = 'paused'
+                break
+            # Upper key of the next chunk, walking the primary key (no date-index scan)
+            lower = f"`{key}` > %s AND " if last_key is not None else ''
+            cursor.execute(f"""
+                SELECT MAX(k) as high FROM (
+                    SELECT `{key}` as k FROM `{table}`
+                    WHERE {lower}`{key}` <= %s
+                    ORDER BY `{key}` LIMIT %s
+                ) chunk
+            """, ((last_key,) if last_key is not None else ()) + (end_key, policy['chunk_size']))
+            high = cursor.fetchone()['high']
+            if high is None:
+                break
+            deleted = run_with_retry(delete_chunk, last_key, high)
+            last_key = high
+            progress['rows_deleted'] += deleted
+            progress['chunks'] += 1
+            RETENTION_ROWS_DELETED.inc((table,), deleted)
+            retention_state['last_run'][table] = dict(progress, status='running')
+            _retention_pause(policy, deadline)
+        
+        cursor.execute("""
+            UPDATE retention_checkpoints
+            SET status = %s, updated_at = NOW(), finished_at = IF(%s = 'done', NOW(), NULL)
+            WHERE table_name = %s
+        """, (status, status, table))
+        conn.commit()
+        progress['status'] = status
+        return progress
     except Exception as e:
-        print(f"Database statistics error: {e}")
+        try:
+            conn.rollback()
+            cursor.execute("""
+                UPDATE retention_checkpoints SET status = 'failed', last_error = %s, updated_at = NOW()
+                WHERE table_name = %s
+            """, (str(e)[:1000], table))
+            conn.commit()
+        except Exception:
+            pass
+        raise
+    finally:
+        try:
+            cursor.close()
+        except Exception:
+            pass
+
+def run_retention(tables=None):
+    """One purge run over the enabled policies (or just `tables`) under the time budget"""
+    with retention_lock:
+        if retention_state['running']:
+            return None
+        retention_state.update(running=True, last_started=datetime.now(), last_error=None, last_run={})
+    conn = None
+    results = {}
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor(buffered=True)
+        cursor.execute("SELECT GET_LOCK(%s, 0)", (RETENTION_LOCK_NAME,))
+        if cursor.fetchone()[0] != 1:
+            print("🧹 Retention purge already running in another process")
+            return None
+        try:
+            # Least recently worked tables first, so one large table cannot starve the others
+            cursor.execute("SELECT table_name, updated_at FROM retention_checkpoints")
+            worked = dict(cursor.fetchall())
+            names = [name for name, policy in RETENTION_POLICIES.items()
+                     if policy['enabled'] and (not tables or name in tables)]
+            names.sort(key=lambda name: worked.get(name) or datetime.min)
+            deadline = time.monotonic() + RETENTION_TIME_BUDGET_SECONDS
+            for table in names:
+                if time.monotonic() >= deadline:
+                    results[table] = {'status': 'skipped'}
+                    continue
+                retention_state['table'] = table
+                try:
+                    results[table] = purge_table(conn, table, RETENTION_POLICIES[table], deadline)
+                except Exception as e:
+                    print(f"Retention purge of {table} failed: {e}")
+                    results[table] = {'status': 'failed', 'error': str(e)}
+                    retention_state['last_error'] = f'{table}: {e}'
+                retention_state['last_run'][table] = results[table]
+            deleted = sum(result.get('rows_deleted', 0) for result in results.values())
+            if deleted:
+                print(f"🧹 Retention purge deleted {deleted} rows")
+        finally:
+            cursor.execute("SELECT RELEASE_LOCK(%s)", (RETENTION_LOCK_NAME,))
+            cursor.fetchall()
+            cursor.close()
+        return results
+    except Exception as e:
+        print(f"Retention purge error: {e}")
+        retention_state['last_error'] = str(e)
+        return None
+    finally:
+        if conn is not None:
+            try:
+                conn.close()
+            except Exception:
+                pass
+        with retention_lock:
+            retention_state.update(running=False, table=None, last_finished=datetime.now())
+
+def _retention_loop():
+    while True:
+        retention_wakeup.wait(RETENTION_INTERVAL)
+        retention_wakeup.clear()
+        run_retention(retention_state.pop('requested_tables', None))
+
+def start_retention_worker():
+    thread = threading.Thread(target=_retention_loop, name='retention-purge', daemon=True)
+    thread.start()
+    return thread
+
+@app.route('/api/admin/retention')
+def api_retention_status():
+    """Retention policies, the current/last run and each table's checkpoint"""
+    try:
+        checkpoints = execute_query("SELECT * FROM retention_checkpoints ORDER BY table_name", fetch=True)
+        with retention_lock:
+            state = {key: value for key, value in retention_state.items() if key != 'requested_tables'}
+        return jsonify({
+            'success': True,
+            'policies': RETENTION_POLICIES,
+            'chunk_size': RETENTION_CHUNK_SIZE,
+            'time_budget_seconds': RETENTION_TIME_BUDGET_SECONDS,
+            'interval_seconds': RETENTION_INTERVAL,
+            'state': state,
+            'checkpoints': checkpoints
+        })
+    except Exception as e:
+        print(f"Retention status error: {e}")
         return jsonify({'success': False, 'error': str(e)})
 
+@app.route('/api/admin/retention/run', methods=['POST'])
+def api_retention_run():
+    """Start a purge run now in the background; optional body {"tables": [...]}"""
+    data = request.get_json(silent=True) or {}
+    tables = data.get('tables')
+    unknown = [table for table in tables or () if table not in RETENTION_POLICIES]
+    if unknown:
+        return jsonify({'success': False, 'error': f"Unknown retention table(s): {', '.join(unknown)}"}), 400
+    if retention_state['running']:
+        return jsonify({'success': False, 'error': 'A retention run is already in progress'}), 409
+    retention_state['requested_tables'] = tables or None
+    retention_wakeup.set()
+    return jsonify({'success': True, 'started': True}), 202
+
+@app.route('/api/admin/retention/config', methods=['POST'])
+def api_retention_config():
+    """Change a table's policy: {"table": ..., "keep_days", "enabled", "chunk_size", "sleep_ms"}"""
+    data = request.get_json(silent=True) or {}
+    policy = RETENTION_POLICIES.get(data.get('table'))
+    if policy is None:
+        return jsonify({'success': False, 'error': f"table must be one of: {', '.join(RETENTION_POLICIES)}"}), 400
+    try:
+        changes = {}
+        for field, minimum in (('keep_days', 1), ('chunk_size', 1), ('sleep_ms', 0)):
+            if field in data:
+                changes[field] = int(data[field])
+                if changes[field] < minimum:
+                    raise ValueError(f'{field} must be >= {minimum}')
+        if 'enabled' in data:
+            changes['enabled'] = bool(data['enabled'])
+    except (TypeError, ValueError) as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    policy.update(changes)
+    return jsonify({'success': True, 'table': data['table'], 'policy': policy})
+
 # ---------- Database Management: Health Check ----------
 @app.route('/api/admin/db/health')
 def api_database_health():
@@ -1215,11 +4496,15 @@ def api_database_health():
         
         # Get connection info
         try:
-            conn_info = execute_query("SHOW VARIABLES LIKE 'max_connections'", fetch=True)
+            server = fetch_parallel({
+                'max_connections': ("SHOW VARIABLES LIKE 'max_connections'", None),
+                'threads_connected': ("SHOW STATUS LIKE 'Threads_connected'", None),
+            })
+            conn_info = server['max_connections']
             if conn_info:
                 health['max_connections'] = conn_info[0]['Value']
             
-            status = execute_query("SHOW STATUS LIKE 'Threads_connected'", fetch=True)
+            status = server['threads_connected']
             if status:
                 health['active_connections'] = status[0]['Value']
         except:
@@ -1231,17 +4516,302 @@ def api_database_health():
         if not health['connection']:
             health['status'] = 'unhealthy'
             health['issues'].append('Connection failed')
+        health['circuit_breaker'] = db_breaker.stats()
+        if replicas:
+            health['replicas'] = replicas.stats()
+            if not any(replica['healthy'] for replica in health['replicas']):
+                health['issues'].append('No healthy read replica; reads are served by the primary')
+        if db_breaker.stats()['state'] != 'closed':
+            health['issues'].append('Circuit breaker is open; database calls are failing fast')
+        if pool is not None:
+            health['pool'] = pool.stats()
+            if health['pool']['waiting']:
+                health['issues'].append('Requests are queueing for database connections')
         
         return jsonify({'success': True, 'health': health})
     except Exception as e:
         print(f"Database health check error: {e}")
         return jsonify({'success': False, 'error': str(e), 'health': {'status': 'unhealthy'}})
 
+@app.route('/api/admin/db/replicas')
+def api_replica_status():
+    """Replica health, lag and pool counters"""
+    return jsonify({
+        'success': True,
+        'max_lag_seconds': REPLICA_MAX_LAG_SECONDS,
+        'replicas': replicas.stats()
+    })
+
+@app.route('/api/admin/db/pool')
+def api_pool_stats():
+    """Connection pool sizes, waiters and lifecycle counters"""
+    if pool is None:
+        return jsonify({'success': False, 'error': 'Connection pool not initialized'})
+    return jsonify({'success': True, 'pool': pool.stats()})
+
+@app.route('/api/admin/outbox')
+def api_outbox_stats():
+    """Audit/notification outbox queue depth, durability mode and writer counters"""
+    return jsonify({'success': True, 'outbox': outbox.stats()})
+
+@app.route('/api/admin/outbox/flush', methods=['POST'])
+def api_outbox_flush():
+    """Write every queued audit/notification row now"""
+    try:
+        written = outbox.flush()
+        return jsonify({'success': True, 'written': written, 'outbox': outbox.stats()})
+    except Exception as e:
+        print(f"Outbox flush error: {e}")
+        return jsonify({'success': False, 'error': str(e)})
+
+@app.route('/api/admin/events')
+def api_events():
+    """Server-Sent Events stream of notifications, inventory alerts and KPI deltas"""
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        last_event_id = None
+    
+    subscriber = event_hub.subscribe(last_event_id)
+    if subscriber is None:
+        return (jsonify({'success': False, 'error': 'Too many live event connections'}), 503,
+                {'Retry-After': str(SSE_RETRY_MS // 1000)})
+    
+    def stream():
+        try:
+            yield f"retry: {SSE_RETRY_MS}\n\n"
+            while True:
+                events, resync, last_id = event_hub.next_events(subscriber, SSE_HEARTBEAT_SECONDS)
+                if resync:
+                    # Fell too far behind: the client re-fetches once and carries on from last_id
+                    yield format_sse(last_id, 'resync', {})
+                for event in events:
+                    yield format_sse(*event)
+                if not events and not resync:
+                    yield ": heartbeat\n\n"
+        finally:
+            # Runs when the client disconnects (the next write fails) or the server stops
+            event_hub.unsubscribe(subscriber)
+    
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/admin/events/stats')
+def api_events_stats():
+    """Connected live-event clients and hub counters"""
+    return jsonify({'success': True, 'events': event_hub.stats()})
+
+# ---------- Data Import/Export: Streaming Export ----------
+EXPORT_FETCH_SIZE = 1000
+EXPORT_MIMETYPES = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+EXPORT_PROGRESS_KEEP = 20
+
+# export_id -> progress dict, newest last
+export_progress = OrderedDict()
+_export_progress_lock = threading.Lock()
+
+def json_default(value):
+    """Serialize the MySQL column types jsonify would otherwise handle"""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, (Decimal, timedelta)):
+        return str(value)
+    if isinstance(value, (bytes, bytearray)):
+        return value.decode('utf-8', errors='replace')
+    return str(value)
+
+def _csv_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, (bytes, bytearray)):
+        return value.decode('utf-8', errors='replace')
+    if isinstance(value, (datetime, date)):
+        return value.isoformat(sep=' ') if isinstance(value, datetime) else value.isoformat()
+    return value
+
+def list_tables():
+    """Return the names of all tables in the current database"""
+    tables = execute_query("SHOW TABLES", fetch=True)
+    return [list(table.values())[0] for table in tables]
+
+def open_streaming_connection(replica=None):
+    """Open a dedicated, non-pooled connection for long-running streaming reads.
+
+    Streaming holds the connection for as long as the client keeps reading,
+    so it must not occupy a slot in the request pool. Pass a replica (chosen
+    while the request context is still available) to read from it instead.
+    """
+    source = replica['config'] if replica is not None else DB_CONFIG
+    config = {k: v for k, v in source.items() if not k.startswith('pool_')}
+    return mysql.connector.connect(**config)
+
+def _update_export_progress(export_id, **fields):
+    # Entries can be evicted by newer exports while this one is still streaming
+    with _export_progress_lock:
+        progress = export_progress.get(export_id)
+        if progress is not None:
+            progress.update(fields)
+
+def _update_export_table(export_id, table_name, **fields):
+    with _export_progress_lock:
+        progress = export_progress.get(export_id)
+        if progress is not None:
+            progress['tables'].setdefault(table_name, {}).update(fields)
+
+def _export_rows(export_id, tables, fmt, wrap_rows, replica=None):
+    """Yield text chunks for each table using an unbuffered server-side cursor"""
+    conn = None
+    cursor = None
+    finished = False
+    try:
+        conn = open_streaming_connection(replica)
+        # One consistent snapshot across every exported table
+        conn.start_transaction(consistent_snapshot=True, readonly=True)
+
+        estimate_cursor = conn.cursor(dictionary=True, buffered=True)
+        estimate_cursor.execute("""
+            SELECT table_name AS name, table_rows AS estimated_rows
+            FROM information_schema.TABLES
+            WHERE table_schema = DATABASE()
+        """)
+        estimates = {r['name']: int(r['estimated_rows'] or 0) for r in estimate_cursor.fetchall()}
+        estimate_cursor.close()
+
+        for table_name in tables:
+            _update_export_progress(export_id, current_table=table_name)
+            _update_export_table(export_id, table_name, status='running', rows_exported=0,
+                                 estimated_rows=estimates.get(table_name, 0))
+            if fmt == 'ndjson' and wrap_rows:
+                yield json.dumps({'table': table_name, 'event': 'start',
+                                  'estimated_rows': estimates.get(table_name, 0)}) + '\n'
+
+            cursor = conn.cursor()  # unbuffered: rows are read from the socket as we go
+            cursor.execute(f"SELECT * FROM `{table_name}`")
+            columns = cursor.column_names
+
+            buffer = StringIO()
+            writer = csv.writer(buffer) if fmt == 'csv' else None
+            if writer:
+                if wrap_rows:
+                    buffer.write(f"# table={table_name}\n")
+                writer.writerow(columns)
+
+            exported = 0
+            while True:
+                rows = cursor.fetchmany(EXPORT_FETCH_SIZE)
+                if not rows:
+                    break
+                for row in rows:
+                    if writer:
+                        writer.writerow([_csv_value(v) for v in row])
+                    else:
+                        record = dict(zip(columns, row))
+                        if wrap_rows:
+                            record = {'table': table_name, 'row': record}
+                        buffer.write(json.dumps(record, default=json_default) + '\n')
+                exported += len(rows)
+                _update_export_table(export_id, table_name, rows_exported=exported)
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+            cursor.close()
+            cursor = None
+
+            if fmt == 'ndjson' and wrap_rows:
+                buffer.write(json.dumps({'table': table_name, 'event': 'end', 'rows': exported}) + '\n')
+            elif writer and wrap_rows:
+                buffer.write('\n')
+            yield buffer.getvalue()
+            _update_export_table(export_id, table_name, status='done')
+
+        conn.rollback()
+        finished = True
+        _update_export_progress(export_id, status='done', current_table=None,
+                                finished_at=datetime.now().isoformat(timespec='seconds'))
+    except Exception as e:
+        print(f"Streaming export error: {e}")
+        _update_export_progress(export_id, status='failed', error=str(e))
+        if fmt == 'ndjson':
+            yield json.dumps({'event': 'error', 'error': str(e)}) + '\n'
+    finally:
+        if not finished:
+            with _export_progress_lock:
+                progress = export_progress.get(export_id)
+                if progress is not None and progress['status'] == 'running':
+                    progress['status'] = 'aborted'
+        if conn:
+            # Closing with rows still unread is fine: the dedicated connection is simply dropped
+            try:
+                conn.close()
+            except:
+                pass
+
+def _gzip_chunks(chunks):
+    """Gzip a stream of text chunks, flushing once per chunk so output keeps flowing"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        data += compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
+
+def streaming_export_response(tables, fmt, compress, filename, wrap_rows):
+    """Build a generator response that streams tables in constant memory"""
+    export_id = uuid.uuid4().hex[:12]
+    with _export_progress_lock:
+        export_progress[export_id] = {
+            'export_id': export_id,
+            'format': fmt,
+            'gzip': compress,
+            'status': 'running',
+            'started_at': datetime.now().isoformat(timespec='seconds'),
+            'current_table': None,
+            'tables': {}
+        }
+        while len(export_progress) > EXPORT_PROGRESS_KEEP:
+            export_progress.popitem(last=False)
+
+    # The generator runs after the request context is gone, so route it now
+    replica = choose_read_replica('SELECT')
+    _update_export_progress(export_id, source=replica['name'] if replica is not None else 'primary')
+    body = _export_rows(export_id, tables, fmt, wrap_rows, replica)
+    mimetype = EXPORT_MIMETYPES[fmt]
+    filename = f"{filename}.{fmt}"
+    if compress:
+        body = _gzip_chunks(body)
+        mimetype = 'application/gzip'
+        filename += '.gz'
+
+    return Response(body, mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename={filename}',
+        'X-Export-Id': export_id,
+        'X-Accel-Buffering': 'no'
+    })
+
+@app.route('/api/admin/export/progress')
+@app.route('/api/admin/export/progress/<export_id>')
+def api_export_progress(export_id=None):
+    """Get per-table progress of recent streaming exports"""
+    with _export_progress_lock:
+        if export_id:
+            progress = export_progress.get(export_id)
+            if progress is None:
+                return jsonify({'success': False, 'error': 'Unknown export'}), 404
+            return jsonify({'success': True, 'export': json.loads(json.dumps(progress))})
+        return jsonify({'success': True, 'exports': json.loads(json.dumps(list(export_progress.values())))})
+
 # ---------- Data Import/Export: Export All Data ----------
 @app.route('/api/admin/export/all')
 def api_export_all_data():
-    """Export all data from all tables"""
+    """Export all data from all tables (?format=ndjson|csv&gzip=1 streams instead)"""
     try:
+        fmt = request.args.get('format', 'json')
+        if fmt in EXPORT_MIMETYPES:
+            return streaming_export_response(list_tables(), fmt, request.args.get('gzip') == '1',
+                                             'export_all', wrap_rows=True)
+
         tables = execute_query("SHOW TABLES", fetch=True)
         export_data = {}
         
@@ -1260,46 +4830,174 @@ def api_export_all_data():
 
 @app.route('/api/admin/export/table/<table_name>')
 def api_export_table(table_name):
-    """Export data from a specific table"""
+    """Export data from a specific table (?format=ndjson|csv&gzip=1 streams instead)"""
     try:
+        fmt = request.args.get('format', 'json')
+        if fmt in EXPORT_MIMETYPES:
+            if table_name not in list_tables():
+                return jsonify({'success': False, 'error': 'Unknown table'}), 404
+            return streaming_export_response([table_name], fmt, request.args.get('gzip') == '1',
+                                             f'export_{table_name}', wrap_rows=False)
+
         data = execute_query(f"SELECT * FROM `{table_name}`", fetch=True)
         return jsonify({'success': True, 'table': table_name, 'data': data, 'count': len(data)})
     except Exception as e:
         print(f"Export table error: {e}")
         return jsonify({'success': False, 'error': str(e)})
 
+# ---------- Data Import: Bulk Import Engine ----------
+IMPORT_BATCH_SIZE = 1000
+IMPORT_MAX_BATCH_SIZE = 10000
+IMPORT_MAX_REPORTED_ERRORS = 100
+
+class ImportAborted(Exception):
+    """Raised to stop an import at the first bad row when on_error='abort'"""
+
+def table_columns(table_name):
+    """Return the column names of a table, or an empty list if it does not exist"""
+    columns = execute_query("""
+        SELECT column_name AS name
+        FROM information_schema.COLUMNS
+        WHERE table_schema = DATABASE() AND table_name = %s
+        ORDER BY ordinal_position
+    """, (table_name,), fetch=True)
+    return [c['name'] for c in columns]
+
+def bulk_import_rows(table_name, headers, rows, batch_size=IMPORT_BATCH_SIZE,
+                     commit_mode='single', on_error='abort'):
+    """Insert CSV rows with batched multi-row INSERTs.
+
+    rows is any iterable of lists, so uploads are consumed as they are read.
+    commit_mode is 'single' (one transaction for the whole file) or
+    'chunked' (commit after every batch). on_error is 'abort' (stop at the
+    first bad row) or 'skip' (keep going and report bad rows). Empty CSV
+    fields are inserted as NULL.
+    """
+    placeholders = ','.join(['%s'] * len(headers))
+    columns = ','.join([f"`{h}`" for h in headers])
+    insert_sql = f"INSERT INTO `{table_name}` ({columns}) VALUES ({placeholders})"
+
+    result = {'inserted': 0, 'failed': 0, 'batches': 0, 'commits': 0, 'aborted': False, 'errors': []}
+
+    def record_error(line_no, message):
+        result['failed'] += 1
+        if len(result['errors']) < IMPORT_MAX_REPORTED_ERRORS:
+            result['errors'].append({'row': line_no, 'error': message})
+        if on_error == 'abort':
+            raise ImportAborted()
+
+    def flush(batch):
+        result['batches'] += 1
+        cursor.execute("SAVEPOINT import_batch")
+        try:
+            cursor.executemany(insert_sql, [values for _, values in batch])
+            result['inserted'] += len(batch)
+            cursor.execute("RELEASE SAVEPOINT import_batch")
+        except Error:
+            # Replay the batch row by row to find exactly which rows are bad
+            cursor.execute("ROLLBACK TO SAVEPOINT import_batch")
+            for line_no, values in batch:
+                try:
+                    cursor.execute(insert_sql, values)
+                    result['inserted'] += 1
+                except Error as e:
+                    record_error(line_no, str(e))
+        if commit_mode == 'chunked':
+            conn.commit()
+            result['commits'] += 1
+            conn.start_transaction()
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        conn.start_transaction()
+        committed_before_abort = 0
+        batch = []
+        # Line 1 is the header row
+        for line_no, row in enumerate(rows, start=2):
+            if not row:
+                continue
+            if len(row) != len(headers):
+                record_error(line_no, f"Expected {len(headers)} columns, got {len(row)}")
+                continue
+            batch.append((line_no, tuple(None if v == '' else v for v in row)))
+            if len(batch) >= batch_size:
+                flush(batch)
+                committed_before_abort = result['inserted']
+                batch = []
+        if batch:
+            flush(batch)
+        conn.commit()
+        result['commits'] += 1
+    except ImportAborted:
+        conn.rollback()
+        result['aborted'] = True
+        # Chunked imports keep the batches committed before the bad row
+        result['inserted'] = committed_before_abort if commit_mode == 'chunked' else 0
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        conn.close()
+    return result
+
 # ---------- Data Import: Import CSV Data ----------
 @app.route('/api/admin/import/csv', methods=['POST'])
 def api_import_csv():
-    """Import data from CSV format"""
+    """Import data from CSV format.
+
+    Accepts either a multipart upload (file=<csv>, table_name=...) streamed
+    row by row, or the JSON body {table_name, csv_data: [[headers], [row], ...]}.
+    Options: batch_size, commit_mode ('single'|'chunked'), on_error ('abort'|'skip').
+    """
     try:
-        data = request.json
-        table_name = data.get('table_name')
-        csv_data = data.get('csv_data', [])
-        
-        if not table_name or not csv_data:
-            return jsonify({'success': False, 'error': 'Missing table_name or csv_data'})
-        
-        if len(csv_data) < 2:
-            return jsonify({'success': False, 'error': 'CSV must have headers and at least one row'})
-        
-        headers = csv_data[0]
-        rows = csv_data[1:]
-        
-        # Build INSERT query
-        placeholders = ','.join(['%s'] * len(headers))
-        columns = ','.join([f"`{h}`" for h in headers])
-        
-        inserted = 0
-        for row in rows:
-            if len(row) == len(headers):
-                execute_query(
-                    f"INSERT INTO `{table_name}` ({columns}) VALUES ({placeholders})",
-                    tuple(row)
-                )
-                inserted += 1
+        upload = request.files.get('file')
+        if upload:
+            options = request.form
+            table_name = options.get('table_name')
+            # Werkzeug spools large uploads to disk; read them back as a stream of rows.
+            # Decode line by line: TextIOWrapper cannot wrap a SpooledTemporaryFile before Python 3.11
+            reader = csv.reader(codecs.iterdecode(upload.stream, 'utf-8-sig'))
+            headers = next(reader, None)
+            rows = reader
+            if not table_name or not headers:
+                return jsonify({'success': False, 'error': 'Missing table_name or CSV headers'})
+        else:
+            data = request.json
+            options = data
+            table_name = data.get('table_name')
+            csv_data = data.get('csv_data', [])
+            
+            if not table_name or not csv_data:
+                return jsonify({'success': False, 'error': 'Missing table_name or csv_data'})
+            
+            if len(csv_data) < 2:
+                return jsonify({'success': False, 'error': 'CSV must have headers and at least one row'})
+            
+            headers = csv_data[0]
+            rows = csv_data[1:]
+
+        headers = [str(h).strip() for h in headers]
+        batch_size = min(max(int(options.get('batch_size', IMPORT_BATCH_SIZE)), 1), IMPORT_MAX_BATCH_SIZE)
+        commit_mode = options.get('commit_mode', 'single')
+        on_error = options.get('on_error', 'abort')
+        if commit_mode not in ('single', 'chunked') or on_error not in ('abort', 'skip'):
+            return jsonify({'success': False, 'error': 'Invalid commit_mode or on_error'})
+
+        # Only allow real columns of a real table into the generated INSERT
+        known_columns = table_columns(table_name)
+        if not known_columns:
+            return jsonify({'success': False, 'error': f'Unknown table: {table_name}'})
+        unknown = [h for h in headers if h not in known_columns]
+        if unknown:
+            return jsonify({'success': False, 'error': f"Unknown columns: {', '.join(unknown)}"})
+
+        result = bulk_import_rows(table_name, headers, rows, batch_size, commit_mode, on_error)
+        if result['inserted']:
+            invalidate_cache(*TABLE_CACHE_TAGS.get(table_name, ()))
         
-        return jsonify({'success': True, 'inserted': inserted})
+        return jsonify({'success': not result['aborted'], **result})
     except Exception as e:
         print(f"Import CSV error: {e}")
         return jsonify({'success': False, 'error': str(e)})
@@ -1330,16 +5028,20 @@ def api_create_admin_user():
         if not username or not password:
             return jsonify({'success': False, 'error': 'Username and password required'})
         
-        # Check if username exists
-        existing = execute_query("SELECT * FROM admin WHERE username=%s", (username,), fetch=True)
-        if existing:
-            return jsonify({'success': False, 'error': 'Username already exists'})
+        def create_admin():
+            # Check if username exists
+            existing = execute_query("SELECT * FROM admin WHERE username=%s", (username,), fetch=True)
+            if existing:
+                return False
         
-        execute_query(
-            "INSERT INTO admin (username, password, email) VALUES (%s, %s, %s)",
-            (username, password, email)
-        )
+            execute_query(
+                "INSERT INTO admin (username, password, email) VALUES (%s, %s, %s)",
+                (username, password, email)
+            )
+            return True
         
+        if not retry_transaction(create_admin):
+            return jsonify({'success': False, 'error': 'Username already exists'})
         return jsonify({'success': True})
     except Exception as e:
         print(f"Create admin user error: {e}")
@@ -1386,42 +5088,101 @@ def api_delete_admin_user(user_id):
         return jsonify({'success': False, 'error': str(e)})
 
 # ---------- Advanced Search: Search Across All Tables ----------
+GLOBAL_SEARCH_WORKERS = 4             # concurrent table scans (well below the pool size)
+GLOBAL_SEARCH_TABLE_BUDGET_MS = 2000  # MAX_EXECUTION_TIME per table query
+GLOBAL_SEARCH_DEADLINE_MS = 3000      # overall wait before returning partial results
+GLOBAL_SEARCH_MAX_BUDGET_MS = 10000
+TEXT_DATA_TYPES = ('varchar', 'tinytext', 'text', 'mediumtext', 'longtext')
+QUERY_TIMEOUT_ERRNO = 3024            # statement hit MAX_EXECUTION_TIME
+SCHEMA_CHANGE_ERRNOS = (1054, 1146)   # unknown column / table: cached metadata is stale (DDL run outside the app)
+
+search_executor = ThreadPoolExecutor(max_workers=GLOBAL_SEARCH_WORKERS, thread_name_prefix='global-search')
+
+@cached_loader('schema_metadata', tags=('schema',))
+def load_schema_metadata():
+    """Every table's columns and data types, read from information_schema in one query"""
+    rows = execute_query("""
+        SELECT table_name AS table_name, column_name AS column_name, data_type AS data_type
+        FROM information_schema.COLUMNS
+        WHERE table_schema = DATABASE()
+        ORDER BY table_name, ordinal_position
+    """, fetch=True)
+    schema = {}
+    for row in rows:
+        schema.setdefault(row['table_name'], []).append({'name': row['column_name'], 'type': row['data_type']})
+    return schema
+
+def _search_table(table_name, columns, term, limit, budget_ms):
+    """LIKE-scan one table on its own pooled connection under a server-side time budget"""
+    conditions = ' OR '.join([f"`{col}` LIKE %s" for col in columns])
+    query = (f"SELECT /*+ MAX_EXECUTION_TIME({int(budget_ms)}) */ * FROM `{table_name}` "
+             f"WHERE {conditions} LIMIT %s")
+    params = tuple(['%' + term + '%'] * len(columns) + [limit])
+    return fetch_on_own_connection(query, params)
+
 @app.route('/api/admin/search/global', methods=['POST'])
 def api_global_search():
-    """Search across all tables for a term"""
+    """Search across all tables for a term
+
+    Table metadata comes from the schema cache; tables are scanned
+    concurrently and anything still running at the deadline is reported in
+    truncated_tables instead of delaying the response.
+    """
     try:
         data = request.json
         search_term = data.get('term', '')
-        limit = int(data.get('limit', 10))
+        limit = min(max(int(data.get('limit', 10)), 1), 100)
+        budget_ms = min(max(int(data.get('budget_ms', GLOBAL_SEARCH_TABLE_BUDGET_MS)), 100), GLOBAL_SEARCH_MAX_BUDGET_MS)
+        deadline_ms = min(max(int(data.get('deadline_ms', GLOBAL_SEARCH_DEADLINE_MS)), 100), GLOBAL_SEARCH_MAX_BUDGET_MS)
         
         if not search_term:
             return jsonify({'success': False, 'error': 'Search term required'})
         
-        # Get all tables
-        tables = execute_query("SHOW TABLES", fetch=True)
-        results = {}
+        started = time.perf_counter()
+        schema = load_schema_metadata()
+        futures = {}
+        for table_name, columns in schema.items():
+            text_columns = [col['name'] for col in columns if col['type'].lower() in TEXT_DATA_TYPES]
+            if text_columns:
+                future = search_executor.submit(_search_table, table_name, text_columns, search_term, limit, budget_ms)
+                futures[future] = table_name
         
-        for table in tables:
-            table_name = list(table.values())[0]
+        done, pending = wait(futures, timeout=deadline_ms / 1000.0)
+        
+        results = {}
+        errors = {}
+        truncated_tables = []
+        for future in done:
+            table_name = futures[future]
             try:
-                # Get column names
-                structure = execute_query(f"DESCRIBE `{table_name}`", fetch=True)
-                text_columns = [col['Field'] for col in structure if 'varchar' in col['Type'].lower() or 'text' in col['Type'].lower()]
-                
-                if text_columns:
-                    # Build search query
-                    conditions = ' OR '.join([f"`{col}` LIKE %s" for col in text_columns])
-                    query = f"SELECT * FROM `{table_name}` WHERE {conditions} LIMIT %s"
-                    params = tuple(['%' + search_term + '%'] * len(text_columns) + [limit])
-                    
-                    matches = execute_query(query, params, fetch=True)
-                    if matches:
-                        results[table_name] = matches
+                matches = future.result()
+                if matches:
+                    results[table_name] = matches
+            except Error as e:
+                if e.errno == QUERY_TIMEOUT_ERRNO:
+                    truncated_tables.append(table_name)
+                    continue
+                if e.errno in SCHEMA_CHANGE_ERRNOS:
+                    # The table changed under us (DDL); reload metadata next time
+                    invalidate_cache('schema')
+                print(f"Search error in table {table_name}: {e}")
+                errors[table_name] = str(e)
             except Exception as e:
                 print(f"Search error in table {table_name}: {e}")
-                continue
+                errors[table_name] = str(e)
+        for future in pending:
+            # Queued scans are dropped; running ones end at their MAX_EXECUTION_TIME
+            future.cancel()
+            truncated_tables.append(futures[future])
         
-        return jsonify({'success': True, 'results': results})
+        return jsonify({
+            'success': True,
+            'results': results,
+            'truncated': bool(truncated_tables),
+            'truncated_tables': sorted(truncated_tables),
+            'errors': errors,
+            'elapsed_ms': round((time.perf_counter() - started) * 1000, 2)
+        })
     except Exception as e:
         print(f"Global search error: {e}")
         return jsonify({'success': False, 'error': str(e)})
@@ -1435,16 +5196,18 @@ def api_audit_logs():
         limit = int(request.args.get('limit', 50))
         offset = (page - 1) * limit
         
-        # Get activity logs
-        logs = execute_query("""
-            SELECT * FROM activity_log 
-            WHERE user_type = 'admin' 
-            ORDER BY created_at DESC 
-            LIMIT %s OFFSET %s
-        """, (limit, offset), fetch=True)
-        
-        # Get total count
-        count = execute_query("SELECT COUNT(*) as total FROM activity_log WHERE user_type = 'admin'", fetch=True)
+        # Page of activity logs and the total count, fetched concurrently
+        results = fetch_parallel({
+            'logs': ("""
+                SELECT * FROM activity_log 
+                WHERE user_type = 'admin' 
+                ORDER BY created_at DESC 
+                LIMIT %s OFFSET %s
+            """, (limit, offset)),
+            'count': ("SELECT COUNT(*) as total FROM activity_log WHERE user_type = 'admin'", None),
+        })
+        logs = results['logs']
+        count = results['count']
         total = count[0]['total'] if count else 0
         
         return jsonify({
@@ -1502,14 +5265,17 @@ def api_update_settings():
                     value TEXT
                 )
             """)
-        
-        for key, value in data.items():
-            # Insert or update
-            execute_query("""
-                INSERT INTO settings (`key`, value) 
-                VALUES (%s, %s) 
-                ON DUPLICATE KEY UPDATE value = %s
-            """, (key, str(value), str(value)))
+            invalidate_cache('schema')
+        
+        def save_settings():
+            for key, value in data.items():
+                # Insert or update
+                execute_query("""
+                    INSERT INTO settings (`key`, value) 
+                    VALUES (%s, %s) 
+                    ON DUPLICATE KEY UPDATE value = %s
+                """, (key, str(value), str(value)))
+        retry_transaction(save_settings)
         
         return jsonify({'success': True})
     except Exception as e:
@@ -1523,14 +5289,32 @@ def api_validate_data():
     try:
         issues = []
         
+        # The three integrity checks are independent, so run them concurrently
+        checks = fetch_parallel({
+            # Products without valid sellers
+            'orphaned_products': ("""
+                SELECT p.product_id, p.name 
+                FROM product p 
+                LEFT JOIN seller s ON s.id = p.seller_id 
+                WHERE p.seller_id IS NOT NULL AND s.id IS NULL
+            """, None),
+            # Orders without customers
+            'orphaned_orders': ("""
+                SELECT o.order_id 
+                FROM orders o 
+                LEFT JOIN customer c ON c.customer_id = o.customer_id 
+                WHERE o.customer_id IS NOT NULL AND c.customer_id IS NULL
+            """, None),
+            # Products with negative stock
+            'negative_stock': ("""
+                SELECT product_id, name, quantityavailable 
+                FROM product 
+                WHERE quantityavailable < 0
+            """, None),
+        })
+        
         # Check for orphaned records
-        # Products without valid sellers
-        orphaned_products = execute_query("""
-            SELECT p.product_id, p.name 
-            FROM product p 
-            LEFT JOIN seller s ON s.id = p.seller_id 
-            WHERE p.seller_id IS NOT NULL AND s.id IS NULL
-        """, fetch=True)
+        orphaned_products = checks['orphaned_products']
         if orphaned_products:
             issues.append({
                 'type': 'orphaned_products',
@@ -1538,13 +5322,7 @@ def api_validate_data():
                 'count': len(orphaned_products)
             })
         
-        # Orders without customers
-        orphaned_orders = execute_query("""
-            SELECT o.order_id 
-            FROM orders o 
-            LEFT JOIN customer c ON c.customer_id = o.customer_id 
-            WHERE o.customer_id IS NOT NULL AND c.customer_id IS NULL
-        """, fetch=True)
+        orphaned_orders = checks['orphaned_orders']
         if orphaned_orders:
             issues.append({
                 'type': 'orphaned_orders',
@@ -1552,12 +5330,7 @@ def api_validate_data():
                 'count': len(orphaned_orders)
             })
         
-        # Products with negative stock
-        negative_stock = execute_query("""
-            SELECT product_id, name, quantityavailable 
-            FROM product 
-            WHERE quantityavailable < 0
-        """, fetch=True)
+        negative_stock = checks['negative_stock']
         if negative_stock:
             issues.append({
                 'type': 'negative_stock',
@@ -1606,21 +5379,25 @@ def api_optimize_database():
 # ========== CLOTHING SHOPPING APP FEATURES ==========
 
 # ---------- Category Management ----------
+@cached_loader('categories', tags=('product',))
+def load_categories():
+    return execute_query("""
+        SELECT 
+            category,
+            COUNT(*) as product_count,
+            SUM(quantityavailable) as total_stock,
+            AVG(price) as avg_price,
+            SUM(CASE WHEN quantityavailable = 0 THEN 1 ELSE 0 END) as out_of_stock
+        FROM product
+        GROUP BY category
+        ORDER BY product_count DESC
+    """, fetch=True)
+
 @app.route('/api/admin/categories', methods=['GET'])
 def api_get_categories():
     """Get all product categories with statistics"""
     try:
-        categories = execute_query("""
-            SELECT 
-                category,
-                COUNT(*) as product_count,
-                SUM(quantityavailable) as total_stock,
-                AVG(price) as avg_price,
-                SUM(CASE WHEN quantityavailable = 0 THEN 1 ELSE 0 END) as out_of_stock
-            FROM product
-            GROUP BY category
-            ORDER BY product_count DESC
-        """, fetch=True)
+        categories = load_categories()
         return jsonify({'success': True, 'categories': categories})
     except Exception as e:
         print(f"Get categories error: {e}")
@@ -1640,13 +5417,12 @@ def api_get_category_products(category):
 # ---------- Top Customers ----------
 @app.route('/api/admin/customers/top')
 def api_top_customers():
-    """Get top customers using optimized view with pre-calculated values"""
+    """Get top customers from the stored lifetime value (idx_customer_lifetime)"""
     try:
         limit = int(request.args.get('limit', 10))
-        # Use v_customer_summary view which has all stats pre-calculated
-        customers = execute_query("""
-            SELECT *
-            FROM v_customer_summary
+        customers = execute_query(f"""
+            SELECT {CUSTOMER_SUMMARY_COLUMNS}
+            FROM customer
             WHERE lifetime_value > 0
             ORDER BY lifetime_value DESC
             LIMIT %s
@@ -1673,15 +5449,7 @@ def api_customer_history(customer_id):
         
         # Create items array from order data
         for order in orders:
-            if order.get('product_id') and order.get('product_name'):
-                order['items'] = [{
-                    'product_name': order.get('product_name', 'N/A'),
-                    'category': order.get('product_category', 'N/A'),
-                    'qty': 1,  # Default quantity
-                    'price': float(order.get('product_price', order.get('total_amount', 0)))
-                }]
-            else:
-                order['items'] = []
+            order['items'] = order_items(order, name_key='product_name')
         
         return jsonify({'success': True, 'orders': orders})
     except Exception as e:
@@ -1690,11 +5458,15 @@ def api_customer_history(customer_id):
         traceback.print_exc()
         return jsonify({'success': False, 'error': str(e)})
 
+@cached_loader('customer_stats', tags=('customer', 'customer:{0}'))
+def load_customer_stats(customer_id):
+    return call_procedure('sp_get_customer_stats', (customer_id,))
+
 @app.route('/api/admin/customers/<int:customer_id>/stats')
 def api_customer_stats(customer_id):
     """Get detailed customer statistics using stored procedure"""
     try:
-        stats = execute_query("CALL sp_get_customer_stats(%s)", (customer_id,), fetch=True)
+        stats = load_customer_stats(customer_id)
         if stats and len(stats) > 0:
             return jsonify({'success': True, 'stats': stats[0]})
         else:
@@ -1808,6 +5580,7 @@ def api_create_coupon():
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
                 )
             """)
+            invalidate_cache('schema')
         
         execute_query("""
             INSERT INTO coupons (code, discount_type, discount_value, min_purchase, max_discount, valid_from, valid_until, usage_limit)
@@ -1907,24 +5680,28 @@ def api_daily_sales():
         return jsonify({'success': False, 'error': str(e)})
 
 # ---------- Product Performance by Category ----------
+@cached_loader('category_performance', tags=('orders', 'product'))
+def load_category_performance():
+    # Use v_product_sales view for aggregated product data
+    return execute_query("""
+        SELECT 
+            category,
+            COUNT(DISTINCT product_id) as total_products,
+            SUM(quantityavailable) as total_stock,
+            SUM(CASE WHEN quantityavailable = 0 THEN 1 ELSE 0 END) as out_of_stock,
+            COALESCE(SUM(total_orders), 0) as total_sold,
+            COALESCE(SUM(total_revenue), 0) as revenue,
+            AVG(price) as avg_price
+        FROM v_product_sales
+        GROUP BY category
+        ORDER BY revenue DESC
+    """, fetch=True)
+
 @app.route('/api/admin/analytics/category-performance')
 def api_category_performance():
     """Get performance metrics by category using optimized view"""
     try:
-        # Use v_product_sales view for aggregated product data
-        performance = execute_query("""
-            SELECT 
-                category,
-                COUNT(DISTINCT product_id) as total_products,
-                SUM(quantityavailable) as total_stock,
-                SUM(CASE WHEN quantityavailable = 0 THEN 1 ELSE 0 END) as out_of_stock,
-                COALESCE(SUM(total_orders), 0) as total_sold,
-                COALESCE(SUM(total_revenue), 0) as revenue,
-                AVG(price) as avg_price
-            FROM v_product_sales
-            GROUP BY category
-            ORDER BY revenue DESC
-        """, fetch=True)
+        performance = load_category_performance()
         return jsonify({'success': True, 'performance': performance})
     except Exception as e:
         print(f"Category performance error: {e}")
@@ -1953,22 +5730,79 @@ def api_recent_orders():
         return jsonify({'success': False, 'error': str(e)})
 
 # ---------- Product Search with Filters ----------
+SEARCH_PAGE_SIZE = 50
+SEARCH_PAGE_MAX = 200
+FULLTEXT_MIN_TOKEN = 3          # InnoDB innodb_ft_min_token_size default
+FULLTEXT_RECHECK_SECONDS = 300  # how often to re-check whether the index exists
+FULLTEXT_COLUMNS = 'name, description, category'
+
+fulltext_index = {'available': False, 'checked_at': 0.0}
+
+def product_fulltext_available():
+    """Whether ft_product_search exists (cached; re-checked every few minutes)"""
+    now = time.time()
+    if now - fulltext_index['checked_at'] > FULLTEXT_RECHECK_SECONDS:
+        try:
+            # MATCH() needs an index over exactly FULLTEXT_COLUMNS, not just any FULLTEXT index
+            rows = execute_query("""
+                SELECT COLUMN_NAME as column_name
+                FROM information_schema.STATISTICS
+                WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'product'
+                  AND INDEX_NAME = 'ft_product_search' AND INDEX_TYPE = 'FULLTEXT'
+            """, fetch=True)
+            indexed = {row['column_name'].lower() for row in rows or []}
+            fulltext_index['available'] = indexed == {c.strip() for c in FULLTEXT_COLUMNS.split(',')}
+        except Exception as e:
+            print(f"Fulltext index check failed: {e}")
+            fulltext_index['available'] = False
+        fulltext_index['checked_at'] = now
+    return fulltext_index['available']
+
+def fulltext_boolean_query(text):
+    """Turn free text into a BOOLEAN MODE query: every term required, prefix-matched"""
+    terms = [term for term in re.split(r'[^\w]+', text.lower()) if term]
+    if not terms or any(len(term) < FULLTEXT_MIN_TOKEN for term in terms):
+        # Terms below the index's minimum token size are never indexed
+        return None
+    return ' '.join(f'+{term}*' for term in terms)
+
 @app.route('/api/admin/products/search')
 def api_search_products():
-    """Advanced product search with multiple filters"""
+    """Advanced product search with multiple filters
+
+    Free text uses the FULLTEXT index over name/description/category with
+    relevance ranking and prefix matching; very short terms (or a missing
+    index) fall back to LIKE.
+    """
     try:
-        query = request.args.get('q', '')
+        query = request.args.get('q', '').strip()
         category = request.args.get('category', '')
         min_price = request.args.get('min_price')
         max_price = request.args.get('max_price')
         in_stock = request.args.get('in_stock')
+        limit = min(max(int(request.args.get('limit', SEARCH_PAGE_SIZE)), 1), SEARCH_PAGE_MAX)
+        offset = max(int(request.args.get('offset', 0)), 0)
         
-        sql = "SELECT * FROM product WHERE 1=1"
+        select = "SELECT *"
+        sql = " FROM product WHERE 1=1"
+        select_params = []
         params = []
+        order_by = " ORDER BY product_id DESC"
+        mode = 'none'
         
         if query:
-            sql += " AND (name LIKE %s OR description LIKE %s)"
-            params.extend([f'%{query}%', f'%{query}%'])
+            boolean_query = fulltext_boolean_query(query)
+            if boolean_query and product_fulltext_available():
+                mode = 'fulltext'
+                select += f", MATCH({FULLTEXT_COLUMNS}) AGAINST(%s IN BOOLEAN MODE) as relevance"
+                select_params.append(boolean_query)
+                sql += f" AND MATCH({FULLTEXT_COLUMNS}) AGAINST(%s IN BOOLEAN MODE)"
+                params.append(boolean_query)
+                order_by = " ORDER BY relevance DESC, product_id DESC"
+            else:
+                mode = 'like'
+                sql += " AND (name LIKE %s OR description LIKE %s OR category LIKE %s)"
+                params.extend([f'%{query}%', f'%{query}%', f'%{query}%'])
         
         if category:
             sql += " AND category = %s"
@@ -1987,10 +5821,22 @@ def api_search_products():
         elif in_stock == 'false':
             sql += " AND quantityavailable = 0"
         
-        sql += " ORDER BY product_id DESC"
-        
-        products = execute_query(sql, tuple(params) if params else None, fetch=True)
-        return jsonify({'success': True, 'products': products, 'count': len(products)})
+        # Fetch one extra row to report whether another page exists
+        all_params = tuple(select_params + params + [limit + 1, offset])
+        products = execute_query(select + sql + order_by + " LIMIT %s OFFSET %s", all_params, fetch=True)
+        has_more = len(products) > limit
+        products = products[:limit]
+        return jsonify({
+            'success': True,
+            'products': products,
+            'count': len(products),
+            'has_more': has_more,
+            'limit': limit,
+            'offset': offset,
+            'mode': mode
+        })
+    except ValueError as e:
+        return jsonify({'success': False, 'error': f'Invalid parameter: {e}'}), 400
     except Exception as e:
         print(f"Product search error: {e}")
         return jsonify({'success': False, 'error': str(e)})
@@ -2026,37 +5872,25 @@ def api_shipping_status_overview():
 def api_order_statistics():
     """Get comprehensive order statistics"""
     try:
-        stats = {}
-        
-        # Total orders
-        total_orders = execute_query("SELECT COUNT(*) as total FROM orders", fetch=True)[0]['total']
-        stats['total_orders'] = total_orders
+        # The snapshot and the status breakdown are independent; fetch them together
+        results = fetch_parallel({
+            'snapshot': get_dashboard_snapshot,
+            'by_status': ("""
+                SELECT status, COUNT(*) as count
+                FROM orders
+                GROUP BY status
+            """, None),
+        })
+        snapshot = results['snapshot']
+        stats = {'total_orders': snapshot['total_orders']}
         
         # Orders by status
-        orders_by_status = execute_query("""
-            SELECT status, COUNT(*) as count
-            FROM orders
-            GROUP BY status
-        """, fetch=True)
-        stats['by_status'] = orders_by_status
-        
-        # Average order value
-        avg_order = execute_query("SELECT AVG(total_amount) as avg FROM orders", fetch=True)[0]['avg'] or 0
-        stats['avg_order_value'] = float(avg_order)
-        
-        # Orders today
-        orders_today = execute_query("""
-            SELECT COUNT(*) as total FROM orders 
-            WHERE DATE(order_date) = CURDATE()
-        """, fetch=True)[0]['total']
-        stats['orders_today'] = orders_today
-        
-        # Revenue today
-        revenue_today = execute_query("""
-            SELECT COALESCE(SUM(total_amount), 0) as total FROM orders 
-            WHERE DATE(order_date) = CURDATE()
-        """, fetch=True)[0]['total']
-        stats['revenue_today'] = float(revenue_today)
+        stats['by_status'] = results['by_status']
+        
+        # Average order value, orders and revenue today come from the snapshot
+        stats['avg_order_value'] = snapshot['avg_order_value']
+        stats['orders_today'] = snapshot['orders_today']
+        stats['revenue_today'] = snapshot['revenue_today']
         
         return jsonify({'success': True, 'statistics': stats})
     except Exception as e:
@@ -2178,6 +6012,17 @@ def api_generate_bill_pdf(order_id):
         traceback.print_exc()
         return jsonify({'success': False, 'error': str(e)}), 500
 
+# ---------- Cache Warm-up & Background Workers ----------
+if pool is not None:
+    warm_cache()
+    start_stats_refresher()
+    start_retention_worker()
+replicas.start()
+# The debug reloader's parent process never serves requests; only the serving
+# process may replay and own the outbox journal
+if not (__name__ == '__main__' and os.environ.get('WERKZEUG_RUN_MAIN') is None):
+    outbox.start()
+
 # ---------- Run App ----------
 if __name__ == '__main__':
     app.run(debug=True)
@@ -0,0 +1,147 @@
+"""Concurrency benchmark for sp_process_order.
+
+Creates a throw-away product with a fixed stock, lets N client threads race
+to buy it one unit at a time until it sells out, and checks that exactly
+`stock` orders and payments were written and stock ended at zero (no
+oversell, no lost sale). Reports orders/second for each concurrency level.
+
+Run it against a development copy of the database:
+
+    python benchmark_orders.py --customer-id 1 --stock 2000 --clients 1 16 64
+"""
+import argparse
+import threading
+import time
+
+import mysql.connector
+
+DB_CONFIG = {
+    'host': 'localhost',
+    'user': 'root',
+    'password': 'root',
+    'database': 'clothing_store',
+}
+
+OUT_OF_STOCK_SQLSTATE = '45001'
+TRANSIENT_ERRNOS = (1205, 1213)   # lock wait timeout, deadlock: the procedure rolled back, try again
+
+def create_product(stock):
+    conn = mysql.connector.connect(**DB_CONFIG)
+    cursor = conn.cursor()
+    cursor.execute(
+        "INSERT INTO product (name, description, price, category, quantityavailable) VALUES (%s,%s,%s,%s,%s)",
+        (f'Benchmark item {int(time.time() * 1000)}', 'sp_process_order benchmark', 1.00, 'Benchmark', stock))
+    conn.commit()
+    product_id = cursor.lastrowid
+    cursor.close()
+    conn.close()
+    return product_id
+
+def buyer(customer_id, product_id, start, counts, lock):
+    """Buy one unit at a time until the product is out of stock"""
+    conn = mysql.connector.connect(**DB_CONFIG)
+    cursor = conn.cursor()
+    placed = retries = 0
+    start.wait()
+    while True:
+        try:
+            cursor.callproc('sp_process_order', (customer_id, product_id, None))
+            for result in cursor.stored_results():
+                result.fetchall()
+            placed += 1
+        except mysql.connector.Error as e:
+            if e.sqlstate == OUT_OF_STOCK_SQLSTATE:
+                break
+            if e.errno in TRANSIENT_ERRNOS:
+                retries += 1
+                continue
+            raise
+    cursor.close()
+    conn.close()
+    with lock:
+        counts['placed'] += placed
+        counts['retries'] += retries
+
+def verify(product_id, stock, placed):
+    """Cross-check the database against what the clients saw"""
+    conn = mysql.connector.connect(**DB_CONFIG)
+    cursor = conn.cursor()
+    cursor.execute("SELECT quantityavailable FROM product WHERE product_id = %s", (product_id,))
+    remaining = cursor.fetchone()[0]
+    cursor.execute("SELECT COUNT(*) FROM orders WHERE product_id = %s", (product_id,))
+    orders = cursor.fetchone()[0]
+    cursor.execute("""
+        SELECT COUNT(*) FROM payments p
+        JOIN orders o ON o.order_id = p.order_id
+        WHERE o.product_id = %s AND p.payment_type = 'payment'
+    """, (product_id,))
+    payments = cursor.fetchone()[0]
+    cursor.close()
+    conn.close()
+    problems = []
+    if remaining != 0:
+        problems.append(f'stock ended at {remaining}')
+    if orders != stock:
+        problems.append(f'{orders} orders for {stock} units')
+    if payments != orders:
+        problems.append(f'{payments} payments for {orders} orders')
+    if placed != orders:
+        problems.append(f'clients saw {placed} successes, database has {orders} orders')
+    return problems
+
+def cleanup(product_id):
+    conn = mysql.connector.connect(**DB_CONFIG)
+    cursor = conn.cursor()
+    cursor.execute("DELETE p FROM payments p JOIN orders o ON o.order_id = p.order_id WHERE o.product_id = %s", (product_id,))
+    cursor.execute("DELETE FROM orders WHERE product_id = %s", (product_id,))
+    cursor.execute("DELETE FROM inventory_alerts WHERE product_id = %s", (product_id,))
+    cursor.execute("DELETE FROM product WHERE product_id = %s", (product_id,))
+    conn.commit()
+    cursor.close()
+    conn.close()
+
+def run_level(customer_id, clients, stock, keep):
+    product_id = create_product(stock)
+    counts = {'placed': 0, 'retries': 0}
+    lock = threading.Lock()
+    start = threading.Event()
+    threads = [threading.Thread(target=buyer, args=(customer_id, product_id, start, counts, lock))
+               for _ in range(clients)]
+    for t in threads:
+        t.start()
+    started = time.perf_counter()
+    start.set()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+    problems = verify(product_id, stock, counts['placed'])
+    if not keep:
+        cleanup(product_id)
+    return {
+        'clients': clients,
+        'orders': counts['placed'],
+        'retries': counts['retries'],
+        'seconds': elapsed,
+        'orders_per_second': counts['placed'] / elapsed if elapsed else 0.0,
+        'problems': problems,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Stress sp_process_order and check for oversell')
+    parser.add_argument('--customer-id', type=int, required=True, help='existing customer placing the orders')
+    parser.add_argument('--stock', type=int, default=2000, help='units to sell per concurrency level')
+    parser.add_argument('--clients', type=int, nargs='+', default=[1, 16, 64], help='concurrency levels')
+    parser.add_argument('--keep', action='store_true', help='keep the benchmark products, orders and payments')
+    args = parser.parse_args()
+
+    print(f"{'clients':>8} {'orders':>8} {'retries':>8} {'seconds':>9} {'orders/s':>10}  result")
+    failed = False
+    for clients in args.clients:
+        r = run_level(args.customer_id, clients, args.stock, args.keep)
+        result = 'OK (no oversell)' if not r['problems'] else 'FAIL: ' + '; '.join(r['problems'])
+        failed = failed or bool(r['problems'])
+        print(f"{r['clients']:>8} {r['orders']:>8} {r['retries']:>8} {r['seconds']:>9.2f} {r['orders_per_second']:>10.1f}  {result}")
+    raise SystemExit(1 if failed else 0)
+
+if __name__ == '__main__':
+    main()
@@ -11,48 +11,130 @@ USE clothing_store;
 -- 1. TRIGGERS
 -- ============================================
 
--- Trigger 1: Auto-update inventory when order is placed
+-- Sales rollups at day and month grain, maintained incrementally by the
+-- order/return triggers below (rebuild with CALL sp_rebuild_sales_rollups())
+CREATE TABLE IF NOT EXISTS sales_daily_rollup (
+    sale_date DATE PRIMARY KEY,
+    order_count INT NOT NULL DEFAULT 0,
+    gross_revenue DECIMAL(14,2) NOT NULL DEFAULT 0.00,
+    refunded_amount DECIMAL(14,2) NOT NULL DEFAULT 0.00,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS sales_monthly_rollup (
+    sale_month DATE PRIMARY KEY,  -- first day of the month
+    order_count INT NOT NULL DEFAULT 0,
+    gross_revenue DECIMAL(14,2) NOT NULL DEFAULT 0.00,
+    refunded_amount DECIMAL(14,2) NOT NULL DEFAULT 0.00,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+);
+
+-- Per-table row/size samples written by the app's background statistics refresher
+CREATE TABLE IF NOT EXISTS table_growth_history (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    table_name VARCHAR(64) NOT NULL,
+    captured_at DATETIME NOT NULL,
+    row_count BIGINT NOT NULL,
+    exact BOOLEAN NOT NULL DEFAULT TRUE,  -- FALSE when COUNT(*) timed out and the estimate was stored
+    data_bytes BIGINT NOT NULL DEFAULT 0,
+    index_bytes BIGINT NOT NULL DEFAULT 0,
+    INDEX idx_growth_table_time (table_name, captured_at),
+    INDEX idx_growth_time (captured_at)
+);
+
+-- Monthly partitions moved out of orders/activity_log by sp_archive_partitions
+CREATE TABLE IF NOT EXISTS partition_archives (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    table_name VARCHAR(64) NOT NULL,
+    partition_name VARCHAR(64) NOT NULL,
+    archive_table VARCHAR(64) NULL,  -- NULL when the partition was dropped
+    range_end DATE NOT NULL,         -- every row in the partition was before this date
+    row_count BIGINT NOT NULL DEFAULT 0,
+    action ENUM('archived', 'dropped') NOT NULL,
+    archived_at DATETIME NOT NULL,
+    INDEX idx_partition_archives_table (table_name, range_end)
+);
+
+-- Per-customer totals of orders that left the live orders table, so the
+-- aggregate reconciliation still counts them
+CREATE TABLE IF NOT EXISTS customer_archived_totals (
+    customer_id INT PRIMARY KEY,
+    archived_orders INT NOT NULL DEFAULT 0,
+    archived_gross DECIMAL(14,2) NOT NULL DEFAULT 0.00
+);
+
+-- Progress of the application's chunked retention purge, one row per table
+-- (a pass that runs out of time budget or fails resumes from last_key)
+CREATE TABLE IF NOT EXISTS retention_checkpoints (
+    table_name VARCHAR(64) PRIMARY KEY,
+    cutoff DATETIME NOT NULL,     -- rows older than this are purged in this pass
+    last_key BIGINT NULL,         -- primary key reached so far (NULL: not started)
+    end_key BIGINT NULL,          -- newest expired row when the pass started
+    rows_deleted BIGINT NOT NULL DEFAULT 0,
+    status ENUM('running', 'paused', 'done', 'failed') NOT NULL,
+    last_error TEXT NULL,
+    started_at DATETIME NOT NULL,
+    updated_at DATETIME NOT NULL,
+    finished_at DATETIME NULL
+);
+
+-- Stored customer stats read by the customer endpoints. total_orders,
+-- lifetime_value and avg_order_value are kept current by the triggers below;
+-- every trigger that touches them also sets stats_stale, and
+-- sp_update_customer_segments(FALSE) recomputes segment and last_order_date
+-- for just those customers (sp_reconcile_customer_aggregates repairs the aggregates)
+ALTER TABLE customer
+    ADD COLUMN last_order_date DATETIME NULL,
+    ADD COLUMN stats_stale BOOLEAN NOT NULL DEFAULT TRUE,
+    ADD COLUMN stats_refreshed_at DATETIME NULL;
+
+-- Trigger 1: Order bookkeeping when an order is placed
+-- (sp_process_order takes stock itself, under the same row lock that checks it,
+--  and sets @order_stock_taken so the unit is not taken twice; batch ingest sets
+--  @batch_ingest and applies these side effects once per chunk)
 DELIMITER $$
 CREATE TRIGGER trg_after_order_insert
 AFTER INSERT ON orders
 FOR EACH ROW
 BEGIN
-    -- Decrease product quantity (assuming quantity is 1 per order)
-    UPDATE product 
-    SET quantityavailable = quantityavailable - 1 
-    WHERE product_id = NEW.product_id 
-    AND quantityavailable > 0;
-    
-    -- Create inventory alert if stock is low (threshold: 10)
-    IF (SELECT quantityavailable FROM product WHERE product_id = NEW.product_id) <= 10 THEN
-        INSERT INTO inventory_alerts (product_id, alert_type, alert_status, created_at)
-        VALUES (NEW.product_id, 'low_stock', 'pending', NOW())
-        ON DUPLICATE KEY UPDATE alert_status = 'pending', created_at = NOW();
+    IF @batch_ingest IS NULL THEN
+        -- Decrease product quantity (one unit per order) for every other writer
+        IF @order_stock_taken IS NULL THEN
+            UPDATE product 
+            SET quantityavailable = quantityavailable - 1 
+            WHERE product_id = NEW.product_id 
+            AND quantityavailable > 0;
+        END IF;
+        
+        -- Create inventory alert if stock is low (threshold: 10)
+        IF (SELECT quantityavailable FROM product WHERE product_id = NEW.product_id) <= 10 THEN
+            INSERT INTO inventory_alerts (product_id, alert_type, alert_status, created_at)
+            VALUES (NEW.product_id, 'low_stock', 'pending', NOW())
+            ON DUPLICATE KEY UPDATE alert_status = 'pending', created_at = NOW();
+        END IF;
+        
+        -- Update customer lifetime value by O(1) deltas
+        -- (assignments run left to right, so avg_order_value sees the old total_orders;
+        --  sp_reconcile_customer_aggregates repairs any drift)
+        UPDATE customer 
+        SET avg_order_value = (COALESCE(avg_order_value, 0) * COALESCE(total_orders, 0) + COALESCE(NEW.total_amount, 0))
+                              / (COALESCE(total_orders, 0) + 1),
+            total_orders = COALESCE(total_orders, 0) + 1,
+            lifetime_value = COALESCE(lifetime_value, 0) + COALESCE(NEW.total_amount, 0),
+            last_order_date = GREATEST(COALESCE(last_order_date, NEW.order_date), NEW.order_date),
+            stats_stale = TRUE
+        WHERE customer_id = NEW.customer_id;
+        
+        -- Add the order to the sales rollups
+        CALL sp_apply_sales_delta(NEW.order_date, 1, COALESCE(NEW.total_amount, 0), 0);
+        
+        -- Log activity (unless the application's audit outbox writes it)
+        IF @audit_outbox IS NULL THEN
+            INSERT INTO activity_log (user_type, user_id, action, details, created_at)
+            VALUES ('system', NEW.customer_id, 'order_placed', 
+                    CONCAT('Order #', NEW.order_id, ' placed'), NOW());
+        END IF;
     END IF;
-    
-    -- Update customer lifetime value
-    UPDATE customer 
-    SET lifetime_value = (
-        SELECT COALESCE(SUM(total_amount), 0) 
-        FROM orders 
-        WHERE customer_id = NEW.customer_id
-    ),
-    total_orders = (
-        SELECT COUNT(*) 
-        FROM orders 
-        WHERE customer_id = NEW.customer_id
-    ),
-    avg_order_value = (
-        SELECT COALESCE(AVG(total_amount), 0) 
-        FROM orders 
-        WHERE customer_id = NEW.customer_id
-    )
-    WHERE customer_id = NEW.customer_id;
-    
-    -- Log activity
-    INSERT INTO activity_log (user_type, user_id, action, details, created_at)
-    VALUES ('system', NEW.customer_id, 'order_placed', 
-            CONCAT('Order #', NEW.order_id, ' placed'), NOW());
 END$$
 DELIMITER ;
 
@@ -69,18 +151,55 @@ BEGIN
         SET quantityavailable = quantityavailable + 1 
         WHERE product_id = NEW.product_id;
         
-        -- Log activity
-        INSERT INTO activity_log (user_type, user_id, action, details, created_at)
-        VALUES ('system', NEW.customer_id, 'order_cancelled', 
-                CONCAT('Order #', NEW.order_id, ' cancelled/returned'), NOW());
+        -- Log activity (unless the application's audit outbox writes it)
+        IF @audit_outbox IS NULL THEN
+            INSERT INTO activity_log (user_type, user_id, action, details, created_at)
+            VALUES ('system', NEW.customer_id, 'order_cancelled', 
+                    CONCAT('Order #', NEW.order_id, ' cancelled/returned'), NOW());
+        END IF;
     END IF;
     
     -- If shipping status changed, log it
-    IF OLD.shipping_status != NEW.shipping_status THEN
+    IF OLD.shipping_status != NEW.shipping_status AND @audit_outbox IS NULL THEN
         INSERT INTO notifications (user_type, user_id, notification_type, message, created_at)
         VALUES ('customer', NEW.customer_id, 'shipping_update', 
                 CONCAT('Your order #', NEW.order_id, ' status: ', NEW.shipping_status), NOW());
     END IF;
+    
+    -- Keep customer aggregates in step with amount or owner changes
+    IF NOT (OLD.customer_id <=> NEW.customer_id) THEN
+        UPDATE customer 
+        SET avg_order_value = CASE WHEN COALESCE(total_orders, 0) > 1
+                                   THEN (COALESCE(avg_order_value, 0) * total_orders - COALESCE(OLD.total_amount, 0)) / (total_orders - 1)
+                                   ELSE 0 END,
+            total_orders = GREATEST(COALESCE(total_orders, 0) - 1, 0),
+            lifetime_value = COALESCE(lifetime_value, 0) - COALESCE(OLD.total_amount, 0),
+            stats_stale = TRUE
+        WHERE customer_id = OLD.customer_id;
+        
+        UPDATE customer 
+        SET avg_order_value = (COALESCE(avg_order_value, 0) * COALESCE(total_orders, 0) + COALESCE(NEW.total_amount, 0))
+                              / (COALESCE(total_orders, 0) + 1),
+            total_orders = COALESCE(total_orders, 0) + 1,
+            lifetime_value = COALESCE(lifetime_value, 0) + COALESCE(NEW.total_amount, 0),
+            stats_stale = TRUE
+        WHERE customer_id = NEW.customer_id;
+    ELSEIF NOT (OLD.total_amount <=> NEW.total_amount) THEN
+        UPDATE customer 
+        SET avg_order_value = CASE WHEN COALESCE(total_orders, 0) > 0
+                                   THEN (COALESCE(avg_order_value, 0) * total_orders
+                                         + COALESCE(NEW.total_amount, 0) - COALESCE(OLD.total_amount, 0)) / total_orders
+                                   ELSE 0 END,
+            lifetime_value = COALESCE(lifetime_value, 0) + COALESCE(NEW.total_amount, 0) - COALESCE(OLD.total_amount, 0),
+            stats_stale = TRUE
+        WHERE customer_id = NEW.customer_id;
+    END IF;
+    
+    -- Move the order between rollup buckets when its date or amount changes
+    IF NOT (OLD.order_date <=> NEW.order_date) OR NOT (OLD.total_amount <=> NEW.total_amount) THEN
+        CALL sp_apply_sales_delta(OLD.order_date, -1, -COALESCE(OLD.total_amount, 0), 0);
+        CALL sp_apply_sales_delta(NEW.order_date, 1, COALESCE(NEW.total_amount, 0), 0);
+    END IF;
 END$$
 DELIMITER ;
 
@@ -90,15 +209,31 @@ CREATE TRIGGER trg_after_return_insert
 AFTER INSERT ON returns_refunds
 FOR EACH ROW
 BEGIN
-    -- Create notification for admin
-    INSERT INTO notifications (user_type, user_id, notification_type, message, created_at)
-    VALUES ('admin', NULL, 'return_request', 
-            CONCAT('New return request #', NEW.id, ' for order #', NEW.order_id), NOW());
-    
-    -- Log activity
-    INSERT INTO activity_log (user_type, user_id, action, details, created_at)
-    VALUES ('customer', NEW.customer_id, 'return_requested', 
-            CONCAT('Return request #', NEW.id, ' created'), NOW());
+    -- Notification and activity rows come from the application's audit outbox
+    -- when @audit_outbox is set; other clients still get them here
+    IF @audit_outbox IS NULL THEN
+        -- Create notification for admin
+        INSERT INTO notifications (user_type, user_id, notification_type, message, created_at)
+        VALUES ('admin', NULL, 'return_request', 
+                CONCAT('New return request #', NEW.id, ' for order #', NEW.order_id), NOW());
+        
+        -- Log activity
+        INSERT INTO activity_log (user_type, user_id, action, details, created_at)
+        VALUES ('customer', NEW.customer_id, 'return_requested', 
+                CONCAT('Return request #', NEW.id, ' created'), NOW());
+    END IF;
+    
+    -- Returns created already approved/refunded reduce lifetime value straight away
+    IF NEW.status IN ('Approved', 'Refunded') THEN
+        UPDATE customer 
+        SET lifetime_value = COALESCE(lifetime_value, 0) - COALESCE(NEW.refund_amount, 0),
+            stats_stale = TRUE
+        WHERE customer_id = NEW.customer_id;
+        
+        -- Refunds are booked against the original order's day/month
+        CALL sp_apply_sales_delta((SELECT order_date FROM orders WHERE order_id = NEW.order_id),
+                                  0, 0, COALESCE(NEW.refund_amount, 0));
+    END IF;
 END$$
 DELIMITER ;
 
@@ -123,22 +258,68 @@ BEGIN
         INSERT INTO payments (order_id, customer_id, amount, payment_type, payment_status, payment_date)
         VALUES (NEW.order_id, NEW.customer_id, NEW.refund_amount, 'refund', 'completed', NOW());
         
-        -- Notify customer
-        INSERT INTO notifications (user_type, user_id, notification_type, message, created_at)
-        VALUES ('customer', NEW.customer_id, 'return_approved', 
-                CONCAT('Your return #', NEW.id, ' has been approved. Refund: ₹', NEW.refund_amount), NOW());
+        -- Notify customer (unless the application's audit outbox does)
+        IF @audit_outbox IS NULL THEN
+            INSERT INTO notifications (user_type, user_id, notification_type, message, created_at)
+            VALUES ('customer', NEW.customer_id, 'return_approved', 
+                    CONCAT('Your return #', NEW.id, ' has been approved. Refund: ₹', NEW.refund_amount), NOW());
+        END IF;
     END IF;
     
     -- If return is rejected, notify customer
-    IF OLD.status = 'Requested' AND NEW.status = 'Rejected' THEN
+    IF OLD.status = 'Requested' AND NEW.status = 'Rejected' AND @audit_outbox IS NULL THEN
         INSERT INTO notifications (user_type, user_id, notification_type, message, created_at)
         VALUES ('customer', NEW.customer_id, 'return_rejected', 
                 CONCAT('Your return request #', NEW.id, ' has been rejected'), NOW());
     END IF;
+    
+    -- Approved/refunded returns count against lifetime value (O(1) delta)
+    -- (and against the original order's sales rollup bucket)
+    IF OLD.status NOT IN ('Approved', 'Refunded') AND NEW.status IN ('Approved', 'Refunded') THEN
+        UPDATE customer 
+        SET lifetime_value = COALESCE(lifetime_value, 0) - COALESCE(NEW.refund_amount, 0),
+            stats_stale = TRUE
+        WHERE customer_id = NEW.customer_id;
+        CALL sp_apply_sales_delta((SELECT order_date FROM orders WHERE order_id = NEW.order_id),
+                                  0, 0, COALESCE(NEW.refund_amount, 0));
+    ELSEIF OLD.status IN ('Approved', 'Refunded') AND NEW.status NOT IN ('Approved', 'Refunded') THEN
+        UPDATE customer 
+        SET lifetime_value = COALESCE(lifetime_value, 0) + COALESCE(OLD.refund_amount, 0),
+            stats_stale = TRUE
+        WHERE customer_id = OLD.customer_id;
+        CALL sp_apply_sales_delta((SELECT order_date FROM orders WHERE order_id = OLD.order_id),
+                                  0, 0, -COALESCE(OLD.refund_amount, 0));
+    ELSEIF OLD.status IN ('Approved', 'Refunded') AND NOT (OLD.refund_amount <=> NEW.refund_amount) THEN
+        UPDATE customer 
+        SET lifetime_value = COALESCE(lifetime_value, 0) + COALESCE(OLD.refund_amount, 0) - COALESCE(NEW.refund_amount, 0),
+            stats_stale = TRUE
+        WHERE customer_id = NEW.customer_id;
+        CALL sp_apply_sales_delta((SELECT order_date FROM orders WHERE order_id = NEW.order_id),
+                                  0, 0, COALESCE(NEW.refund_amount, 0) - COALESCE(OLD.refund_amount, 0));
+    END IF;
 END$$
 DELIMITER ;
 
--- Trigger 5: Auto-update product stock alerts
+-- Trigger 5: Keep customer aggregates correct when an order is deleted
+DELIMITER $$
+CREATE TRIGGER trg_after_order_delete
+AFTER DELETE ON orders
+FOR EACH ROW
+BEGIN
+    UPDATE customer 
+    SET avg_order_value = CASE WHEN COALESCE(total_orders, 0) > 1
+                               THEN (COALESCE(avg_order_value, 0) * total_orders - COALESCE(OLD.total_amount, 0)) / (total_orders - 1)
+                               ELSE 0 END,
+        total_orders = GREATEST(COALESCE(total_orders, 0) - 1, 0),
+        lifetime_value = COALESCE(lifetime_value, 0) - COALESCE(OLD.total_amount, 0),
+        stats_stale = TRUE
+    WHERE customer_id = OLD.customer_id;
+    
+    CALL sp_apply_sales_delta(OLD.order_date, -1, -COALESCE(OLD.total_amount, 0), 0);
+END$$
+DELIMITER ;
+
+-- Trigger 6: Auto-update product stock alerts
 DELIMITER $$
 CREATE TRIGGER trg_after_product_update
 AFTER UPDATE ON product
@@ -164,7 +345,10 @@ DELIMITER ;
 -- 2. STORED PROCEDURES
 -- ============================================
 
--- Procedure 1: Process new order (with validation)
+-- Procedure 1: Place an order atomically (one unit per order, as everywhere in the schema)
+-- Conditional stock decrement, order and payment commit together or not at all.
+-- p_total_amount may be NULL to charge the current product price.
+-- Signals SQLSTATE 45001 when the product is out of stock, 45002 when it does not exist.
 DELIMITER $$
 CREATE PROCEDURE sp_process_order(
     IN p_customer_id INT,
@@ -172,26 +356,63 @@ CREATE PROCEDURE sp_process_order(
     IN p_total_amount DECIMAL(10,2)
 )
 BEGIN
+    DECLARE v_price DECIMAL(10,2);
     DECLARE v_stock INT;
+    DECLARE v_total DECIMAL(10,2);
     DECLARE v_order_id INT;
     
-    -- Check stock availability
-    SELECT quantityavailable INTO v_stock 
+    DECLARE EXIT HANDLER FOR SQLEXCEPTION
+    BEGIN
+        SET @order_stock_taken = NULL;
+        ROLLBACK;
+        RESIGNAL;
+    END;
+    
+    START TRANSACTION;
+    
+    -- Checked up front (trg_before_order_insert_refs would also reject it) so the
+    -- caller gets a specific SQLSTATE
+    IF NOT EXISTS (SELECT 1 FROM customer WHERE customer_id = p_customer_id) THEN
+        SIGNAL SQLSTATE '45003' SET MESSAGE_TEXT = 'Customer not found';
+    END IF;
+    
+    -- Check and take stock in one statement: the row lock serialises concurrent
+    -- buyers, so two orders can never both take the last unit
+    UPDATE product 
+    SET quantityavailable = quantityavailable - 1 
+    WHERE product_id = p_product_id 
+    AND quantityavailable >= 1;
+    
+    IF ROW_COUNT() = 0 THEN
+        IF EXISTS (SELECT 1 FROM product WHERE product_id = p_product_id) THEN
+            SIGNAL SQLSTATE '45001' SET MESSAGE_TEXT = 'Product out of stock';
+        END IF;
+        SIGNAL SQLSTATE '45002' SET MESSAGE_TEXT = 'Product not found';
+    END IF;
+    
+    -- Already locked by the UPDATE above
+    SELECT price, quantityavailable INTO v_price, v_stock 
     FROM product 
     WHERE product_id = p_product_id;
     
-    IF v_stock <= 0 THEN
-        SIGNAL SQLSTATE '45000' SET MESSAGE_TEXT = 'Product out of stock';
-    END IF;
+    SET v_total = COALESCE(p_total_amount, v_price);
     
-    -- Create order
+    -- Create order (the unit is already taken, so trg_after_order_insert must not take another)
+    SET @order_stock_taken = 1;
     INSERT INTO orders (customer_id, product_id, total_amount, status, shipping_status, order_date)
-    VALUES (p_customer_id, p_product_id, p_total_amount, 'Pending', 'Pending', NOW());
+    VALUES (p_customer_id, p_product_id, v_total, 'Pending', 'Pending', NOW());
+    SET @order_stock_taken = NULL;
     
     SET v_order_id = LAST_INSERT_ID();
     
-    -- Return order ID
-    SELECT v_order_id as order_id;
+    -- Record the payment in the same transaction
+    INSERT INTO payments (order_id, customer_id, amount, payment_type, payment_status, payment_date)
+    VALUES (v_order_id, p_customer_id, v_total, 'payment', 'completed', NOW());
+    
+    COMMIT;
+    
+    -- Return the new order
+    SELECT v_order_id as order_id, v_total as total_amount, v_stock as remaining_stock;
 END$$
 DELIMITER ;
 
@@ -199,22 +420,12 @@ DELIMITER ;
 DELIMITER $$
 CREATE PROCEDURE sp_get_customer_stats(IN p_customer_id INT)
 BEGIN
+    -- Stored stats (total_orders, lifetime_value, avg_order_value, last_order_date, segment)
     SELECT 
         c.*,
-        COUNT(DISTINCT o.order_id) as total_orders,
-        COALESCE(SUM(o.total_amount), 0) as total_spent,
-        COALESCE(AVG(o.total_amount), 0) as avg_order_value,
-        MAX(o.order_date) as last_order_date,
-        CASE 
-            WHEN COALESCE(SUM(o.total_amount), 0) >= 50000 THEN 'VIP'
-            WHEN COALESCE(SUM(o.total_amount), 0) >= 20000 THEN 'Premium'
-            WHEN COALESCE(SUM(o.total_amount), 0) >= 5000 THEN 'Regular'
-            ELSE 'New'
-        END as segment
+        c.lifetime_value as total_spent
     FROM customer c
-    LEFT JOIN orders o ON o.customer_id = c.customer_id
-    WHERE c.customer_id = p_customer_id
-    GROUP BY c.customer_id;
+    WHERE c.customer_id = p_customer_id;
 END$$
 DELIMITER ;
 
@@ -234,21 +445,466 @@ BEGIN
 END$$
 DELIMITER ;
 
--- Procedure 4: Update customer segment based on spending
+-- Customer segment for a lifetime value (net of refunds)
+DELIMITER $$
+CREATE FUNCTION fn_customer_segment(p_lifetime_value DECIMAL(14,2))
+RETURNS VARCHAR(20)
+DETERMINISTIC NO SQL
+BEGIN
+    RETURN CASE 
+        WHEN COALESCE(p_lifetime_value, 0) >= 50000 THEN 'VIP'
+        WHEN COALESCE(p_lifetime_value, 0) >= 20000 THEN 'Premium'
+        WHEN COALESCE(p_lifetime_value, 0) >= 5000 THEN 'Regular'
+        ELSE 'New'
+    END;
+END$$
+DELIMITER ;
+
+-- Procedure 4: Refresh stored customer segment and last_order_date with set-based passes
+-- p_full = TRUE refreshes every customer; FALSE only customers the triggers
+-- marked stats_stale since the last run. total_orders, lifetime_value and
+-- avg_order_value belong to the triggers (and sp_reconcile_customer_aggregates):
+-- totals computed here by earlier statements could miss an order that commits
+-- meanwhile, so they are never written back. The segment is derived from the
+-- row's lifetime_value inside the final UPDATE, under its row lock.
 DELIMITER $$
-CREATE PROCEDURE sp_update_customer_segments()
+CREATE PROCEDURE sp_update_customer_segments(IN p_full BOOLEAN)
 BEGIN
+    DECLARE v_refreshed INT DEFAULT 0;
+    
+    DROP TEMPORARY TABLE IF EXISTS tmp_segment_customers;
+    CREATE TEMPORARY TABLE tmp_segment_customers (customer_id INT PRIMARY KEY);
+    IF p_full THEN
+        INSERT INTO tmp_segment_customers (customer_id) SELECT customer_id FROM customer;
+    ELSE
+        INSERT INTO tmp_segment_customers (customer_id) SELECT customer_id FROM customer WHERE stats_stale = TRUE;
+    END IF;
+    
+    -- Clear the flag before reading: a customer touched while this runs is marked
+    -- stale again by its trigger and picked up by the next run
     UPDATE customer c
-    SET segment = (
-        SELECT CASE 
-            WHEN COALESCE(SUM(o.total_amount), 0) >= 50000 THEN 'VIP'
-            WHEN COALESCE(SUM(o.total_amount), 0) >= 20000 THEN 'Premium'
-            WHEN COALESCE(SUM(o.total_amount), 0) >= 5000 THEN 'Regular'
-            ELSE 'New'
-        END
-        FROM orders o
-        WHERE o.customer_id = c.customer_id
+    JOIN tmp_segment_customers t ON t.customer_id = c.customer_id
+    SET c.stats_stale = FALSE;
+    
+    DROP TEMPORARY TABLE IF EXISTS tmp_segment_stats;
+    CREATE TEMPORARY TABLE tmp_segment_stats (
+        customer_id INT PRIMARY KEY,
+        last_order_date DATETIME NULL
     );
+    
+    -- One grouped pass driven by the selected customers, so an incremental run
+    -- reads only their orders through idx_orders_customer_date
+    INSERT INTO tmp_segment_stats (customer_id, last_order_date)
+    SELECT t.customer_id, MAX(o.order_date)
+    FROM tmp_segment_customers t
+    LEFT JOIN orders o ON o.customer_id = t.customer_id
+    GROUP BY t.customer_id;
+    
+    -- last_order_date only moves forward (the order triggers advance it with
+    -- GREATEST too), so an order committed after the pass above is never undone,
+    -- and customers whose orders were all archived keep the date they had
+    UPDATE customer c
+    JOIN tmp_segment_stats s ON s.customer_id = c.customer_id
+    SET c.last_order_date = CASE WHEN s.last_order_date IS NULL THEN c.last_order_date
+                                 ELSE GREATEST(COALESCE(c.last_order_date, s.last_order_date), s.last_order_date) END,
+        c.segment = fn_customer_segment(c.lifetime_value),
+        c.stats_refreshed_at = NOW();
+    
+    SELECT COUNT(*) INTO v_refreshed FROM tmp_segment_stats;
+    DROP TEMPORARY TABLE IF EXISTS tmp_segment_stats;
+    DROP TEMPORARY TABLE IF EXISTS tmp_segment_customers;
+    
+    SELECT v_refreshed as customers_refreshed, p_full as full_refresh;
+END$$
+DELIMITER ;
+
+-- Procedure 5: Verify (and optionally repair) incrementally maintained customer aggregates
+-- Ground truth: total_orders = COUNT(orders), avg_order_value = AVG(orders.total_amount),
+-- lifetime_value = SUM(orders.total_amount) - SUM(refund_amount of Approved/Refunded returns)
+DELIMITER $$
+CREATE PROCEDURE sp_reconcile_customer_aggregates(IN p_repair BOOLEAN)
+BEGIN
+    DECLARE v_drifted INT DEFAULT 0;
+    
+    DROP TEMPORARY TABLE IF EXISTS tmp_customer_truth;
+    CREATE TEMPORARY TABLE tmp_customer_truth (
+        customer_id INT PRIMARY KEY,
+        total_orders INT NOT NULL,
+        lifetime_value DECIMAL(12,2) NOT NULL,
+        avg_order_value DECIMAL(10,2) NOT NULL
+    );
+    
+    -- One grouped pass over orders and one over returns, joined to every customer
+    INSERT INTO tmp_customer_truth (customer_id, total_orders, lifetime_value, avg_order_value)
+    SELECT c.customer_id,
+           COALESCE(o.order_count, 0),
+           COALESCE(o.gross, 0) - COALESCE(r.refunded, 0),
+           CASE WHEN COALESCE(o.order_count, 0) > 0 THEN ROUND(o.gross / o.order_count, 2) ELSE 0 END
+    FROM customer c
+    LEFT JOIN (
+        -- Live orders plus the totals of orders archived out of the orders table
+        SELECT customer_id, SUM(order_count) as order_count, SUM(gross) as gross
+        FROM (
+            SELECT customer_id, COUNT(*) as order_count, COALESCE(SUM(total_amount), 0) as gross
+            FROM orders
+            GROUP BY customer_id
+            UNION ALL
+            SELECT customer_id, archived_orders, archived_gross
+            FROM customer_archived_totals
+        ) live_and_archived
+        GROUP BY customer_id
+    ) o ON o.customer_id = c.customer_id
+    LEFT JOIN (
+        SELECT customer_id, COALESCE(SUM(refund_amount), 0) as refunded
+        FROM returns_refunds
+        WHERE status IN ('Approved', 'Refunded')
+        GROUP BY customer_id
+    ) r ON r.customer_id = c.customer_id;
+    
+    SELECT COUNT(*) INTO v_drifted
+    FROM customer c
+    JOIN tmp_customer_truth t ON t.customer_id = c.customer_id
+    WHERE NOT (c.total_orders <=> t.total_orders)
+       OR NOT (c.lifetime_value <=> t.lifetime_value)
+       OR NOT (c.avg_order_value <=> t.avg_order_value);
+    
+    IF p_repair AND v_drifted > 0 THEN
+        UPDATE customer c
+        JOIN tmp_customer_truth t ON t.customer_id = c.customer_id
+        SET c.total_orders = t.total_orders,
+            c.lifetime_value = t.lifetime_value,
+            c.avg_order_value = t.avg_order_value,
+            c.stats_stale = TRUE  -- segment follows on the next refresh
+        WHERE NOT (c.total_orders <=> t.total_orders)
+           OR NOT (c.lifetime_value <=> t.lifetime_value)
+           OR NOT (c.avg_order_value <=> t.avg_order_value);
+        
+        INSERT INTO activity_log (user_type, user_id, action, details, created_at)
+        VALUES ('system', NULL, 'customer_aggregates_repaired', 
+                CONCAT(v_drifted, ' customer aggregate rows repaired'), NOW());
+    END IF;
+    
+    DROP TEMPORARY TABLE IF EXISTS tmp_customer_truth;
+    
+    SELECT v_drifted as drifted_customers, p_repair as repaired;
+END$$
+DELIMITER ;
+
+-- Procedure 6: Apply a delta to the day and month sales rollups (called from triggers)
+DELIMITER $$
+CREATE PROCEDURE sp_apply_sales_delta(
+    IN p_order_date DATETIME,
+    IN p_orders INT,
+    IN p_revenue DECIMAL(14,2),
+    IN p_refunded DECIMAL(14,2)
+)
+BEGIN
+    IF p_order_date IS NOT NULL THEN
+        INSERT INTO sales_daily_rollup (sale_date, order_count, gross_revenue, refunded_amount)
+        VALUES (DATE(p_order_date), p_orders, p_revenue, p_refunded)
+        ON DUPLICATE KEY UPDATE 
+            order_count = order_count + VALUES(order_count),
+            gross_revenue = gross_revenue + VALUES(gross_revenue),
+            refunded_amount = refunded_amount + VALUES(refunded_amount);
+        
+        INSERT INTO sales_monthly_rollup (sale_month, order_count, gross_revenue, refunded_amount)
+        VALUES (DATE_FORMAT(p_order_date, '%Y-%m-01'), p_orders, p_revenue, p_refunded)
+        ON DUPLICATE KEY UPDATE 
+            order_count = order_count + VALUES(order_count),
+            gross_revenue = gross_revenue + VALUES(gross_revenue),
+            refunded_amount = refunded_amount + VALUES(refunded_amount);
+    END IF;
+END$$
+DELIMITER ;
+
+-- Procedure 7: Rebuild the sales rollups from orders/returns (backfill or repair)
+-- Pass NULL dates to rebuild everything, or a range to rebuild just those days
+-- (whole months are rebuilt for the monthly table)
+DELIMITER $$
+CREATE PROCEDURE sp_rebuild_sales_rollups(IN p_from DATE, IN p_to DATE)
+BEGIN
+    DECLARE v_from DATE;
+    DECLARE v_to DATE;
+    DECLARE v_archived_until DATE;
+    
+    SET v_from = COALESCE(p_from, (SELECT DATE(MIN(order_date)) FROM orders), CURDATE());
+    SET v_to = COALESCE(p_to, (SELECT DATE(MAX(order_date)) FROM orders), CURDATE());
+    SET v_from = DATE_FORMAT(v_from, '%Y-%m-01');
+    SET v_to = LAST_DAY(v_to);
+    
+    -- Months whose orders were archived out of the orders table keep their rollup rows
+    SELECT MAX(range_end) INTO v_archived_until FROM partition_archives WHERE table_name = 'orders';
+    IF v_archived_until IS NOT NULL AND v_from < v_archived_until THEN
+        SET v_from = v_archived_until;
+    END IF;
+    
+    DELETE FROM sales_daily_rollup WHERE sale_date >= v_from AND sale_date <= v_to;
+    DELETE FROM sales_monthly_rollup WHERE sale_month >= v_from AND sale_month <= v_to;
+    
+    -- Range predicates on order_date keep idx_orders_date usable
+    INSERT INTO sales_daily_rollup (sale_date, order_count, gross_revenue, refunded_amount)
+    SELECT d.sale_date, d.order_count, d.gross_revenue, COALESCE(r.refunded_amount, 0)
+    FROM (
+        SELECT DATE(order_date) as sale_date, COUNT(*) as order_count, COALESCE(SUM(total_amount), 0) as gross_revenue
+        FROM orders
+        WHERE order_date >= v_from AND order_date < v_to + INTERVAL 1 DAY
+        GROUP BY DATE(order_date)
+    ) d
+    LEFT JOIN (
+        SELECT DATE(o.order_date) as sale_date, SUM(rr.refund_amount) as refunded_amount
+        FROM returns_refunds rr
+        JOIN orders o ON o.order_id = rr.order_id
+        WHERE rr.status IN ('Approved', 'Refunded')
+          AND o.order_date >= v_from AND o.order_date < v_to + INTERVAL 1 DAY
+        GROUP BY DATE(o.order_date)
+    ) r ON r.sale_date = d.sale_date;
+    
+    INSERT INTO sales_monthly_rollup (sale_month, order_count, gross_revenue, refunded_amount)
+    SELECT DATE_FORMAT(sale_date, '%Y-%m-01'), SUM(order_count), SUM(gross_revenue), SUM(refunded_amount)
+    FROM sales_daily_rollup
+    WHERE sale_date >= v_from AND sale_date <= v_to
+    GROUP BY DATE_FORMAT(sale_date, '%Y-%m-01');
+    
+    SELECT v_from as rebuilt_from, v_to as rebuilt_to,
+           (SELECT COUNT(*) FROM sales_daily_rollup WHERE sale_date >= v_from AND sale_date <= v_to) as days,
+           (SELECT COUNT(*) FROM sales_monthly_rollup WHERE sale_month >= v_from AND sale_month <= v_to) as months;
+END$$
+DELIMITER ;
+
+-- One-time backfill of the rollups from existing orders
+CALL sp_rebuild_sales_rollups(NULL, NULL);
+
+-- One-time backfill of the stored customer stats, then segments from them
+CALL sp_reconcile_customer_aggregates(TRUE);
+CALL sp_update_customer_segments(TRUE);
+
+-- Exclusive upper bound of a monthly RANGE partition as a DATE
+-- (partitions are defined on TO_DAYS(col), or UNIX_TIMESTAMP(col) for TIMESTAMP columns)
+DELIMITER $$
+CREATE FUNCTION fn_partition_range_end(p_expression VARCHAR(255), p_description VARCHAR(255))
+RETURNS DATE
+DETERMINISTIC NO SQL
+BEGIN
+    IF p_description IS NULL OR p_description = 'MAXVALUE' THEN
+        RETURN NULL;
+    END IF;
+    IF LOWER(p_expression) LIKE 'unix_timestamp%' THEN
+        RETURN DATE(FROM_UNIXTIME(p_description));
+    END IF;
+    RETURN FROM_DAYS(p_description);
+END$$
+DELIMITER ;
+
+-- Run one DDL statement built at runtime
+DELIMITER $$
+CREATE PROCEDURE sp_exec_ddl(IN p_sql TEXT)
+BEGIN
+    SET @ddl = p_sql;
+    PREPARE ddl_stmt FROM @ddl;
+    EXECUTE ddl_stmt;
+    DEALLOCATE PREPARE ddl_stmt;
+END$$
+DELIMITER ;
+
+-- Procedure 8: Add monthly partitions up to p_months_ahead months after the current one
+-- by splitting the empty catch-all pmax partition (metadata only while pmax is empty)
+DELIMITER $$
+CREATE PROCEDURE sp_add_future_partitions(IN p_table VARCHAR(64), IN p_months_ahead INT)
+BEGIN
+    DECLARE v_func VARCHAR(20);
+    DECLARE v_next DATE;
+    DECLARE v_until DATE;
+    DECLARE v_parts TEXT DEFAULT '';
+    DECLARE v_added INT DEFAULT 0;
+
+    SELECT IF(LOWER(MAX(PARTITION_EXPRESSION)) LIKE 'unix_timestamp%', 'UNIX_TIMESTAMP', 'TO_DAYS'),
+           MAX(fn_partition_range_end(PARTITION_EXPRESSION, PARTITION_DESCRIPTION))
+    INTO v_func, v_next
+    FROM information_schema.PARTITIONS
+    WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = p_table AND PARTITION_NAME IS NOT NULL;
+
+    IF v_next IS NULL THEN
+        SIGNAL SQLSTATE '45000' SET MESSAGE_TEXT = 'Table is not partitioned by month';
+    END IF;
+
+    SET v_until = DATE_FORMAT(CURDATE(), '%Y-%m-01') + INTERVAL (p_months_ahead + 1) MONTH;
+    WHILE v_next < v_until DO
+        SET v_parts = CONCAT(v_parts, 'PARTITION p', DATE_FORMAT(v_next, '%Y%m'),
+                             ' VALUES LESS THAN (', v_func, '(''', v_next + INTERVAL 1 MONTH, ''')), ');
+        SET v_next = v_next + INTERVAL 1 MONTH;
+        SET v_added = v_added + 1;
+    END WHILE;
+
+    IF v_added > 0 THEN
+        CALL sp_exec_ddl(CONCAT('ALTER TABLE `', p_table, '` REORGANIZE PARTITION pmax INTO (',
+                                v_parts, 'PARTITION pmax VALUES LESS THAN MAXVALUE)'));
+    END IF;
+
+    SELECT p_table as table_name, v_added as partitions_added;
+END$$
+DELIMITER ;
+
+-- Procedure 9: Convert a table to monthly RANGE partitions on a date column
+-- InnoDB partitioned tables cannot have foreign keys (either direction) and every
+-- unique key must contain the partitioning column, so this drops the foreign keys
+-- on and to the table and widens the primary key to (id, p_column).
+-- Rows older than p_months_back months land in pold; pmax catches anything past
+-- the last month. Safe to re-run: an already partitioned table only gets new months.
+DELIMITER $$
+CREATE PROCEDURE sp_partition_table_by_month(
+    IN p_table VARCHAR(64),
+    IN p_column VARCHAR(64),
+    IN p_months_back INT,
+    IN p_months_ahead INT
+)
+BEGIN
+    DECLARE v_type VARCHAR(64);
+    DECLARE v_func VARCHAR(20);
+    DECLARE v_pk TEXT;
+    DECLARE v_pk_has_column INT;
+    DECLARE v_month DATE;
+    DECLARE v_until DATE;
+    DECLARE v_parts TEXT;
+    DECLARE v_stmt TEXT;
+
+    IF EXISTS (SELECT 1 FROM information_schema.PARTITIONS
+               WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = p_table AND PARTITION_NAME IS NOT NULL) THEN
+        CALL sp_add_future_partitions(p_table, p_months_ahead);
+    ELSE
+        SELECT MAX(DATA_TYPE) INTO v_type
+        FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = p_table AND COLUMN_NAME = p_column;
+
+        IF v_type IS NULL THEN
+            SIGNAL SQLSTATE '45000' SET MESSAGE_TEXT = 'Unknown table or partitioning column';
+        END IF;
+        SET v_func = IF(v_type = 'timestamp', 'UNIX_TIMESTAMP', 'TO_DAYS');
+
+        -- Foreign keys on the table and from other tables into it
+        DROP TEMPORARY TABLE IF EXISTS tmp_partition_ddl;
+        CREATE TEMPORARY TABLE tmp_partition_ddl (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            stmt TEXT NOT NULL
+        );
+        INSERT INTO tmp_partition_ddl (stmt)
+        SELECT CONCAT('ALTER TABLE `', TABLE_NAME, '` DROP FOREIGN KEY `', CONSTRAINT_NAME, '`')
+        FROM information_schema.REFERENTIAL_CONSTRAINTS
+        WHERE CONSTRAINT_SCHEMA = DATABASE()
+          AND (TABLE_NAME = p_table OR REFERENCED_TABLE_NAME = p_table);
+
+        -- Primary key must include the partitioning column
+        SELECT GROUP_CONCAT(CONCAT('`', COLUMN_NAME, '`') ORDER BY ORDINAL_POSITION),
+               SUM(COLUMN_NAME = p_column)
+        INTO v_pk, v_pk_has_column
+        FROM information_schema.KEY_COLUMN_USAGE
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = p_table AND CONSTRAINT_NAME = 'PRIMARY';
+        IF v_pk IS NOT NULL AND v_pk_has_column = 0 THEN
+            INSERT INTO tmp_partition_ddl (stmt)
+            VALUES (CONCAT('ALTER TABLE `', p_table, '` DROP PRIMARY KEY, ADD PRIMARY KEY (',
+                           v_pk, ', `', p_column, '`)'));
+        END IF;
+
+        SET v_month = DATE_FORMAT(CURDATE(), '%Y-%m-01') - INTERVAL p_months_back MONTH;
+        SET v_until = DATE_FORMAT(CURDATE(), '%Y-%m-01') + INTERVAL (p_months_ahead + 1) MONTH;
+        SET v_parts = CONCAT('PARTITION pold VALUES LESS THAN (', v_func, '(''', v_month, '''))');
+        WHILE v_month < v_until DO
+            SET v_parts = CONCAT(v_parts, ', PARTITION p', DATE_FORMAT(v_month, '%Y%m'),
+                                 ' VALUES LESS THAN (', v_func, '(''', v_month + INTERVAL 1 MONTH, '''))');
+            SET v_month = v_month + INTERVAL 1 MONTH;
+        END WHILE;
+        INSERT INTO tmp_partition_ddl (stmt)
+        VALUES (CONCAT('ALTER TABLE `', p_table, '` PARTITION BY RANGE (', v_func, '(`', p_column, '`)) (',
+                       v_parts, ', PARTITION pmax VALUES LESS THAN MAXVALUE)'));
+
+        WHILE EXISTS (SELECT 1 FROM tmp_partition_ddl) DO
+            SELECT stmt INTO v_stmt FROM tmp_partition_ddl ORDER BY id LIMIT 1;
+            CALL sp_exec_ddl(v_stmt);
+            DELETE FROM tmp_partition_ddl ORDER BY id LIMIT 1;
+        END WHILE;
+        DROP TEMPORARY TABLE IF EXISTS tmp_partition_ddl;
+
+        SELECT p_table as table_name,
+               (SELECT COUNT(*) FROM information_schema.PARTITIONS
+                WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = p_table) as partitions;
+    END IF;
+END$$
+DELIMITER ;
+
+-- Procedure 10: Move monthly partitions older than p_keep_months out of a table
+-- Each partition is swapped into an empty <table>_archive_<yyyymm> table with
+-- EXCHANGE PARTITION (no rows are copied) and the archive is then compressed,
+-- or with p_drop the partition is simply dropped. Neither fires row triggers,
+-- so sales rollups and customer aggregates keep counting the moved orders;
+-- orders' per-customer totals go to customer_archived_totals for the reconciler.
+DELIMITER $$
+CREATE PROCEDURE sp_archive_partitions(
+    IN p_table VARCHAR(64),
+    IN p_keep_months INT,
+    IN p_drop BOOLEAN
+)
+BEGIN
+    DECLARE v_cutoff DATE;
+    DECLARE v_partition VARCHAR(64);
+    DECLARE v_range_end DATE;
+    DECLARE v_archive VARCHAR(64);
+    DECLARE v_moved INT DEFAULT 0;
+
+    SET v_cutoff = DATE_FORMAT(CURDATE(), '%Y-%m-01') - INTERVAL p_keep_months MONTH;
+
+    DROP TEMPORARY TABLE IF EXISTS tmp_old_partitions;
+    CREATE TEMPORARY TABLE tmp_old_partitions (
+        partition_name VARCHAR(64) PRIMARY KEY,
+        range_end DATE NOT NULL
+    );
+    INSERT INTO tmp_old_partitions (partition_name, range_end)
+    SELECT PARTITION_NAME, fn_partition_range_end(PARTITION_EXPRESSION, PARTITION_DESCRIPTION)
+    FROM information_schema.PARTITIONS
+    WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = p_table
+      AND PARTITION_NAME IS NOT NULL
+      AND fn_partition_range_end(PARTITION_EXPRESSION, PARTITION_DESCRIPTION) <= v_cutoff;
+
+    WHILE EXISTS (SELECT 1 FROM tmp_old_partitions) DO
+        SELECT partition_name, range_end INTO v_partition, v_range_end
+        FROM tmp_old_partitions ORDER BY range_end LIMIT 1;
+
+        CALL sp_exec_ddl(CONCAT('SELECT COUNT(*) INTO @partition_rows FROM `', p_table,
+                                '` PARTITION (`', v_partition, '`)'));
+
+        IF p_table = 'orders' THEN
+            CALL sp_exec_ddl(CONCAT(
+                'INSERT INTO customer_archived_totals (customer_id, archived_orders, archived_gross) ',
+                'SELECT customer_id, COUNT(*), COALESCE(SUM(total_amount), 0) FROM orders PARTITION (`', v_partition, '`) ',
+                'WHERE customer_id IS NOT NULL GROUP BY customer_id ',
+                'ON DUPLICATE KEY UPDATE archived_orders = archived_orders + VALUES(archived_orders), ',
+                'archived_gross = archived_gross + VALUES(archived_gross)'));
+        END IF;
+
+        IF p_drop THEN
+            SET v_archive = NULL;
+        ELSE
+            SET v_archive = CONCAT(p_table, '_archive_', SUBSTRING(v_partition, 2));
+            CALL sp_exec_ddl(CONCAT('CREATE TABLE `', v_archive, '` LIKE `', p_table, '`'));
+            CALL sp_exec_ddl(CONCAT('ALTER TABLE `', v_archive, '` REMOVE PARTITIONING'));
+            CALL sp_exec_ddl(CONCAT('ALTER TABLE `', p_table, '` EXCHANGE PARTITION `', v_partition,
+                                    '` WITH TABLE `', v_archive, '`'));
+        END IF;
+        CALL sp_exec_ddl(CONCAT('ALTER TABLE `', p_table, '` DROP PARTITION `', v_partition, '`'));
+        IF v_archive IS NOT NULL THEN
+            -- Row format has to match for the exchange, so compress afterwards
+            CALL sp_exec_ddl(CONCAT('ALTER TABLE `', v_archive, '` ROW_FORMAT=COMPRESSED'));
+        END IF;
+
+        INSERT INTO partition_archives (table_name, partition_name, archive_table, range_end, row_count, action, archived_at)
+        VALUES (p_table, v_partition, v_archive, v_range_end, @partition_rows,
+                IF(p_drop, 'dropped', 'archived'), NOW());
+
+        DELETE FROM tmp_old_partitions WHERE partition_name = v_partition;
+        SET v_moved = v_moved + 1;
+    END WHILE;
+
+    DROP TEMPORARY TABLE IF EXISTS tmp_old_partitions;
+
+    SELECT p_table as table_name, v_cutoff as cutoff, v_moved as partitions_moved;
 END$$
 DELIMITER ;
 
@@ -293,6 +949,7 @@ LEFT JOIN orders o ON o.product_id = p.product_id
 GROUP BY p.product_id, p.name, p.category, p.price, p.quantityavailable;
 
 -- View 3: Customer summary with orders
+-- Reads the stored stats columns instead of grouping all orders
 CREATE OR REPLACE VIEW v_customer_summary AS
 SELECT 
     c.customer_id,
@@ -300,29 +957,25 @@ SELECT
     c.email,
     c.phone,
     c.blocked,
-    COUNT(DISTINCT o.order_id) as total_orders,
-    COALESCE(SUM(o.total_amount), 0) as lifetime_value,
-    COALESCE(AVG(o.total_amount), 0) as avg_order_value,
-    MAX(o.order_date) as last_order_date,
-    CASE 
-        WHEN COALESCE(SUM(o.total_amount), 0) >= 50000 THEN 'VIP'
-        WHEN COALESCE(SUM(o.total_amount), 0) >= 20000 THEN 'Premium'
-        WHEN COALESCE(SUM(o.total_amount), 0) >= 5000 THEN 'Regular'
-        ELSE 'New'
-    END as segment
-FROM customer c
-LEFT JOIN orders o ON o.customer_id = c.customer_id
-GROUP BY c.customer_id, c.name, c.email, c.phone, c.blocked;
+    COALESCE(c.total_orders, 0) as total_orders,
+    COALESCE(c.lifetime_value, 0) as lifetime_value,
+    COALESCE(c.avg_order_value, 0) as avg_order_value,
+    c.last_order_date,
+    COALESCE(c.segment, 'New') as segment
+FROM customer c;
 
 -- View 4: Daily sales summary
+-- Reads the incrementally maintained rollup instead of grouping raw orders
 CREATE OR REPLACE VIEW v_daily_sales AS
 SELECT 
-    DATE(order_date) as sale_date,
-    COUNT(*) as order_count,
-    COALESCE(SUM(total_amount), 0) as total_revenue,
-    COALESCE(AVG(total_amount), 0) as avg_order_value
-FROM orders
-GROUP BY DATE(order_date);
+    sale_date,
+    order_count,
+    gross_revenue as total_revenue,
+    CASE WHEN order_count > 0 THEN gross_revenue / order_count ELSE 0 END as avg_order_value,
+    refunded_amount,
+    gross_revenue - refunded_amount as net_revenue
+FROM sales_daily_rollup
+WHERE order_count > 0;
 
 -- ============================================
 -- 4. INDEXES (for performance optimization)
@@ -335,15 +988,26 @@ CREATE INDEX idx_orders_date ON orders(order_date);
 CREATE INDEX idx_orders_status ON orders(status);
 CREATE INDEX idx_orders_shipping_status ON orders(shipping_status);
 CREATE INDEX idx_orders_date_status ON orders(order_date, status);
+-- Keyset pagination of the orders feed: (order_date, order_id) newest first,
+-- optionally narrowed by status or customer
+CREATE INDEX idx_orders_status_date ON orders(status, order_date, order_id);
+CREATE INDEX idx_orders_customer_date ON orders(customer_id, order_date, order_id);
 
 -- Indexes on product table
 CREATE INDEX idx_product_category ON product(category);
 CREATE INDEX idx_product_seller ON product(seller_id);
 CREATE INDEX idx_product_stock ON product(quantityavailable);
+-- Relevance-ranked product search (MATCH ... AGAINST in BOOLEAN MODE)
+CREATE FULLTEXT INDEX ft_product_search ON product(name, description, category);
 
 -- Indexes on customer table
 CREATE INDEX idx_customer_email ON customer(email);
 CREATE INDEX idx_customer_blocked ON customer(blocked);
+-- Segment breakdown (covering) and lifetime-value rankings off the stored stats
+CREATE INDEX idx_customer_segment ON customer(segment, lifetime_value, total_orders);
+CREATE INDEX idx_customer_lifetime ON customer(lifetime_value);
+-- Incremental segment refresh finds touched customers
+CREATE INDEX idx_customer_stats_stale ON customer(stats_stale);
 
 -- Indexes on returns_refunds table
 CREATE INDEX idx_returns_order_id ON returns_refunds(order_id);
@@ -368,6 +1032,7 @@ CREATE INDEX idx_activity_created ON activity_log(created_at);
 
 -- Add segment column to customer (if not exists)
 -- ALTER TABLE customer ADD COLUMN segment VARCHAR(20) DEFAULT 'New';
+-- (last_order_date, stats_stale and stats_refreshed_at are added in section 1)
 
 -- Add total_orders and avg_order_value to customer (if not exists)
 -- ALTER TABLE customer ADD COLUMN total_orders INT DEFAULT 0;
@@ -377,8 +1042,8 @@ CREATE INDEX idx_activity_created ON activity_log(created_at);
 -- 6. USEFUL QUERIES TO RUN PERIODICALLY
 -- ============================================
 
--- Update all customer segments (run daily via cron or scheduled event)
--- CALL sp_update_customer_segments();
+-- Recompute segments for every customer (the event only refreshes touched ones)
+-- CALL sp_update_customer_segments(TRUE);
 
 -- Clean old notifications (older than 30 days)
 -- DELETE FROM notifications WHERE created_at < DATE_SUB(NOW(), INTERVAL 30 DAY) AND is_read = TRUE;
@@ -396,29 +1061,222 @@ CREATE INDEX idx_activity_created ON activity_log(created_at);
 -- Enable event scheduler
 SET GLOBAL event_scheduler = ON;
 
--- Event 1: Update customer segments daily
+-- Event 1: Refresh segments of customers touched since the last run
 CREATE EVENT evt_update_customer_segments
-ON SCHEDULE EVERY 1 DAY
-STARTS CURRENT_DATE + INTERVAL 1 DAY
+ON SCHEDULE EVERY 10 MINUTE
+STARTS CURRENT_TIMESTAMP + INTERVAL 10 MINUTE
 DO
-  CALL sp_update_customer_segments();
+  CALL sp_update_customer_segments(FALSE);
 
--- Event 2: Clean old notifications weekly
-CREATE EVENT evt_clean_old_notifications
-ON SCHEDULE EVERY 1 WEEK
-STARTS CURRENT_DATE + INTERVAL 1 WEEK
+-- Old notifications, activity logs and statistics samples are purged by the
+-- application's retention worker in small, checkpointed chunks (see
+-- retention_checkpoints); the single-statement DELETE events are retired
+DROP EVENT IF EXISTS evt_clean_old_notifications;
+DROP EVENT IF EXISTS evt_clean_old_activity_logs;
+
+-- Event 2: Verify and repair incrementally maintained customer aggregates nightly
+CREATE EVENT evt_reconcile_customer_aggregates
+ON SCHEDULE EVERY 1 DAY
+STARTS CURRENT_DATE + INTERVAL 1 DAY + INTERVAL 3 HOUR
 DO
-  DELETE FROM notifications 
-  WHERE created_at < DATE_SUB(NOW(), INTERVAL 30 DAY) 
-  AND is_read = TRUE;
-
--- Event 3: Clean old activity logs monthly
-CREATE EVENT evt_clean_old_activity_logs
-ON SCHEDULE EVERY 1 MONTH
-STARTS DATE_FORMAT(NOW() + INTERVAL 1 MONTH, '%Y-%m-01')
+  CALL sp_reconcile_customer_aggregates(TRUE);
+
+-- Event 3: Keep three months of empty partitions ahead of orders and activity_log
+DELIMITER $$
+CREATE EVENT evt_add_future_partitions
+ON SCHEDULE EVERY 1 DAY
+STARTS CURRENT_DATE + INTERVAL 1 DAY + INTERVAL 2 HOUR
 DO
-  DELETE FROM activity_log 
-  WHERE created_at < DATE_SUB(NOW(), INTERVAL 90 DAY);
+BEGIN
+    CALL sp_add_future_partitions('orders', 3);
+    CALL sp_add_future_partitions('activity_log', 3);
+END$$
+DELIMITER ;
+
+-- ============================================
+-- 8. PARTITIONING & ARCHIVAL
+-- ============================================
+
+-- Monthly RANGE partitions on the date columns: date-bounded queries that filter
+-- the bare column (col >= start AND col < end) only touch the matching months,
+-- and old months leave the table with a partition drop or exchange instead of
+-- row-by-row deletes.
+-- Converting drops the foreign keys on orders and activity_log and any that
+-- point at orders (orders -> customer/product, payments/returns_refunds -> orders);
+-- the guard triggers below enforce the orders references in their place.
+CALL sp_partition_table_by_month('orders', 'order_date', 24, 3);
+CALL sp_partition_table_by_month('activity_log', 'created_at', 3, 3);
+
+-- Referential guards for the dropped foreign keys, so every writer (procedures,
+-- CSV import, ad-hoc INSERT/UPDATE/DELETE) is still checked. A violation raises
+-- the error the foreign key would have (SQLSTATE 23000, errno 1452 for a missing
+-- parent, 1451 for a referenced row); updates are only checked when the key
+-- column changes. Lookups into customer, product, payments and returns_refunds
+-- use their primary key or order_id index. Lookups into orders carry no
+-- order_date, so they cannot be pruned: `order_id = ?` probes the primary key
+-- (order_id, order_date) in every monthly partition (about 30), and the
+-- product_id/customer_id checks on delete do the same with their indexes.
+-- Orders moved to an archive table no longer count as references.
+DELIMITER $$
+CREATE TRIGGER trg_before_order_insert_refs
+BEFORE INSERT ON orders
+FOR EACH ROW
+BEGIN
+    IF NEW.customer_id IS NOT NULL
+       AND NOT EXISTS (SELECT 1 FROM customer WHERE customer_id = NEW.customer_id) THEN
+        SIGNAL SQLSTATE '23000' SET MYSQL_ERRNO = 1452,
+            MESSAGE_TEXT = 'Cannot add or update a child row: orders.customer_id has no matching customer';
+    END IF;
+    IF NEW.product_id IS NOT NULL
+       AND NOT EXISTS (SELECT 1 FROM product WHERE product_id = NEW.product_id) THEN
+        SIGNAL SQLSTATE '23000' SET MYSQL_ERRNO = 1452,
+            MESSAGE_TEXT = 'Cannot add or update a child row: orders.product_id has no matching product';
+    END IF;
+END$$
+DELIMITER ;
+
+DELIMITER $$
+CREATE TRIGGER trg_before_payment_insert_refs
+BEFORE INSERT ON payments
+FOR EACH ROW
+BEGIN
+    IF NEW.order_id IS NOT NULL
+       AND NOT EXISTS (SELECT 1 FROM orders WHERE order_id = NEW.order_id) THEN
+        SIGNAL SQLSTATE '23000' SET MYSQL_ERRNO = 1452,
+            MESSAGE_TEXT = 'Cannot add or update a child row: payments.order_id has no matching order';
+    END IF;
+END$$
+DELIMITER ;
+
+DELIMITER $$
+CREATE TRIGGER trg_before_return_insert_refs
+BEFORE INSERT ON returns_refunds
+FOR EACH ROW
+BEGIN
+    IF NEW.order_id IS NOT NULL
+       AND NOT EXISTS (SELECT 1 FROM orders WHERE order_id = NEW.order_id) THEN
+        SIGNAL SQLSTATE '23000' SET MYSQL_ERRNO = 1452,
+            MESSAGE_TEXT = 'Cannot add or update a child row: returns_refunds.order_id has no matching order';
+    END IF;
+END$$
+DELIMITER ;
+
+DELIMITER $$
+CREATE TRIGGER trg_before_product_delete_refs
+BEFORE DELETE ON product
+FOR EACH ROW
+BEGIN
+    IF EXISTS (SELECT 1 FROM orders WHERE product_id = OLD.product_id) THEN
+        SIGNAL SQLSTATE '23000' SET MYSQL_ERRNO = 1451,
+            MESSAGE_TEXT = 'Cannot delete or update a parent row: product is referenced by orders';
+    END IF;
+END$$
+DELIMITER ;
+
+DELIMITER $$
+CREATE TRIGGER trg_before_customer_delete_refs
+BEFORE DELETE ON customer
+FOR EACH ROW
+BEGIN
+    IF EXISTS (SELECT 1 FROM orders WHERE customer_id = OLD.customer_id) THEN
+        SIGNAL SQLSTATE '23000' SET MYSQL_ERRNO = 1451,
+            MESSAGE_TEXT = 'Cannot delete or update a parent row: customer is referenced by orders';
+    END IF;
+END$$
+DELIMITER ;
+
+DELIMITER $$
+CREATE TRIGGER trg_before_order_delete_refs
+BEFORE DELETE ON orders
+FOR EACH ROW
+BEGIN
+    IF EXISTS (SELECT 1 FROM payments WHERE order_id = OLD.order_id)
+       OR EXISTS (SELECT 1 FROM returns_refunds WHERE order_id = OLD.order_id) THEN
+        SIGNAL SQLSTATE '23000' SET MYSQL_ERRNO = 1451,
+            MESSAGE_TEXT = 'Cannot delete or update a parent row: order is referenced by payments or returns_refunds';
+    END IF;
+END$$
+DELIMITER ;
+
+DELIMITER $$
+CREATE TRIGGER trg_before_order_update_refs
+BEFORE UPDATE ON orders
+FOR EACH ROW
+BEGIN
+    IF NEW.customer_id IS NOT NULL AND NOT (NEW.customer_id <=> OLD.customer_id)
+       AND NOT EXISTS (SELECT 1 FROM customer WHERE customer_id = NEW.customer_id) THEN
+        SIGNAL SQLSTATE '23000' SET MYSQL_ERRNO = 1452,
+            MESSAGE_TEXT = 'Cannot add or update a child row: orders.customer_id has no matching customer';
+    END IF;
+    IF NEW.product_id IS NOT NULL AND NOT (NEW.product_id <=> OLD.product_id)
+       AND NOT EXISTS (SELECT 1 FROM product WHERE product_id = NEW.product_id) THEN
+        SIGNAL SQLSTATE '23000' SET MYSQL_ERRNO = 1452,
+            MESSAGE_TEXT = 'Cannot add or update a child row: orders.product_id has no matching product';
+    END IF;
+    IF NEW.order_id <> OLD.order_id
+       AND (EXISTS (SELECT 1 FROM payments WHERE order_id = OLD.order_id)
+            OR EXISTS (SELECT 1 FROM returns_refunds WHERE order_id = OLD.order_id)) THEN
+        SIGNAL SQLSTATE '23000' SET MYSQL_ERRNO = 1451,
+            MESSAGE_TEXT = 'Cannot delete or update a parent row: order is referenced by payments or returns_refunds';
+    END IF;
+END$$
+DELIMITER ;
+
+DELIMITER $$
+CREATE TRIGGER trg_before_payment_update_refs
+BEFORE UPDATE ON payments
+FOR EACH ROW
+BEGIN
+    IF NEW.order_id IS NOT NULL AND NOT (NEW.order_id <=> OLD.order_id)
+       AND NOT EXISTS (SELECT 1 FROM orders WHERE order_id = NEW.order_id) THEN
+        SIGNAL SQLSTATE '23000' SET MYSQL_ERRNO = 1452,
+            MESSAGE_TEXT = 'Cannot add or update a child row: payments.order_id has no matching order';
+    END IF;
+END$$
+DELIMITER ;
+
+DELIMITER $$
+CREATE TRIGGER trg_before_return_update_refs
+BEFORE UPDATE ON returns_refunds
+FOR EACH ROW
+BEGIN
+    IF NEW.order_id IS NOT NULL AND NOT (NEW.order_id <=> OLD.order_id)
+       AND NOT EXISTS (SELECT 1 FROM orders WHERE order_id = NEW.order_id) THEN
+        SIGNAL SQLSTATE '23000' SET MYSQL_ERRNO = 1452,
+            MESSAGE_TEXT = 'Cannot add or update a child row: returns_refunds.order_id has no matching order';
+    END IF;
+END$$
+DELIMITER ;
+
+DELIMITER $$
+CREATE TRIGGER trg_before_product_update_refs
+BEFORE UPDATE ON product
+FOR EACH ROW
+BEGIN
+    IF NEW.product_id <> OLD.product_id
+       AND EXISTS (SELECT 1 FROM orders WHERE product_id = OLD.product_id) THEN
+        SIGNAL SQLSTATE '23000' SET MYSQL_ERRNO = 1451,
+            MESSAGE_TEXT = 'Cannot delete or update a parent row: product is referenced by orders';
+    END IF;
+END$$
+DELIMITER ;
+
+DELIMITER $$
+CREATE TRIGGER trg_before_customer_update_refs
+BEFORE UPDATE ON customer
+FOR EACH ROW
+BEGIN
+    IF NEW.customer_id <> OLD.customer_id
+       AND EXISTS (SELECT 1 FROM orders WHERE customer_id = OLD.customer_id) THEN
+        SIGNAL SQLSTATE '23000' SET MYSQL_ERRNO = 1451,
+            MESSAGE_TEXT = 'Cannot delete or update a parent row: customer is referenced by orders';
+    END IF;
+END$$
+DELIMITER ;
+
+-- Orders are archived by hand (or from the admin panel), never automatically:
+-- CALL sp_archive_partitions('orders', 24, FALSE);   -- keep 24 months live, archive the rest
+-- SELECT * FROM partition_archives ORDER BY archived_at DESC;
 
 -- ============================================
 -- END OF DATABASE IMPROVEMENTS
@@ -33,30 +33,25 @@ def add_review(customer_id):
 
 def place_order(customer_id):
     product_id = int(input("Enter Product ID to buy: "))
-    quantity = int(input("Enter quantity: "))
-    # Get product price
-    cursor.execute("SELECT price, quantityavailable FROM product WHERE product_id=%s", (product_id,))
-    result = cursor.fetchone()
-    if not result:
-        print("Product not found!")
-        return
-    price, stock = result
-    if quantity > stock:
-        print(f"Only {stock} items available!")
+    # sp_process_order takes the stock, creates the order and records the payment
+    # in one transaction, so concurrent buyers can never oversell (one unit per order)
+    try:
+        cursor.callproc('sp_process_order', (customer_id, product_id, None))
+        order = None
+        for result in cursor.stored_results():
+            order = result.fetchone()
+    except mysql.connector.Error as e:
+        if e.sqlstate == '45001':
+            print("Sorry, this product is out of stock!")
+        elif e.sqlstate == '45002':
+            print("Product not found!")
+        elif e.sqlstate == '45003':
+            print("Customer not found!")
+        else:
+            print(f"Could not place order: {e}")
         return
-    total = price * quantity
-    # Insert into orders
-    cursor.execute("INSERT INTO orders (customer_id, order_date, total_amount, status) VALUES (%s, CURDATE(), %s, 'Pending')",
-                   (customer_id, total))
-    conn.commit()
-    order_id = cursor.lastrowid
-    # Insert into payments
-    cursor.execute("INSERT INTO payments (order_id, payment_date, payment_method, amount) VALUES (%s, CURDATE(), 'Credit Card', %s)",
-                   (order_id, total))
-    # Update product stock
-    cursor.execute("UPDATE product SET quantityavailable=quantityavailable-%s WHERE product_id=%s", (quantity, product_id))
-    conn.commit()
-    print(f"Order placed successfully! Order ID: {order_id}, Total: {total}")
+    order_id, total, stock = order
+    print(f"Order placed successfully! Order ID: {order_id}, Total: {total}, Items left: {stock}")
 
 def admin_dashboard():
     cursor.execute("SELECT COUNT(*) FROM product")